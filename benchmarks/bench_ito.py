@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmarks the ITO adapter against the BeautifulSoup/read_html implementation it replaced.
+
+Run from the repository root, either on a real export or on a synthetic one:
+    python benchmarks/bench_ito.py --xls data/ito/websites.xls
+    python benchmarks/bench_ito.py --rows 200000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from io import StringIO
+from os.path import dirname
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, dirname(dirname(__file__)))
+sys.path.insert(0, dirname(__file__))
+
+from fixtures import write_ito_export  # noqa: E402
+from lib.adapters import convert_xls_to_df  # noqa: E402
+
+
+def reference_convert_xls_to_df(xls_path: str):
+    with open(xls_path) as xml_file:
+        soup = BeautifulSoup(xml_file.read(), "html.parser")
+        ito_df = pd.read_html(StringIO(soup.decode_contents()))[0]
+    if "IP" in ito_df.columns:
+        ito_df = ito_df.rename(columns={"IP": "Network"})
+    elif "IPv4" in ito_df.columns:
+        ito_df = ito_df.rename(columns={"IPv4": "Network"})
+    ito_df = ito_df[["Network"]].assign(Tag="IR")
+
+    ipv4 = []
+    ipv6 = []
+    for _, row in ito_df.iterrows():
+        if ":" in row["Network"]:
+            ipv6.append(row)
+        elif "." in row["Network"]:
+            ipv4.append(row)
+    return (
+        pd.DataFrame(ipv4, columns=["Network", "Tag"]),
+        pd.DataFrame(ipv6, columns=["Network", "Tag"]),
+    )
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--xls", help="ITO export to benchmark on")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the synthetic export")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xls_path = args.xls
+        if xls_path is None:
+            xls_path = f"{tmp_dir}/ito.xls"
+            write_ito_export(xls_path, args.rows)
+
+        expected, reference_time = timed(reference_convert_xls_to_df, xls_path)
+        result, adapter_time = timed(convert_xls_to_df, xls_path)
+
+    for version, expected_df, result_df in zip((4, 6), expected, result):
+        assert expected_df.reset_index(drop=True).astype(str).equals(
+            result_df.astype(str)
+        ), f"IPv{version} CIDRs differ from the reference"
+    print(f"Rows: {len(result[0]) + len(result[1]):,}")
+    print(f"Reference: {reference_time:.2f}s")
+    print(f"Adapter:   {adapter_time:.2f}s ({reference_time / adapter_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+Benchmarks the CIDR utilities and the whole build on synthetic datasets against reference implementations.
+
+Every function is timed on inputs of each size and its result is compared with
+the baseline code it replaced in benchmarks/baseline.py, or with the ipaddress
+implementation in benchmarks/reference.py where the baseline has no
+counterpart, e.g. for aggregation and conflict resolution. The end-to-end build
+runs main() on a dataset written by benchmarks/fixtures.py. Run from the
+repository root:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes medium large --reference-max-rows 0
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from functools import partial
+from os.path import dirname
+
+import pandas as pd
+
+sys.path.insert(0, dirname(dirname(__file__)))
+sys.path.insert(0, dirname(__file__))
+
+import baseline  # noqa: E402
+import main as pipeline  # noqa: E402
+import reference  # noqa: E402
+from fixtures import SIZES, asn_blocks, cidr_frame, dbip_ranges, write_dataset  # noqa: E402
+from lib.cidr_utils import (  # noqa: E402
+    calculate_ip_stats,
+    cleanup_cidrs,
+    convert_iprange_to_cidr,
+    expand_cidr_range,
+)
+from lib.conflicts import resolve_conflicts  # noqa: E402
+from lib.geoipdat import geoip_entries  # noqa: E402
+from lib.geolite2 import join_asn_blocks  # noqa: E402
+from lib.networks import TaggedNetworks  # noqa: E402
+from lib.sources import (  # noqa: E402
+    load_source_registry,
+    load_widen_prefixes,
+    read_registry,
+    run_sources,
+)
+
+WIDEN_PREFIXES = {"ipv4": {"default": 24, "IR": 22}, "ipv6": {"default": 48}}
+PRIORITY = ["IR", "CN"]
+
+
+def timed(function, *args, repeat=1, **kwargs):
+    """Runs a function repeatedly without its output and returns its last result and best time"""
+    best = float("inf")
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def _sorted_frame(df: pd.DataFrame):
+    return (
+        df[["Network", "Tag"]]
+        .astype(str)
+        .sort_values(["Tag", "Network"])
+        .reset_index(drop=True)
+    )
+
+
+def same_frames(result: pd.DataFrame, expected: pd.DataFrame):
+    return _sorted_frame(result).equals(_sorted_frame(expected))
+
+
+def same_stats(result: list[dict], expected: list[dict]):
+    return sorted(result, key=lambda item: item["tag"]) == sorted(
+        expected, key=lambda item: item["tag"]
+    )
+
+
+def same_totals(result: list[dict], expected: list[dict]):
+    # The baseline counts no prefix lengths
+    totals = ("tag", "total_ipv4s", "total_ipv6s")
+    return same_stats(
+        [{key: item[key] for key in totals} for item in result],
+        [{key: item[key] for key in totals} for item in expected],
+    )
+
+
+def same_cleanup(result: pd.DataFrame, expected: pd.DataFrame):
+    # The baseline keeps the networks following a nested network, see baseline.py
+    return same_frames(result, reference.cleanup_cidrs(expected))
+
+
+def baseline_expand_per_tag(df: pd.DataFrame):
+    # The baseline drops networks sharing an address across tags, see baseline.py
+    return pd.concat(
+        [baseline.expand_cidr_range(tagged_df) for _, tagged_df in df.groupby("Tag")],
+        ignore_index=True,
+    )
+
+
+def same_asns(result: pd.DataFrame, expected: pd.DataFrame):
+    return all(
+        result[column].astype("string").fillna("").equals(
+            expected[column].astype("string").fillna("")
+        )
+        for column in ("ASN", "Organization")
+    )
+
+
+def encode_geoip_dat(df: pd.DataFrame, names=None):
+    return b"".join(geoip_entries(TaggedNetworks.from_frames([df]), names))
+
+
+def same_bytes(result: bytes, expected: bytes):
+    return result == expected
+
+
+def same_resolution(result: tuple, expected: pd.DataFrame):
+    # Carved ranges may be split into different CIDRs, the addresses of every tag must match
+    resolved, _ = result
+    return same_frames(
+        reference.cleanup_cidrs(resolved, aggregate=True),
+        reference.cleanup_cidrs(expected, aggregate=True),
+    ) and len(set(resolved["Network"])) == len(resolved)
+
+
+def function_cases(rows: int):
+    """
+    Builds the function benchmarks of a dataset size
+
+    Args:
+        rows (int): Number of input rows
+
+    Returns:
+        list[tuple]: Name, function, reference function, comparison and the
+        positional and keyword arguments of every benchmark
+    """
+    ipv4_ranges, ipv6_ranges = dbip_ranges(rows), dbip_ranges(rows // 4, ipv6=True)
+    ipv4_cidrs, ipv6_cidrs = cidr_frame(rows), cidr_frame(rows // 4, ipv6=True)
+    cidrs = pd.concat([ipv4_cidrs, ipv6_cidrs], ignore_index=True)
+    cleaned, _ = timed(cleanup_cidrs, cidrs)
+    return [
+        ("convert_iprange_to_cidr v4", convert_iprange_to_cidr, baseline.convert_iprange_to_cidr,
+         same_frames, (ipv4_ranges,), {}),
+        ("convert_iprange_to_cidr v6", convert_iprange_to_cidr, baseline.convert_iprange_to_cidr,
+         same_frames, (ipv6_ranges,), {"ipv6": True}),
+        ("expand_cidr_range v4", partial(expand_cidr_range, widen_to=24), baseline_expand_per_tag,
+         same_frames, (ipv4_cidrs,), {}),
+        ("cleanup_cidrs", cleanup_cidrs, baseline.cleanup_cidrs,
+         same_cleanup, (cidrs,), {}),
+        ("cleanup_cidrs widened", cleanup_cidrs, reference.cleanup_cidrs,
+         same_frames, (cidrs,), {"widen_prefixes": WIDEN_PREFIXES}),
+        ("cleanup_cidrs aggregate", cleanup_cidrs, reference.cleanup_cidrs,
+         same_frames, (cidrs,), {"aggregate": True, "widen_prefixes": WIDEN_PREFIXES}),
+        ("calculate_ip_stats", calculate_ip_stats, baseline.calculate_ip_stats,
+         same_totals, (cidrs,), {}),
+        ("join_asn_blocks v4", join_asn_blocks, reference.join_asn_blocks,
+         same_asns, (ipv4_cidrs["Network"], asn_blocks(rows // 2)), {}),
+        ("resolve_conflicts", resolve_conflicts, reference.resolve_conflicts,
+         same_resolution, (cleaned,), {"priority": PRIORITY}),
+        ("encode geoip.dat", encode_geoip_dat, reference.encode_geoip_dat,
+         same_bytes, (cleaned,), {"names": {"DE": "germany"}}),
+    ]
+
+
+def build_dataset(root: str, workers=None, **options):
+    """
+    Runs main() on the dataset in root, returns the merged CIDRs it built
+
+    Args:
+        root (str): Directory holding data/ and sources.toml
+        workers (int, optional): Number of worker processes. Defaults to None.
+
+    Returns:
+        pd.DataFrame: CIDRs of build/agg_cidrs.csv
+    """
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        pipeline.main(
+            no_cache=True, sources_path=f"{root}/sources.toml", workers=workers, **options
+        )
+    finally:
+        os.chdir(cwd)
+    return pd.read_csv(f"{root}/build/agg_cidrs.csv")
+
+
+def reference_build(root: str, workers=None):
+    """
+    Cleans up the CIDRs of all sources of the dataset in root with the reference implementation
+
+    Args:
+        root (str): Directory holding data/ and sources.toml
+        workers (int, optional): Number of worker processes. Defaults to None.
+
+    Returns:
+        pd.DataFrame: CIDRs the build is expected to produce
+    """
+    registry = read_registry(f"{root}/sources.toml")
+    sources = load_source_registry(registry)
+    tags = sorted({tag for source in sources for tag in source["tags"]})
+    loaded = run_sources(sources, f"{root}/data", tags, workers=workers)
+    cidrs = pd.concat([df for dfs in loaded.values() for df in dfs], ignore_index=True)
+    return reference.cleanup_cidrs(
+        cidrs.drop_duplicates(), widen_prefixes=load_widen_prefixes(registry)
+    )
+
+
+def print_row(name: str, rows: int, seconds: float, reference_seconds=None, correct=None):
+    reference_time = "-" if reference_seconds is None else f"{reference_seconds:.2f}s"
+    speedup = "-" if reference_seconds is None else f"{reference_seconds / seconds:.1f}x"
+    check = {None: "-", True: "ok", False: "MISMATCH"}[correct]
+    print(
+        f"{name:<28} {rows:>10,} {seconds:>8.2f}s {reference_time:>9} {speedup:>8} {check:>9}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=["small"], help="dataset sizes to run"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each benchmark, the best is reported")
+    parser.add_argument(
+        "--reference-max-rows",
+        type=int,
+        default=200_000,
+        help="only run the slow reference implementations on inputs up to this many rows",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="worker processes of main()")
+    parser.add_argument("--skip-main", action="store_true", help="skip the end-to-end build")
+    args = parser.parse_args()
+
+    mismatches = []
+    print(f"{'Benchmark':<28} {'Rows':>10} {'Time':>9} {'Reference':>9} {'Speedup':>8} {'Check':>9}")
+    for size in args.sizes:
+        rows = SIZES[size]
+        with_reference = rows <= args.reference_max_rows
+        for name, function, reference_function, compare, call_args, kwargs in function_cases(rows):
+            result, seconds = timed(function, *call_args, repeat=args.repeat, **kwargs)
+            reference_seconds = correct = None
+            if with_reference:
+                expected, reference_seconds = timed(reference_function, *call_args, **kwargs)
+                correct = compare(result, expected)
+                if not correct:
+                    mismatches.append(f"{name} ({size})")
+            print_row(name, len(call_args[0]), seconds, reference_seconds, correct)
+
+        if args.skip_main:
+            continue
+        with tempfile.TemporaryDirectory() as root:
+            write_dataset(root, rows)
+            built, seconds = timed(build_dataset, root, workers=args.workers)
+            streamed, streamed_seconds = timed(
+                build_dataset, root, workers=args.workers, chunksize=max(1, rows // 10)
+            )
+            correct = same_frames(streamed, built)
+            if with_reference:
+                correct = correct and same_frames(built, timed(reference_build, root, args.workers)[0])
+            if not correct:
+                mismatches.append(f"main ({size})")
+            print_row("main", rows, seconds, correct=correct)
+            print_row("main --chunksize", rows, streamed_seconds, correct=correct)
+
+    if mismatches:
+        sys.exit(f"\nResults differ from the reference: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
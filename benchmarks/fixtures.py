@@ -0,0 +1,300 @@
+"""
+Deterministic synthetic datasets shaped like the real inputs of main.py, so that
+the pipeline can be benchmarked without MaxMind license keys or network access.
+
+Every generator takes a seed and produces the same files for the same arguments.
+"""
+import ipaddress
+import random
+from os import makedirs
+
+import pandas as pd
+
+# Number of DBIP ranges of each dataset size, the other sources are scaled from it
+SIZES = {"small": 10_000, "medium": 100_000, "large": 1_000_000}
+
+TAGS = ["CN", "RU", "IR", "US", "DE"]
+COUNTRIES = {
+    "CN": ("China", 1814991),
+    "RU": ("Russia", 2017370),
+    "IR": ("Iran", 130758),
+    "US": ("United States", 6252001),
+    "DE": ("Germany", 2921044),
+}
+
+# Registry without remote sources, main() reads it from the dataset directory
+SOURCES_TOML = """\
+[widen.ipv4]
+default = 24
+
+[asn]
+path = "geolite2"
+
+[[sources]]
+name = "DBIP"
+type = "dbip"
+tags = ["CN", "RU", "IR"]
+path = "dbip/*.csv"
+
+[[sources]]
+name = "GeoLite2"
+type = "geolite2"
+path = "geolite2"
+
+[sources.countries]
+China = "CN"
+Russia = "RU"
+Iran = "IR"
+
+[[sources]]
+name = "IR hosting"
+type = "asn"
+tag = "IR"
+asns = [12880, 58224]
+path = "geolite2"
+
+[[sources]]
+name = "Community"
+type = "community"
+path = "community"
+
+[[sources]]
+name = "ITO"
+type = "ito"
+tag = "IR"
+path = "ito/*.xls"
+"""
+
+
+def dbip_ranges(rows: int, seed=0, ipv6=False):
+    """
+    Generates sorted, disjoint IP ranges of random countries like the ones of DBIP,
+    most of them not aligned to a CIDR boundary
+
+    Args:
+        rows (int): Number of ranges
+        seed (int, optional): Random seed. Defaults to 0.
+        ipv6 (bool, optional): Whether to generate IPv6 or IPv4 ranges. Defaults to False.
+
+    Returns:
+        pd.DataFrame: 'Range_Start', 'Range_End' and 'Tag' columns
+    """
+    rng = random.Random(seed)
+    if ipv6:
+        address, address_class = int(ipaddress.IPv6Address("2001::")), ipaddress.IPv6Address
+        sizes, gaps = [1, 1 << 16, (1 << 64) + 5, 1 << 64, 1 << 72, 1 << 80], [0, 0, 1 << 64]
+    else:
+        address, address_class = 1 << 24, ipaddress.IPv4Address
+        sizes, gaps = [1, 3, 12, 255, 256, 300, 1000, 4096, 65536], [0, 0, 0, 5, 256]
+    # Keep every range inside the address space whatever the number of rows
+    scale = max(1, rows * (max(sizes) + max(gaps)) // ((1 << (128 if ipv6 else 32)) - address))
+
+    ranges = []
+    for _ in range(rows):
+        size = rng.choice(sizes) // scale or 1
+        ranges.append(
+            (str(address_class(address)), str(address_class(address + size - 1)), rng.choice(TAGS))
+        )
+        address += size + rng.choice(gaps) // scale
+    return pd.DataFrame(ranges, columns=["Range_Start", "Range_End", "Tag"])
+
+
+def cidr_frame(rows: int, seed=0, ipv6=False, tags=TAGS):
+    """
+    Generates CIDRs of random prefix lengths and countries that overlap, nest and
+    repeat each other like the CIDRs collected from all sources before cleanup
+
+    Args:
+        rows (int): Number of CIDRs
+        seed (int, optional): Random seed. Defaults to 0.
+        ipv6 (bool, optional): Whether to generate IPv6 or IPv4 CIDRs. Defaults to False.
+        tags (list[str], optional): Tags to pick from. Defaults to TAGS.
+
+    Returns:
+        pd.DataFrame: 'Network' and 'Tag' columns
+    """
+    rng = random.Random(seed)
+    width = 128 if ipv6 else 32
+    prefixes = [20, 32, 40, 48, 56, 64, 128] if ipv6 else [8, 12, 16, 20, 22, 24, 24, 28, 32]
+    network_class = ipaddress.IPv6Network if ipv6 else ipaddress.IPv4Network
+    # Addresses are drawn from a quarter as many slots as rows so that they collide
+    span = max(1, rows // 4)
+    base = int(ipaddress.ip_address("2001::" if ipv6 else "1.0.0.0"))
+    step = (1 << (width - (3 if ipv6 else 1))) // span
+
+    networks = []
+    for _ in range(rows):
+        prefix = rng.choice(prefixes)
+        address = (base + rng.randrange(span) * step) >> (width - prefix) << (width - prefix)
+        networks.append((str(network_class((address, prefix))), rng.choice(tags)))
+    return pd.DataFrame(networks, columns=["Network", "Tag"])
+
+
+def write_dbip_csv(csv_path: str, rows: int, seed=0):
+    """
+    Writes a DBIP country CSV of IPv4 ranges followed by a quarter as many IPv6 ranges
+
+    Args:
+        csv_path (str): Path to write the CSV to
+        rows (int): Number of IPv4 ranges
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    ranges = pd.concat(
+        [dbip_ranges(rows, seed), dbip_ranges(rows // 4, seed, ipv6=True)], ignore_index=True
+    )
+    ranges.to_csv(csv_path, index=False, header=False)
+
+
+def write_geolite2_csvs(geolite2_dir: str, rows: int, seed=0):
+    """
+    Writes the GeoLite2 country locations and the IPv4 and IPv6 block CSVs,
+    including blocks without a country or only with a registered country
+
+    Args:
+        geolite2_dir (str): Directory to write the CSV files to
+        rows (int): Number of IPv4 blocks, a quarter as many IPv6 blocks are written
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    makedirs(geolite2_dir, exist_ok=True)
+    with open(f"{geolite2_dir}/GeoLite2-Country-Locations-en.csv", "w") as f:
+        f.write(
+            "geoname_id,locale_code,continent_code,continent_name,"
+            "country_iso_code,country_name,is_in_european_union\n"
+        )
+        for tag, (name, geoname_id) in COUNTRIES.items():
+            f.write(f'{geoname_id},en,AS,Asia,{tag},"{name}",0\n')
+
+    for version, block_rows in ((4, rows), (6, rows // 4)):
+        width = 32 if version == 4 else 128
+        prefixes = [16, 20, 22, 24, 24, 24, 28, 32] if version == 4 else [32, 40, 48, 64]
+        address = int(ipaddress.ip_address("1.0.0.0" if version == 4 else "2001::"))
+        with open(f"{geolite2_dir}/GeoLite2-Country-Blocks-IPv{version}.csv", "w") as f:
+            f.write(
+                "network,geoname_id,registered_country_geoname_id,represented_country_geoname_id,"
+                "is_anonymous_proxy,is_satellite_provider,is_anycast\n"
+            )
+            for _ in range(block_rows):
+                prefix = rng.choice(prefixes)
+                size = 1 << (width - prefix)
+                address = -(-address // size) * size
+                if address + size > 1 << width:
+                    break
+                geoname_id = COUNTRIES[rng.choice(TAGS)][1]
+                registered_id = geoname_id if rng.random() < 0.9 else ""
+                if rng.random() < 0.03:
+                    geoname_id = ""
+                network = ipaddress.ip_network((address, prefix))
+                f.write(f"{network},{geoname_id},{registered_id},,0,0,\n")
+                address += size * rng.choice([1, 1, 2, 50])
+
+
+def asn_blocks(rows: int, seed=0, ipv6=False):
+    """
+    Generates disjoint, sorted blocks of random autonomous systems like the ones
+    of the GeoLite2 ASN CSVs, with commas in the organization names
+
+    Args:
+        rows (int): Number of blocks
+        seed (int, optional): Random seed. Defaults to 0.
+        ipv6 (bool, optional): Whether to generate IPv6 or IPv4 blocks. Defaults to False.
+
+    Returns:
+        pd.DataFrame: 'network', 'autonomous_system_number' and 'autonomous_system_organization' columns
+    """
+    rng = random.Random(seed)
+    asns = [12880, 58224, 13335, 4134, 8359] + [rng.randrange(1, 400_000) for _ in range(200)]
+    width = 128 if ipv6 else 32
+    prefixes = [29, 32, 36, 48] if ipv6 else [12, 16, 20, 22, 24, 24]
+    address = int(ipaddress.ip_address("2001::" if ipv6 else "1.0.0.0"))
+
+    blocks = []
+    for _ in range(rows):
+        prefix = rng.choice(prefixes)
+        size = 1 << (width - prefix)
+        address = -(-address // size) * size
+        if address + size > 1 << width:
+            break
+        asn = rng.choice(asns)
+        blocks.append((str(ipaddress.ip_network((address, prefix))), asn, f"AS{asn} Networks, Ltd."))
+        address += size * rng.choice([1, 1, 3])
+    return pd.DataFrame(
+        blocks,
+        columns=["network", "autonomous_system_number", "autonomous_system_organization"],
+    )
+
+
+def write_asn_csvs(geolite2_dir: str, rows: int, seed=0):
+    """
+    Writes the GeoLite2 ASN IPv4 and IPv6 block CSVs
+
+    Args:
+        geolite2_dir (str): Directory to write the CSV files to
+        rows (int): Number of IPv4 blocks, a quarter as many IPv6 blocks are written
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    makedirs(geolite2_dir, exist_ok=True)
+    for version, block_rows in ((4, rows), (6, rows // 4)):
+        asn_blocks(block_rows, seed, ipv6=version == 6).to_csv(
+            f"{geolite2_dir}/GeoLite2-ASN-Blocks-IPv{version}.csv", index=False
+        )
+
+
+def write_ito_export(xls_path: str, rows: int, seed=0):
+    """
+    Writes an ITO export, which is an HTML table saved as XLS, with a tenth of IPv6 networks
+
+    Args:
+        xls_path (str): Path to write the export to
+        rows (int): Number of networks
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    with open(xls_path, "w") as f:
+        f.write("<html><body><table><tr><th>ردیف</th><th>IP</th><th>نام</th></tr>")
+        for i in range(rows):
+            if rng.random() < 0.1:
+                network = f"2a01:{rng.getrandbits(16):x}::/48"
+            else:
+                network = f"{rng.randint(1, 223)}.{rng.getrandbits(8)}.{rng.getrandbits(8)}.0/24"
+            f.write(f"<tr><td>{i}</td><td>{network}</td><td>سامانه {i}</td></tr>\n")
+        f.write("</table></body></html>")
+
+
+def write_community_csvs(community_dir: str, rows: int, seed=0, tags=("IR", "CN")):
+    """
+    Writes the ipv4_<TAG>.csv and ipv6_<TAG>.csv files of manually collected CIDRs
+
+    Args:
+        community_dir (str): Directory to write the CSV files to
+        rows (int): Number of CIDRs of each tag and IP version
+        seed (int, optional): Random seed. Defaults to 0.
+        tags (tuple[str], optional): Tags to write files for. Defaults to ("IR", "CN").
+    """
+    makedirs(community_dir, exist_ok=True)
+    for i, tag in enumerate(tags):
+        for version in (4, 6):
+            cidr_frame(rows, seed + i, ipv6=version == 6, tags=[tag]).to_csv(
+                f"{community_dir}/ipv{version}_{tag}.csv", index=False
+            )
+
+
+def write_dataset(root: str, rows: int, seed=0):
+    """
+    Writes a data directory and a sources.toml that main() can build from
+
+    Args:
+        root (str): Directory to write data/ and sources.toml to
+        rows (int): Number of DBIP ranges, the other sources are scaled from it
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+    data_dir = f"{root}/data"
+    for directory in ("dbip", "ito"):
+        makedirs(f"{data_dir}/{directory}", exist_ok=True)
+    write_dbip_csv(f"{data_dir}/dbip/dbip-country-lite.csv", rows, seed)
+    write_geolite2_csvs(f"{data_dir}/geolite2", rows // 2, seed)
+    write_asn_csvs(f"{data_dir}/geolite2", rows // 2, seed)
+    write_ito_export(f"{data_dir}/ito/websites.xls", max(1, rows // 20), seed)
+    write_community_csvs(f"{data_dir}/community", max(1, rows // 100), seed)
+    with open(f"{root}/sources.toml", "w") as f:
+        f.write(SOURCES_TOML)
@@ -0,0 +1,169 @@
+"""
+Straightforward ipaddress implementations of the CIDR utilities, one object per
+network, that the vectorized implementations in lib/ are checked against.
+"""
+import bisect
+import ipaddress
+from collections import defaultdict
+
+import pandas as pd
+
+
+def _widen(network, widen_to, tag: str):
+    if isinstance(widen_to, dict):
+        widen_to = widen_to.get(tag, widen_to.get("default", network.max_prefixlen))
+    if network.prefixlen > widen_to:
+        return network.supernet(new_prefix=widen_to)
+    return network
+
+
+def _networks_by_tag(df: pd.DataFrame, widen_to=None):
+    networks = defaultdict(list)
+    for network, tag in zip(df["Network"].astype(str), df["Tag"]):
+        network = ipaddress.ip_network(network, strict=False)
+        if widen_to:
+            network = _widen(network, widen_to, tag)
+        networks[tag].append(network)
+    return networks
+
+
+def _frame(networks: list, tag: str):
+    return [(str(network), tag) for network in networks]
+
+
+def _remove_subnets(networks: list):
+    kept = []
+    # Wider networks sort before the networks they contain
+    for network in sorted(set(networks), key=lambda n: (n.network_address, n.prefixlen)):
+        if not kept or not network.subnet_of(kept[-1]):
+            kept.append(network)
+    return kept
+
+
+def cleanup_cidrs(cidr_df: pd.DataFrame, aggregate=False, widen_prefixes=None):
+    widen_prefixes = widen_prefixes or {}
+    rows = []
+    for version in ("ipv4", "ipv6"):
+        is_version = cidr_df["Network"].astype(str).str.contains(":") == (version == "ipv6")
+        by_tag = _networks_by_tag(cidr_df[is_version], widen_prefixes.get(version))
+        for tag, networks in sorted(by_tag.items()):
+            if aggregate:
+                networks = ipaddress.collapse_addresses(networks)
+            else:
+                networks = _remove_subnets(networks)
+            rows += _frame(networks, tag)
+    return (
+        pd.DataFrame(rows, columns=["Network", "Tag"])
+        .sort_values(by="Tag", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def join_asn_blocks(networks: pd.Series, asn_blocks: pd.DataFrame, ipv6=False):
+    blocks = sorted(
+        (ipaddress.ip_network(network), asn, organization)
+        for network, asn, organization in zip(
+            asn_blocks["network"],
+            asn_blocks["autonomous_system_number"],
+            asn_blocks["autonomous_system_organization"],
+        )
+    )
+    block_starts = [block[0].network_address for block in blocks]
+    rows = []
+    for network in networks:
+        address = ipaddress.ip_network(network, strict=False).network_address
+        position = bisect.bisect_right(block_starts, address) - 1
+        if position >= 0 and address in blocks[position][0]:
+            rows.append(blocks[position][1:])
+        else:
+            rows.append((pd.NA, None))
+    return pd.DataFrame(
+        {
+            "ASN": pd.array([row[0] for row in rows], dtype="Int64"),
+            "Organization": [row[1] for row in rows],
+        }
+    )
+
+
+def _merge(intervals: list[tuple[int, int]]):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract(start: int, end: int, claimed: list[tuple[int, int]], claimed_starts: list[int]):
+    """Yields the parts of [start, end] that no interval of the sorted, disjoint claimed list covers"""
+    position = max(0, bisect.bisect_right(claimed_starts, start) - 1)
+    while start <= end and position < len(claimed):
+        claimed_start, claimed_end = claimed[position]
+        if claimed_start > end:
+            break
+        if claimed_end >= start:
+            if claimed_start > start:
+                yield start, claimed_start - 1
+            start = claimed_end + 1
+        position += 1
+    if start <= end:
+        yield start, end
+
+
+def resolve_conflicts(cidr_df: pd.DataFrame, priority=None):
+    priority = list(priority or [])
+    order = priority + sorted(set(cidr_df["Tag"]) - set(priority))
+    by_tag = _networks_by_tag(cidr_df)
+    rows = []
+    for version, address_class in ((4, ipaddress.IPv4Address), (6, ipaddress.IPv6Address)):
+        # Address ranges taken by the tags of higher priority
+        claimed = []
+        for tag in order:
+            intervals = [
+                (int(network.network_address), int(network.broadcast_address))
+                for network in by_tag.get(tag, [])
+                if network.version == version
+            ]
+            claimed_starts = [start for start, _ in claimed]
+            for start, end in intervals:
+                for part_start, part_end in _subtract(start, end, claimed, claimed_starts):
+                    summary = ipaddress.summarize_address_range(
+                        address_class(part_start), address_class(part_end)
+                    )
+                    rows += _frame(summary, tag)
+            claimed = _merge(claimed + intervals)
+    return pd.DataFrame(rows, columns=["Network", "Tag"])
+
+
+def _protobuf_field(field: int, value):
+    """Encodes a varint field of an int or a length-delimited field of bytes"""
+    encoded = bytearray()
+    if isinstance(value, int):
+        encoded.append(field << 3)
+    else:
+        encoded.append(field << 3 | 2)
+    number = value if isinstance(value, int) else len(value)
+    while number >= 0x80:
+        encoded.append(number & 0x7F | 0x80)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded) + (b"" if isinstance(value, int) else value)
+
+
+def encode_geoip_dat(df: pd.DataFrame, names=None):
+    names = names or {}
+    entries = []
+    for tag, networks in _networks_by_tag(df).items():
+        cidrs = b""
+        for version in (4, 6):
+            for network in ipaddress.collapse_addresses(
+                network for network in networks if network.version == version
+            ):
+                cidr = _protobuf_field(1, network.network_address.packed)
+                if network.prefixlen:
+                    cidr += _protobuf_field(2, network.prefixlen)
+                cidrs += _protobuf_field(2, cidr)
+        code = names.get(tag, tag).upper()
+        entries.append((code, _protobuf_field(1, _protobuf_field(1, code.encode()) + cidrs)))
+    return b"".join(entry for _, entry in sorted(entries))
@@ -1,10 +1,46 @@
-from io import StringIO
-
 import pandas as pd
-from bs4 import BeautifulSoup
+from lxml import etree
 
 from lib.cidr_utils import extract_to_ipv4_ipv6
 
+# Websites' DB and messengers' DB have different column names. Typical IR!
+ITO_NETWORK_COLUMNS = ["IP", "IPv4"]
+
+
+def read_ito_networks(xls_path: str):
+    """
+    Extracts the cells of the IP column from an Excel sheet from ito, which
+    is really an HTML table, in a single streaming pass over its rows
+
+    Args:
+        xls_path (str): Path to XLS file
+
+    Raises:
+        ValueError: If the sheet has no IP column
+
+    Returns:
+        list[str]: Networks in the order of the sheet
+    """
+    column = None
+    networks = []
+    for _, row in etree.iterparse(xls_path, events=("end",), tag="tr", html=True):
+        cells = ["".join(cell.itertext()).strip() for cell in row if cell.tag in ("td", "th")]
+        if column is None:
+            column = next(
+                (cells.index(name) for name in ITO_NETWORK_COLUMNS if name in cells), None
+            )
+        elif column < len(cells) and cells[column]:
+            networks.append(cells[column])
+
+        # Free the rows already seen to keep memory flat on large exports
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+
+    if column is None:
+        raise ValueError(f"No {'/'.join(ITO_NETWORK_COLUMNS)} column found in {xls_path}")
+    return networks
+
 
 def convert_xls_to_df(xls_path: str):
     """
@@ -17,22 +53,7 @@ def convert_xls_to_df(xls_path: str):
     Returns:
         DataFrame: DataFrame containing CIDR of the Iranian intranet.
     """
-    with open(xls_path) as xml_file:
-        soup = BeautifulSoup(xml_file.read(), "html.parser")
-        html_string = soup.decode_contents()
-        string_io_object = StringIO(html_string)
-        ito_df = pd.read_html(string_io_object)[0]
-
-        # Websites' DB and messengers' DB have different column names. Typical IR!
-        if "IP" in ito_df.columns:
-            ito_df = ito_df.rename(columns={"IP": "Network"})
-        elif "IPv4" in ito_df.columns:
-            ito_df = ito_df.rename(columns={"IPv4": "Network"})
-
-        # Drop every column except 'Network'
-        ito_df = ito_df[["Network"]]
-        ito_df["Tag"] = "IR"
-
-        ipv4, ipv6 = extract_to_ipv4_ipv6(ito_df)
+    ito_df = pd.DataFrame({"Network": read_ito_networks(xls_path), "Tag": "IR"})
+    ipv4, ipv6 = extract_to_ipv4_ipv6(ito_df)
 
-        return ipv4, ipv6
+    return ipv4, ipv6
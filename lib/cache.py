@@ -0,0 +1,206 @@
+import glob
+import hashlib
+import shutil
+from functools import lru_cache
+from os import makedirs, remove, replace, stat
+from os.path import basename, dirname, isdir, realpath
+
+import numpy as np
+import pandas as pd
+
+LIB_DIR = dirname(__file__)
+
+
+def file_digest(path: str):
+    """
+    Calculates the SHA-256 digest of a file's content. Digests are remembered
+    by path, modification time and size, so that files shared by many tags
+    and sources are only read once per build.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Hex digest
+    """
+    file_stat = stat(path)
+    return _file_digest(realpath(path), file_stat.st_mtime_ns, file_stat.st_size)
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path: str, mtime_ns: int, size: int):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version():
+    """
+    Digest of the library code that parses and converts the sources, so that
+    cached results are re-derived whenever that code changes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(f"{LIB_DIR}/*.py")):
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def pack_cidrs(df: pd.DataFrame):
+    """
+    Packs a CIDR DataFrame into plain arrays, which are much cheaper to store
+    and to send between processes than a DataFrame of Python strings
+
+    Args:
+        df (pd.DataFrame): CIDR DataFrame
+
+    Returns:
+        dict: 'networks' as a UTF-8 blob, 'tag_codes' and 'tag_names' arrays
+    """
+    tag_codes, tag_names = pd.factorize(df["Tag"])
+    blob = "\n".join(df["Network"].astype(str)).encode()
+    return {
+        "networks": np.frombuffer(blob, dtype=np.uint8),
+        "tag_codes": tag_codes.astype(np.int32),
+        "tag_names": np.array(tag_names, dtype=str),
+    }
+
+
+def unpack_cidrs(networks: np.ndarray, tag_codes: np.ndarray, tag_names: np.ndarray):
+    """
+    Unpacks the arrays of pack_cidrs into a CIDR DataFrame
+
+    Args:
+        networks (np.ndarray): UTF-8 blob of the newline-separated networks
+        tag_codes (np.ndarray): Index of the tag of every network into tag_names
+        tag_names (np.ndarray): Tag names
+
+    Returns:
+        pd.DataFrame: CIDR DataFrame
+    """
+    if len(tag_codes) == 0:
+        return pd.DataFrame(columns=["Network", "Tag"])
+    return pd.DataFrame(
+        {
+            "Network": networks.tobytes().decode().split("\n"),
+            "Tag": tag_names[tag_codes],
+        }
+    )
+
+
+def write_cidr_part(path: str, ipv4_df: pd.DataFrame, ipv6_df: pd.DataFrame):
+    """
+    Writes the CIDRs of a part of a source to an .npz file of plain arrays
+
+    Args:
+        path (str): Path to the .npz file
+        ipv4_df (pd.DataFrame): IPv4 CIDR DataFrame
+        ipv6_df (pd.DataFrame): IPv6 CIDR DataFrame
+    """
+    arrays = {}
+    for version, df in (("ipv4", ipv4_df), ("ipv6", ipv6_df)):
+        for name, array in pack_cidrs(df).items():
+            arrays[f"{version}_{name}"] = array
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def read_cidr_part(path: str):
+    """
+    Reads the CIDRs of a part written by write_cidr_part
+
+    Args:
+        path (str): Path to the .npz file
+
+    Returns:
+        tuple: IPv4 and IPv6 CIDR DataFrames
+    """
+    with np.load(path) as part:
+        return tuple(
+            unpack_cidrs(
+                part[f"{version}_networks"],
+                part[f"{version}_tag_codes"],
+                part[f"{version}_tag_names"],
+            )
+            for version in ("ipv4", "ipv6")
+        )
+
+
+class SourceCache:
+    """
+    On-disk cache of the filtered and converted CIDRs of a source, keyed by
+    the content of the source files, the extraction parameters and the code
+    version. Every entry is a directory of the .npz parts the source was
+    loaded in, so that it can be read back one part at a time.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.version = code_version()
+        self._used_keys = set()
+        makedirs(cache_dir, exist_ok=True)
+
+    def key(self, paths: list[str], *params):
+        """
+        Builds the cache key of a source
+
+        Args:
+            paths (list[str]): Paths to the files the source is loaded from
+            *params: Extraction parameters, e.g. wanted tags
+
+        Returns:
+            str: Hex digest to use as cache key
+        """
+        digest = hashlib.sha256(self.version.encode())
+        for path in paths:
+            digest.update(file_digest(path).encode())
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str):
+        return f"{self.cache_dir}/{key}.parts"
+
+    def load(self, key: str):
+        """
+        Looks up cached CIDRs and marks the key as used by this build
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            list[str]: Paths to the parts of the cached CIDRs in the order they
+            were stored, see read_cidr_part, None if the key is not cached
+        """
+        self._used_keys.add(key)
+        if not isdir(self._entry_path(key)):
+            return None
+        return sorted(glob.glob(f"{self._entry_path(key)}/*.npz"))
+
+    def store(self, key: str, part_paths: list[str]):
+        """
+        Moves the parts of a source into the cache
+
+        Args:
+            key (str): Cache key
+            part_paths (list[str]): Paths to the parts written by write_cidr_part, in order
+        """
+        # Move into a temporary directory first so an interrupted build never leaves a broken entry
+        tmp_path = f"{self._entry_path(key)}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        makedirs(tmp_path)
+        for i, path in enumerate(part_paths):
+            shutil.move(path, f"{tmp_path}/{i:06d}.npz")
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+        replace(tmp_path, self._entry_path(key))
+
+    def prune(self):
+        """Removes the entries that were not used by this build, and entries of older layouts"""
+        for path in glob.glob(f"{self.cache_dir}/*.npz"):
+            remove(path)
+        for path in glob.glob(f"{self.cache_dir}/*.parts*"):
+            if basename(path).removesuffix(".parts") not in self._used_keys:
+                shutil.rmtree(path)
@@ -1,66 +1,149 @@
-import ipaddress
-from functools import partial
-from multiprocessing import Pool, cpu_count
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 
+import numpy as np
 import pandas as pd
 
+from lib.intervals import (
+    format_networks,
+    last_addresses,
+    merge_intervals,
+    network_addresses,
+    ordinals,
+    parse_addresses,
+    parse_networks,
+    ranges_to_networks,
+    remove_covered,
+)
+from lib.stats import SourceCoverage
+
+
+class CidrCollector:
+    """
+    Buffers the CIDR DataFrames of every source and builds the IPv4 and IPv6
+    aggregates with a single concatenation each, recording how many rows
+    and addresses every source contributed to each tag along the way.
+    """
 
-def concat_df(dst_df: pd.DataFrame, src_df: pd.DataFrame):
-    dst_df = pd.concat(
-        [dst_df, src_df],
-        ignore_index=True,
-    )
-    return dst_df
+    def __init__(self):
+        self.source_counts = Counter()
+        self.coverage = SourceCoverage()
+        self._frames = {False: [], True: []}
+
+    def add(self, df: pd.DataFrame, source: str, ipv6=False):
+        """
+        Adds the CIDRs of a source
+
+        Args:
+            df (pd.DataFrame): CIDR DataFrame of a single IP version
+            source (str): Name of the source the CIDRs were loaded from
+            ipv6 (bool, optional): Whether the CIDRs are IPv6 or IPv4. Defaults to False.
+        """
+        if df.empty:
+            return
+        for tag, count in df["Tag"].value_counts().items():
+            self.source_counts[(source, tag, ipv6)] += count
+        self.coverage.add(df, source, ipv6=ipv6)
+        self._store(df[["Network", "Tag"]], ipv6=ipv6)
+
+    def _store(self, df: pd.DataFrame, ipv6=False):
+        self._frames[ipv6].append(df)
+
+    def aggregate(self, ipv6=False):
+        """
+        Concatenates the buffered CIDRs of an IP version
+
+        Args:
+            ipv6 (bool, optional): Whether to aggregate IPv6 or IPv4 CIDRs. Defaults to False.
+
+        Returns:
+            pd.DataFrame: Aggregated CIDR DataFrame
+        """
+        if not self._frames[ipv6]:
+            return pd.DataFrame(columns=["Network", "Tag"])
+        return pd.concat(self._frames[ipv6], ignore_index=True)
+
+    def print_source_counts(self, source: str):
+        tags = sorted({tag for src, tag, _ in self.source_counts if src == source})
+        for tag in tags:
+            print(f"[{tag}] IPv4 entries found: {self.source_counts[(source, tag, False)]}")
+            print(f"[{tag}] IPv6 entries found: {self.source_counts[(source, tag, True)]}")
+
+
+def _widen_targets(tags, widen_to, width: int):
+    if isinstance(widen_to, int):
+        return np.full(len(tags), widen_to, dtype=np.int64)
+    default = widen_to.get("default", width)
+    return np.array([widen_to.get(tag, default) for tag in tags], dtype=np.int64)
+
+
+def widen_networks(start, prefix, tag_codes, tags, widen_to, ipv6=False):
+    """
+    Widens every network narrower than the prefix length wanted for its tag
+    to the network of that length containing it
+
+    Args:
+        start (np.ndarray): Network addresses of a single IP version
+        prefix (np.ndarray): Prefix lengths
+        tag_codes (np.ndarray): Index of the tag of every network into tags
+        tags (Sequence[str]): Tag names
+        widen_to (int | dict[str, int]): Prefix length to widen to, either for all
+        tags or per tag with a 'default' entry for the others
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        tuple: Start addresses, end addresses and prefix lengths of the widened networks
+    """
+    targets = _widen_targets(tags, widen_to, 128 if ipv6 else 32)[tag_codes]
+    prefix = np.minimum(prefix, targets).astype(np.uint8)
+    start = network_addresses(start, prefix, ipv6=ipv6)
+    return start, last_addresses(start, prefix, ipv6=ipv6), prefix
 
 
-def expand_cidr_range(df: pd.DataFrame):
+def expand_cidr_range(df: pd.DataFrame, widen_to=24, ipv6=False):
     """
-    Takes a DataFrame containing IPv4 CIDRs,
-    finds duplicate networks but with different subnets,
-    throws away the less expansive ones (higher subnet numbers) and
-    converts all single-IP entries to /24 subnet
+    Takes a DataFrame containing CIDRs, widens every CIDR narrower than
+    the wanted prefix length to the network of that length containing it
+    (e.g. single IPv4s to their /24) and throws away the networks that
+    start at the same address as a wider network of the same tag
 
     Args:
-        df (pd.DataFrame): IPv4 DataFrame
+        df (pd.DataFrame): CIDR DataFrame of a single IP version
+        widen_to (int | dict[str, int], optional): Prefix length to widen to,
+        either for all tags or per tag with a 'default' entry for the others.
+        Defaults to 24.
+        ipv6 (bool, optional): Whether the CIDRs are IPv6 or IPv4. Defaults to False.
 
     Returns:
-        pd.DataFrame: Expanded DataFrame
-    """
-    # Separate the subnet notation from the IP
-    split_list = []
-    for row in zip(df["Network"], df["Tag"]):
-        ip_arr = str(row[0]).split("/")
-        ip_addr = ip_arr[0]
-        ip_subnet = ip_arr[1]
-        split_list.append({"IP": ip_addr, "Subnet": int(ip_subnet), "Tag": row[1]})
-
-    # Convert all single IPv4s to their last octet's max range
-    print("-> Converting smaller subnets to /24 to cover the whole C class network")
-    extensive_list = []
-    for item in split_list:
-        if "." in item["IP"] and 25 <= item["Subnet"] <= 32:
-            octets_arr = item["IP"].split(".")
-            octets_arr[3] = "0"
-            item["IP"] = ".".join(octets_arr)
-            item["Subnet"] = 24
-        extensive_list.append(
-            {"IP": item["IP"], "Subnet": item["Subnet"], "Tag": item["Tag"]}
-        )
+        pd.DataFrame: Expanded DataFrame sorted by tag and network address
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["Network", "Tag"])
+
+    start, _, prefix = parse_networks(df["Network"].astype(str), ipv6=ipv6)
+    tag_codes, tags = pd.factorize(df["Tag"], sort=True)
+
+    print("-> Widening smaller subnets to the prefix length configured for each tag")
+    start, _, prefix = widen_networks(start, prefix, tag_codes, tags, widen_to, ipv6=ipv6)
 
     # Remove any duplicates resulting from above operations
     print("-> Dropping duplicate networks but with higher subnets")
-    tmp_df = pd.DataFrame(extensive_list)
-    tmp_df = tmp_df.sort_values("Subnet", ascending=True)
-    tmp_df = tmp_df.drop_duplicates(subset=["IP"])
-
-    result_list = []
-    for row in zip(tmp_df["IP"], tmp_df["Subnet"], tmp_df["Tag"]):
-        cidr = f"{row[0]}/{row[1]}"
-        result_list.append({"Network": cidr, "Tag": row[2]})
-    result_df = pd.DataFrame(result_list)
-    result_df = result_df.sort_values("Tag").reset_index(drop=True)
+    (start_keys,) = ordinals(start)
+    order = np.lexsort((prefix, start_keys, tag_codes))
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = (tag_codes[order][1:] != tag_codes[order][:-1]) | (
+        start_keys[order][1:] != start_keys[order][:-1]
+    )
+    kept = order[is_first]
 
-    return result_df
+    return pd.DataFrame(
+        {
+            "Network": format_networks(start[kept], prefix[kept], ipv6=ipv6),
+            "Tag": tags[tag_codes[kept]],
+        }
+    )
 
 
 def convert_iprange_to_cidr(df: pd.DataFrame, ipv6=False):
@@ -75,132 +158,230 @@ def convert_iprange_to_cidr(df: pd.DataFrame, ipv6=False):
     Returns:
         DataFrame: DataFrame containing IP CIDR data
     """
-    cidr_list = []
-    for _, row in df.iterrows():
-        startip = (
-            ipaddress.IPv6Address(row["Range_Start"])
-            if ipv6
-            else ipaddress.IPv4Address(row["Range_Start"])
-        )
-        endip = (
-            ipaddress.IPv6Address(row["Range_End"])
-            if ipv6
-            else ipaddress.IPv4Address(row["Range_End"])
-        )
-        summary = ipaddress.summarize_address_range(startip, endip)
-        current_cidr = list(summary)
-        for item in current_cidr:
-            cidr_list.append({"Network": item.__str__(), "Tag": row["Tag"]})
-
-    return pd.DataFrame(cidr_list)
+    start = parse_addresses(df["Range_Start"], ipv6=ipv6)
+    end = parse_addresses(df["Range_End"], ipv6=ipv6)
+    network_start, prefix, range_indices = ranges_to_networks(start, end, ipv6=ipv6)
+
+    return pd.DataFrame(
+        {
+            "Network": format_networks(network_start, prefix, ipv6=ipv6),
+            "Tag": df["Tag"].to_numpy()[range_indices],
+        }
+    )
 
 
 def extract_to_ipv4_ipv6(df):
-    """Filters a DataFrame of IP addresses by IP type.
+    """Splits a DataFrame of IP addresses by IP type.
 
     Args:
       df: A DataFrame containing IP addresses.
-      ip_type: A string representing the IP type to filter for, either "ipv4" or "ipv6".
 
     Returns:
-      A DataFrame containing the filtered IP addresses.
+      Two DataFrames containing the IPv4 and the IPv6 addresses.
     """
+    networks = df["Network"].astype(str)
+    is_ipv6 = networks.str.contains(":", regex=False)
+    is_ipv4 = ~is_ipv6 & networks.str.contains(".", regex=False)
 
-    ipv4 = []
-    ipv6 = []
-    for index, row in df.iterrows():
-        ip_address = row['Network']
+    ipv4 = df.loc[is_ipv4, ["Network", "Tag"]].reset_index(drop=True)
+    ipv6 = df.loc[is_ipv6, ["Network", "Tag"]].reset_index(drop=True)
 
-        if ":" in ip_address:
-            ipv6.append(row)
-        elif "." in ip_address:
-            ipv4.append(row)
+    return ipv4, ipv6
 
-    ipv4 = pd.DataFrame(ipv4, columns=["Network", "Tag"])
-    ipv6 = pd.DataFrame(ipv6, columns=["Network", "Tag"])
 
-    return ipv4, ipv6
+# Below this many CIDRs a worker pool costs more than it saves
+PARALLEL_CLEANUP_MIN_ROWS = 100_000
 
-def _cleanup_duplicates_and_subnets(df):
-    """Removes duplicate CIDR addresses from a DataFrame and removes CIDR addresses that are subnets of an existing CIDR address.
 
-    Args:
-      df: A DataFrame containing network CIDR addresses.
+def _parse_partition(blob: np.ndarray, ipv6=False):
+    return parse_networks(blob.tobytes().decode().split("\n"), ipv6=ipv6)
 
-    Returns:
-      A DataFrame containing the unique CIDR addresses, where no CIDR address is a subnet of another CIDR address.
-    """
 
-    # Sort the DataFrame by CIDR address.
-    df = df.sort_values(by=['Network'])
+def _format_partition(start: np.ndarray, prefix: np.ndarray, ipv6=False):
+    blob = "\n".join(format_networks(start, prefix, ipv6=ipv6)).encode()
+    return np.frombuffer(blob, dtype=np.uint8)
 
-    # Iterate over the DataFrame and compare each CIDR address to the previous one.
-    previous_cidr_address = None
-    to_drop = []
-    for index, row in df.iterrows():
-        cidr_address = row['Network']
 
-        # If the current CIDR address is the same as the previous CIDR address,
-        # or if the current CIDR address is a subnet of the previous CIDR address,
-        # remove the current entry.
-        if previous_cidr_address and (
-                cidr_address.compare_networks(previous_cidr_address) == 0 or cidr_address.subnet_of(
-            previous_cidr_address)):
-            to_drop.append(index)
+def _partition_bounds(length: int, workers: int):
+    # A few partitions per worker even out their differing speeds
+    partitions = min(length, workers * 4)
+    return np.linspace(0, length, partitions + 1, dtype=np.int64)
 
-        previous_cidr_address = cidr_address
 
-    # Drop the duplicate and subnet CIDR addresses.
-    df = df.drop(to_drop)
+def _parse_networks_parallel(networks: pd.Series, ipv6: bool, executor, workers: int):
+    bounds = _partition_bounds(len(networks), workers)
+    blobs = [
+        np.frombuffer("\n".join(networks.iloc[start:end]).encode(), dtype=np.uint8)
+        for start, end in zip(bounds, bounds[1:])
+    ]
+    parts = list(executor.map(_parse_partition, blobs, [ipv6] * len(blobs)))
+    return tuple(np.concatenate([part[i] for part in parts]) for i in range(3))
 
-    return df
 
+def _format_networks_parallel(start: np.ndarray, prefix: np.ndarray, ipv6: bool, executor, workers: int):
+    bounds = _partition_bounds(len(start), workers)
+    blobs = executor.map(
+        _format_partition,
+        [start[i:j] for i, j in zip(bounds, bounds[1:])],
+        [prefix[i:j] for i, j in zip(bounds, bounds[1:])],
+        [ipv6] * (len(bounds) - 1),
+    )
+    return "\n".join(blob.tobytes().decode() for blob in blobs).split("\n")
 
-def _preprocess_for_cleaning(df: pd.DataFrame):
-    # Convert CIDR strings to IPNetwork objects
-    df["Network"] = df["Network"].apply(partial(ipaddress.ip_network, strict=False))
 
-    # Filter for IPv4 and IPv6
-    df_v4 = df[df["Network"].apply(lambda x: x.version == 4)]
-    df_v6 = df[df["Network"].apply(lambda x: x.version == 6)]
+def _cleanup_ip_version(
+    df: pd.DataFrame, ipv6=False, aggregate=False, widen_to=None, executor=None, workers=1
+):
+    """
+    Removes duplicate CIDRs and CIDRs that are subnets of another CIDR with the same tag
+
+    Parsing and formatting the CIDRs are the expensive steps, with an executor
+    both are split into equally sized partitions of rows that the workers process
+    as compact arrays. The sweep over the integer intervals of all tags stays a
+    single vectorized pass, so no fix-up is needed where partitions meet.
 
-    df_v4 = _cleanup_duplicates_and_subnets(df_v4)
-    df_v6 = _cleanup_duplicates_and_subnets(df_v6)
+    Args:
+        df (pd.DataFrame): CIDR DataFrame of a single IP version
+        ipv6 (bool, optional): Whether the CIDRs are IPv6 or IPv4. Defaults to False.
+        aggregate (bool, optional): Whether to also merge overlapping and adjacent
+        CIDRs into the minimal list of CIDRs covering them. Defaults to False.
+        widen_to (int | dict[str, int], optional): Prefix length to widen narrower
+        CIDRs to, see widen_networks. Defaults to None.
+        executor (ProcessPoolExecutor, optional): Pool to parse and format in. Defaults to None.
+        workers (int, optional): Number of workers of the pool. Defaults to 1.
 
-    # Concatenate results
-    df = pd.concat([df_v4, df_v6])
-    df["Network"] = df["Network"].astype(str)
-    return df
+    Returns:
+        pd.DataFrame: Cleaned DataFrame sorted by tag and network address
+    """
+    if df.empty:
+        return pd.DataFrame(columns=["Network", "Tag"])
+
+    networks = df["Network"].astype(str)
+    if executor is not None:
+        start, end, prefix = _parse_networks_parallel(networks, ipv6, executor, workers)
+    else:
+        start, end, prefix = parse_networks(networks, ipv6=ipv6)
+    tag_codes, tags = pd.factorize(df["Tag"], sort=True)
+    if widen_to:
+        start, end, prefix = widen_networks(start, prefix, tag_codes, tags, widen_to, ipv6=ipv6)
+
+    if aggregate:
+        start_indices, end_indices = merge_intervals(start, end, groups=tag_codes)
+        start, prefix, range_indices = ranges_to_networks(
+            start[start_indices], end[end_indices], ipv6=ipv6
+        )
+        tag_codes = tag_codes[start_indices][range_indices]
+        kept = np.arange(len(start))
+    else:
+        kept = remove_covered(start, end, groups=tag_codes)
+
+    if executor is not None and len(kept) >= PARALLEL_CLEANUP_MIN_ROWS:
+        cleaned_networks = _format_networks_parallel(
+            start[kept], prefix[kept], ipv6, executor, workers
+        )
+    else:
+        cleaned_networks = format_networks(start[kept], prefix[kept], ipv6=ipv6)
 
+    return pd.DataFrame({"Network": cleaned_networks, "Tag": tags[tag_codes[kept]]})
 
-def cleanup_cidrs(cidr_df: pd.DataFrame):
-    print(
-        "\n*** Starting to remove redundant CIDRs ***"
-    )
-    print(
-        "-> Splitting the dataset into smaller chunks based on their tags for parallel processing"
+
+def cleanup_cidrs(cidr_df: pd.DataFrame, aggregate=False, workers=None, widen_prefixes=None):
+    """
+    Removes redundant CIDRs of every tag, optionally aggregating them
+
+    Args:
+        cidr_df (pd.DataFrame): CIDR DataFrame of both IP versions
+        aggregate (bool, optional): Whether to merge overlapping and adjacent
+        CIDRs of the same tag into their minimal CIDR cover. Defaults to False.
+        workers (int, optional): Number of worker processes, large inputs are
+        split among them. Defaults to the number of CPUs.
+        widen_prefixes (dict, optional): 'ipv4' and 'ipv6' prefix lengths to widen
+        narrower CIDRs to beforehand, see widen_networks. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Cleaned DataFrame sorted by tag and network address
+    """
+    print("\n*** Starting to remove redundant CIDRs ***")
+    print("-> Converting CIDRs to integer intervals")
+    is_ipv6 = cidr_df["Network"].str.contains(":", regex=False)
+
+    workers = workers or os.cpu_count() or 1
+    widen_prefixes = widen_prefixes or {}
+    if widen_prefixes:
+        print("-> Widening smaller subnets to the prefix length configured for each tag")
+    with ExitStack() as stack:
+        executor = None
+        if workers > 1 and len(cidr_df) >= PARALLEL_CLEANUP_MIN_ROWS:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+
+        if aggregate:
+            print("-> Merging overlapping and adjacent CIDRs into their minimal cover")
+        else:
+            print("-> Dropping duplicate and subnet CIDRs in a single sorted sweep")
+        cleaned_ipv4_df = _cleanup_ip_version(
+            cidr_df[~is_ipv6],
+            ipv6=False,
+            aggregate=aggregate,
+            widen_to=widen_prefixes.get("ipv4"),
+            executor=executor,
+            workers=workers,
+        )
+        cleaned_ipv6_df = _cleanup_ip_version(
+            cidr_df[is_ipv6],
+            ipv6=True,
+            aggregate=aggregate,
+            widen_to=widen_prefixes.get("ipv6"),
+            executor=executor,
+            workers=workers,
+        )
+
+    return (
+        pd.concat([cleaned_ipv4_df, cleaned_ipv6_df], ignore_index=True)
+        .sort_values(by="Tag", kind="stable")
+        .reset_index(drop=True)
     )
-    chunks = [
-        chunk.sort_values("Network", ascending=False)
-        for _, chunk in cidr_df.groupby("Tag")
-    ]
 
-    # Create a Pool of workers and process the chunks in parallel
-    print(f"-> Processing {len(chunks)} chunks in parallel, this will take a while...")
-    num_workers = cpu_count() - 1  # Get the number of CPU cores
 
-    with Pool(processes=num_workers) as pool:
-        cleaned_chunks = pool.map(_preprocess_for_cleaning, chunks)
+def prefix_histogram(df: pd.DataFrame):
+    """
+    Counts the CIDRs of every tag per IP version and prefix length, CIDRs
+    that are not valid are left out
+
+    Args:
+        df (pd.DataFrame): CIDR DataFrame
 
-    print("-> Concatenating the DataFrames...")
-    return pd.concat(cleaned_chunks, axis=0, ignore_index=True).sort_values(
-        by=["Tag", "Network"]
+    Returns:
+        pd.DataFrame: 'Tag', 'IPv6', 'Prefix' and 'Networks' columns
+    """
+    networks = df["Network"].astype(str)
+    is_ipv6 = networks.str.contains(":", regex=False)
+    is_ipv4 = ~is_ipv6 & networks.str.contains(".", regex=False)
+    width = pd.Series(np.where(is_ipv6, 128, 32), index=df.index)
+
+    parts = networks.str.partition("/")
+    prefix = pd.to_numeric(parts[2], errors="coerce").where(parts[1] == "/", width)
+    is_valid = (is_ipv4 | is_ipv6) & prefix.between(0, width)
+
+    return (
+        pd.DataFrame(
+            {
+                "Tag": df["Tag"][is_valid],
+                "IPv6": is_ipv6[is_valid],
+                "Prefix": prefix[is_valid].astype(np.int64),
+            }
+        )
+        .groupby(["Tag", "IPv6", "Prefix"], sort=True)
+        .size()
+        .rename("Networks")
+        .reset_index()
     )
 
 
 def calculate_ip_stats(df: pd.DataFrame) -> list[dict]:
     """
-    Calculates how many IPs are covered for each country (tag)
+    Calculates how many IPs are covered for each country (tag) and how
+    many CIDRs of each prefix length it has. Address counts are summed
+    per prefix length as 2**(32 - prefix) and 2**(128 - prefix).
 
     Args:
         df (pd.DataFrame): CIDR DataFrame
@@ -208,28 +389,34 @@ def calculate_ip_stats(df: pd.DataFrame) -> list[dict]:
     Returns:
         list[dict]: List of dictionaries containing stats
     """
-    unique_tags = df["Tag"].unique().tolist()
+    return histogram_stats(prefix_histogram(df), df["Tag"].unique().tolist())
+
+
+def histogram_stats(histogram: pd.DataFrame, tags: list[str]) -> list[dict]:
+    """
+    Calculates the stats of calculate_ip_stats from a prefix histogram
+
+    Args:
+        histogram (pd.DataFrame): Prefix histogram such as prefix_histogram returns
+        tags (list[str]): Tags to calculate the stats of, in the order of the stats
+
+    Returns:
+        list[dict]: List of dictionaries containing stats
+    """
     stats = []
 
-    for tag in unique_tags:
-        tagged_df = df[df["Tag"] == tag]
-        total_ipv4s = 0
-        total_ipv6s = 0
-        for _, row in tagged_df.iterrows():
-            cidr = row["Network"]
-            try:
-                network = ipaddress.IPv4Network(cidr, strict=False)
-                total_ipv4s += network.num_addresses
-            except ipaddress.AddressValueError:
-                try:
-                    network = ipaddress.IPv6Network(cidr, strict=False)
-                    total_ipv6s += network.num_addresses
-                except ipaddress.AddressValueError:
-                    # Invalid CIDR, pass
-                    pass
-        stats.append(
-            {"tag": tag, "total_ipv4s": total_ipv4s, "total_ipv6s": total_ipv6s}
-        )
+    for tag in tags:
+        item = {"tag": tag}
+        for version, ipv6, width in (("ipv4", False, 32), ("ipv6", True, 128)):
+            rows = histogram[(histogram["Tag"] == tag) & (histogram["IPv6"] == ipv6)]
+            prefixes = dict(zip(rows["Prefix"].tolist(), rows["Networks"].tolist()))
+            item[f"total_{version}s"] = sum(
+                count << (width - prefix) for prefix, count in prefixes.items()
+            )
+            item[f"{version}_prefixes"] = {
+                str(prefix): count for prefix, count in prefixes.items()
+            }
+        stats.append(item)
 
     return stats
 
@@ -243,3 +430,30 @@ IPv4: {'{:,}'.format(item['total_ipv4s'])} IPs
 IPv6: {item['total_ipv6s']:.2e} IPs
 """
             )
+
+
+def pretty_print_source_counts(source_counts: Counter):
+    if source_counts:
+        print("Entries loaded per source")
+        for (source, tag, ipv6), count in sorted(source_counts.items()):
+            print(f"{source:<12} {tag:<4} IPv{6 if ipv6 else 4}: {'{:,}'.format(count)}")
+        print()
+
+
+def pretty_print_source_coverage(stats):
+    if any(item.get("sources") for item in stats):
+        print("Addresses covered per source (only by it)")
+        for item in stats:
+            for version, report in item.get("sources", {}).items():
+                for source, coverage in report["sources"].items():
+                    addresses = coverage["addresses"]
+                    unique = coverage["unique_addresses"]
+                    if version == "ipv4":
+                        counts = f"{'{:,}'.format(addresses)} ({'{:,}'.format(unique)})"
+                    else:
+                        counts = f"{addresses:.2e} ({unique:.2e})"
+                    print(f"{source:<12} {item['tag']:<4} {version}: {counts}")
+                for pair, shared in report["overlaps"].items():
+                    shared = "{:,}".format(shared) if version == "ipv4" else f"{shared:.2e}"
+                    print(f"  overlap {pair}: {shared}")
+        print()
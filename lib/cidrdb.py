@@ -0,0 +1,112 @@
+import mmap
+import struct
+
+import numpy as np
+
+from lib.lookup import CidrIndex, VersionIndex
+
+# Binary layout, all integers little-endian and every array 8-byte aligned:
+#   header     magic, format version, tag count, IPv4 and IPv6 segment counts
+#   tag table  one zero-padded 16-byte ASCII name per tag
+#   IPv4       segment starts (uint32), segment ends (uint32), tag codes (uint16)
+#   IPv6       segment starts (16-byte big-endian), segment ends (same), tag codes (uint16)
+# Segments are disjoint and sorted, so they can be binary searched in place.
+MAGIC = b"GFICIDR\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+TAG_DTYPE = np.dtype("S16")
+SECTION_DTYPES = {
+    False: (np.dtype("<u4"), np.dtype("<u2")),
+    True: (np.dtype("S16"), np.dtype("<u2")),
+}
+
+
+def _aligned(offset: int):
+    return (offset + 7) // 8 * 8
+
+
+def _layout(tag_count: int, counts: dict[bool, int]):
+    """Byte offsets of the starts, ends and tags arrays of both IP versions"""
+    offset = _aligned(HEADER.size + tag_count * TAG_DTYPE.itemsize)
+    offsets = {}
+    for ipv6 in (False, True):
+        address_dtype, tag_dtype = SECTION_DTYPES[ipv6]
+        starts = offset
+        ends = _aligned(starts + counts[ipv6] * address_dtype.itemsize)
+        tags = _aligned(ends + counts[ipv6] * address_dtype.itemsize)
+        offset = _aligned(tags + counts[ipv6] * tag_dtype.itemsize)
+        offsets[ipv6] = (starts, ends, tags)
+    return offsets, offset
+
+
+def write_cidr_db(index: CidrIndex, db_path: str):
+    """
+    Writes a lookup index to a binary file that can be memory-mapped
+
+    Args:
+        index (CidrIndex): Lookup index
+        db_path (str): Path to the binary file
+    """
+    tag_names = np.array(index.tag_names, dtype=TAG_DTYPE)
+    if any(len(tag.encode()) > TAG_DTYPE.itemsize for tag in index.tag_names):
+        raise ValueError(f"Tags longer than {TAG_DTYPE.itemsize} bytes can't be stored")
+
+    counts = {ipv6: len(index.indexes[ipv6].starts) for ipv6 in (False, True)}
+    offsets, size = _layout(len(tag_names), counts)
+    buffer = bytearray(size)
+    HEADER.pack_into(
+        buffer, 0, MAGIC, FORMAT_VERSION, len(tag_names), counts[False], counts[True]
+    )
+    buffer[HEADER.size : HEADER.size + tag_names.nbytes] = tag_names.tobytes()
+    for ipv6 in (False, True):
+        address_dtype, tag_dtype = SECTION_DTYPES[ipv6]
+        version_index = index.indexes[ipv6]
+        for offset, array, dtype in zip(
+            offsets[ipv6],
+            (version_index.starts, version_index.ends, version_index.tags),
+            (address_dtype, address_dtype, tag_dtype),
+        ):
+            data = np.asarray(array, dtype=dtype).tobytes()
+            buffer[offset : offset + len(data)] = data
+
+    with open(db_path, "wb") as f:
+        f.write(buffer)
+
+
+def open_cidr_db(db_path: str):
+    """
+    Memory-maps a binary file written by write_cidr_db, the arrays are used
+    in place without parsing or copying them
+
+    Args:
+        db_path (str): Path to the binary file
+
+    Returns:
+        CidrIndex: Lookup index backed by the file
+    """
+    with open(db_path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, tag_count, ipv4_count, ipv6_count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"'{db_path}' is not a CIDR database")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported CIDR database format version {version}")
+
+    tag_names = np.frombuffer(buffer, dtype=TAG_DTYPE, count=tag_count, offset=HEADER.size)
+    counts = {False: ipv4_count, True: ipv6_count}
+    offsets, _ = _layout(tag_count, counts)
+    indexes = {}
+    for ipv6 in (False, True):
+        address_dtype, tag_dtype = SECTION_DTYPES[ipv6]
+        starts, ends, tags = offsets[ipv6]
+        indexes[ipv6] = VersionIndex(
+            np.frombuffer(buffer, dtype=address_dtype, count=counts[ipv6], offset=starts),
+            np.frombuffer(buffer, dtype=address_dtype, count=counts[ipv6], offset=ends),
+            np.frombuffer(buffer, dtype=tag_dtype, count=counts[ipv6], offset=tags),
+            ipv6=ipv6,
+        )
+
+    return CidrIndex(
+        [tag.decode() for tag in tag_names.tolist()], indexes[False], indexes[True]
+    )
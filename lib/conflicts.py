@@ -0,0 +1,375 @@
+import numpy as np
+import pandas as pd
+
+from lib.intervals import (
+    boundaries,
+    format_networks,
+    last_addresses,
+    ordinals,
+    previous_addresses,
+    ranges_to_networks,
+)
+from lib.networks import TaggedNetworks
+
+# Overlapping CIDRs formatted at a time when the report is written
+OVERLAP_CHUNK_ROWS = 100_000
+
+
+def tag_ranks(tags, priority=None):
+    """
+    Ranks tags for conflict resolution, tags missing from the priority list
+    rank after the listed ones in alphabetical order
+
+    Args:
+        tags (Iterable[str]): Tags to rank
+        priority (list[str], optional): Tags from the highest to the lowest priority. Defaults to None.
+
+    Returns:
+        dict[str, int]: Rank of every tag, the lowest rank wins
+    """
+    priority = list(priority or [])
+    unlisted = sorted(set(tags) - set(priority))
+    return {tag: rank for rank, tag in enumerate(priority + unlisted)}
+
+
+def _resolve_ip_version(start, prefix, tag_codes, tags: list[str], ranks: dict, ipv6=False):
+    """
+    Finds the address ranges covered by more than one tag and carves them out
+    of every tag but the one with the highest priority
+
+    All interval boundaries split the address space into segments that every
+    tag either fully covers or not at all. A single sort of the boundaries and
+    a running sum per tag give the tags covering every segment, from which the
+    winner of every segment follows. CIDRs that lose no segment are kept as
+    they are, the segments the others keep are re-emitted as minimal CIDRs.
+
+    Args:
+        start (np.ndarray): Network addresses of a single IP version, the
+        networks of every tag must not overlap each other
+        prefix (np.ndarray): Prefix lengths
+        tag_codes (np.ndarray): Integer tag code of every network
+        tags (list[str]): Tags the tag codes refer to
+        ranks (dict[str, int]): Rank of every tag, None to only report overlaps
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        tuple: Network addresses, prefix lengths and tag codes of the resolved
+        networks, and the network addresses and prefix lengths of the overlaps
+        with the names of the 'Tags' covering them and of the 'Winner' keeping them
+    """
+    no_overlaps = _no_overlaps(ipv6)
+    if len(prefix) == 0:
+        return start, prefix, tag_codes, no_overlaps
+
+    end = last_addresses(start, prefix, ipv6=ipv6)
+    (wide_start, next_start), (start_keys, next_keys) = boundaries((start, end), ipv6=ipv6)
+    bound_keys, first = np.unique(np.concatenate([start_keys, next_keys]), return_index=True)
+    bound_addresses = np.concatenate([wide_start, next_start])[first]
+    start_bounds = np.searchsorted(bound_keys, start_keys)
+    next_bounds = np.searchsorted(bound_keys, next_keys)
+
+    # Which tags cover every segment between two consecutive boundaries
+    segments = len(bound_keys) - 1
+    covered = np.zeros((len(tags), segments), dtype=bool)
+    for code in range(len(tags)):
+        in_tag = tag_codes == code
+        steps = np.bincount(start_bounds[in_tag], minlength=len(bound_keys)) - np.bincount(
+            next_bounds[in_tag], minlength=len(bound_keys)
+        )
+        covered[code] = np.cumsum(steps)[:-1] > 0
+    is_overlap = covered.sum(axis=0) > 1
+    if not is_overlap.any():
+        return start, prefix, tag_codes, no_overlaps
+
+    winners = np.full(segments, -1, dtype=np.int64)
+    if ranks is not None:
+        for code in sorted(range(len(tags)), key=lambda code: ranks[tags[code]], reverse=True):
+            winners[covered[code]] = code
+
+    overlaps = _overlap_report(covered, is_overlap, winners, bound_addresses, tags, ipv6)
+    if ranks is None:
+        return start, prefix, tag_codes, overlaps
+
+    # Count the segments every CIDR loses to a tag of higher priority
+    lost = np.zeros(len(prefix), dtype=np.int64)
+    for code in range(len(tags)):
+        in_tag = np.flatnonzero(tag_codes == code)
+        lost_segments = np.concatenate([[0], np.cumsum(covered[code] & (winners != code))])
+        lost[in_tag] = lost_segments[next_bounds[in_tag]] - lost_segments[start_bounds[in_tag]]
+    is_carved = lost > 0
+
+    # The segments carved CIDRs keep, merged into runs and re-emitted as CIDRs
+    carved_ids = np.flatnonzero(is_carved)
+    lengths = next_bounds[carved_ids] - start_bounds[carved_ids]
+    segment_owners = np.repeat(carved_ids, lengths)
+    segment_ids = start_bounds[segment_owners] + (
+        np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    )
+    is_kept = winners[segment_ids] == tag_codes[segment_owners]
+    segment_ids, segment_owners = segment_ids[is_kept], segment_owners[is_kept]
+    is_new_run = np.ones(len(segment_ids), dtype=bool)
+    is_new_run[1:] = (segment_owners[1:] != segment_owners[:-1]) | (
+        segment_ids[1:] != segment_ids[:-1] + 1
+    )
+    is_run_end = np.ones(len(segment_ids), dtype=bool)
+    is_run_end[:-1] = is_new_run[1:]
+
+    kept_start = bound_addresses[segment_ids[is_new_run]]
+    if not ipv6:
+        kept_start = kept_start.astype(np.uint32)
+    kept_end = previous_addresses(bound_addresses[segment_ids[is_run_end] + 1], ipv6=ipv6)
+    network_start, network_prefix, range_indices = ranges_to_networks(kept_start, kept_end, ipv6=ipv6)
+    carved_codes = tag_codes[segment_owners[is_new_run]][range_indices]
+
+    return (
+        np.concatenate([start[~is_carved], network_start.astype(start.dtype)]),
+        np.concatenate([prefix[~is_carved], network_prefix.astype(prefix.dtype)]),
+        np.concatenate([tag_codes[~is_carved], carved_codes]),
+        overlaps,
+    )
+
+
+def _overlap_report(covered, is_overlap, winners, bound_addresses, tags, ipv6=False):
+    """Merges consecutive overlapping segments covered by the same tags into minimal CIDRs"""
+    # A run is cut wherever the covering tags or the winner change
+    is_new_run = np.ones(len(is_overlap), dtype=bool)
+    is_new_run[1:] = (
+        np.any(covered[:, 1:] != covered[:, :-1], axis=0)
+        | (winners[1:] != winners[:-1])
+        | (is_overlap[1:] != is_overlap[:-1])
+    )
+    is_run_end = np.ones(len(is_overlap), dtype=bool)
+    is_run_end[:-1] = is_new_run[1:]
+    run_starts = np.flatnonzero(is_new_run & is_overlap)
+    run_ends = np.flatnonzero(is_run_end & is_overlap)
+
+    range_start = bound_addresses[run_starts]
+    if not ipv6:
+        range_start = range_start.astype(np.uint32)
+    range_end = previous_addresses(bound_addresses[run_ends + 1], ipv6=ipv6)
+    network_start, prefix, range_indices = ranges_to_networks(range_start, range_end, ipv6=ipv6)
+
+    tag_names = np.asarray(tags, dtype=object)
+    # Runs covered by the same tags share one name instead of joining it per run
+    patterns, pattern_ids = np.unique(covered[:, run_starts].T, axis=0, return_inverse=True)
+    pattern_names = np.array([" & ".join(tag_names[pattern]) for pattern in patterns], dtype=object)
+    run_tags = pattern_names[pattern_ids.reshape(-1)][range_indices]
+    run_winners = winners[run_starts][range_indices]
+    # Without a priority every winner is -1 and picks the empty name
+    return network_start, prefix, run_tags, np.append(tag_names, "")[run_winners]
+
+
+def _no_overlaps(ipv6=False):
+    no_names = np.empty(0, dtype=object)
+    if ipv6:
+        return np.empty((0, 2), dtype=np.uint64), np.empty(0, dtype=np.uint8), no_names, no_names
+    return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint8), no_names, no_names
+
+
+class Overlaps:
+    """
+    CIDRs covered by more than one tag, held as arrays of network addresses
+    and prefix lengths per IP version with the names of the tags covering
+    every CIDR and of the winner keeping it. The CIDRs are only formatted
+    when the report is written, and the lines of the previous report are
+    reused for every CIDR that did not change since.
+    """
+
+    COLUMNS = ["Network", "Tags", "Winner"]
+
+    def __init__(self, versions: dict, checksum=None):
+        self.versions = versions
+        # SHA-256 checksum of the file the report was last written to
+        self.checksum = checksum
+
+    def __len__(self):
+        return sum(len(prefix) for _, prefix, _, _ in self.versions.values())
+
+    def frame(self):
+        """
+        Formats the overlaps as a DataFrame
+
+        Returns:
+            pd.DataFrame: 'Network', 'Tags' and 'Winner' of every overlap, IPv4 ones first
+        """
+        frames = [
+            pd.DataFrame(
+                {
+                    "Network": pd.Series(format_networks(start, prefix, ipv6=ipv6), dtype=object),
+                    "Tags": tags,
+                    "Winner": winners,
+                }
+            )
+            for ipv6, (start, prefix, tags, winners) in self.versions.items()
+        ]
+        return pd.concat(frames, ignore_index=True)
+
+    def counts(self):
+        """
+        Counts the overlapping CIDRs per covering tags and winner
+
+        Returns:
+            pd.Series: Number of CIDRs by 'Tags' and 'Winner'
+        """
+        names = {
+            column: np.concatenate([version[i] for version in self.versions.values()])
+            for i, column in enumerate(self.COLUMNS[1:], start=2)
+        }
+        return pd.DataFrame(names).groupby(["Tags", "Winner"], sort=True).size()
+
+    def _reused_lines(self, previous, ipv6=False):
+        """Finds the lines of the previous report for the CIDRs that are the same in both"""
+        start, prefix, tags, winners = self.versions[ipv6]
+        previous_start, previous_prefix, previous_tags, previous_winners = previous.versions[ipv6]
+        offset = 0 if not ipv6 else len(previous.versions[False][1])
+        reused = np.full(len(prefix), -1, dtype=np.int64)
+        if len(prefix) == 0 or len(previous_prefix) == 0:
+            return reused
+
+        # The CIDRs of both reports are disjoint and sorted by address
+        keys, previous_keys = ordinals(start, previous_start)
+        positions = np.minimum(np.searchsorted(previous_keys, keys), len(previous_keys) - 1)
+        is_same = (
+            (previous_keys[positions] == keys)
+            & (previous_prefix[positions] == prefix)
+            & (previous_tags[positions] == tags)
+            & (previous_winners[positions] == winners)
+        )
+        reused[is_same] = offset + positions[is_same]
+        return reused
+
+    def lines(self, previous=None, previous_lines=None):
+        """
+        Formats the overlaps as CSV lines without a header
+
+        Args:
+            previous (Overlaps, optional): Report that previous_lines were written
+            from, its lines are reused for the CIDRs of this report it has as well.
+            Defaults to None.
+            previous_lines (list[bytes], optional): CSV lines of the previous report. Defaults to None.
+
+        Yields:
+            bytes: Chunks of the lines, IPv4 ones first
+        """
+        for ipv6, (start, prefix, tags, winners) in self.versions.items():
+            if previous is None:
+                reused = np.full(len(prefix), -1, dtype=np.int64)
+            else:
+                reused = self._reused_lines(previous, ipv6=ipv6)
+            for first in range(0, len(prefix), OVERLAP_CHUNK_ROWS):
+                chunk = slice(first, first + OVERLAP_CHUNK_ROWS)
+                chunk_reused = reused[chunk]
+                is_new = chunk_reused < 0
+                new_rows = np.flatnonzero(is_new) + first
+                lines = np.empty(len(chunk_reused), dtype=object)
+                lines[~is_new] = [previous_lines[i] for i in chunk_reused[~is_new]]
+                lines[is_new] = [
+                    f"{network},{network_tags},{winner}".encode()
+                    for network, network_tags, winner in zip(
+                        format_networks(start[new_rows], prefix[new_rows], ipv6=ipv6),
+                        tags[new_rows],
+                        winners[new_rows],
+                    )
+                ]
+                yield b"".join(line + b"\n" for line in lines)
+
+    def save(self, path: str):
+        """
+        Saves the report as plain arrays to an .npz file
+
+        Args:
+            path (str): Path to the .npz file
+        """
+        arrays = {}
+        for ipv6, (start, prefix, tags, winners) in self.versions.items():
+            version = f"ipv{6 if ipv6 else 4}"
+            arrays[f"{version}_start"] = start
+            arrays[f"{version}_prefix"] = prefix
+            for column, names in (("tags", tags), ("winners", winners)):
+                codes, uniques = pd.factorize(names)
+                arrays[f"{version}_{column}_codes"] = codes
+                arrays[f"{version}_{column}_names"] = np.array(uniques, dtype=str)
+        with open(path, "wb") as f:
+            np.savez(f, checksum=np.array(self.checksum or ""), **arrays)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Loads a report saved by save
+
+        Args:
+            path (str): Path to the .npz file
+
+        Returns:
+            Overlaps: The saved report
+        """
+        with np.load(path) as saved:
+            versions = {}
+            for ipv6 in (False, True):
+                version = f"ipv{6 if ipv6 else 4}"
+                versions[ipv6] = (
+                    saved[f"{version}_start"],
+                    saved[f"{version}_prefix"],
+                    *(
+                        saved[f"{version}_{column}_names"].astype(object)[
+                            saved[f"{version}_{column}_codes"]
+                        ]
+                        for column in ("tags", "winners")
+                    ),
+                )
+            return cls(versions, str(saved["checksum"]) or None)
+
+
+def resolve_networks(networks: TaggedNetworks, priority=None):
+    """
+    Finds the addresses that more than one tag covers, e.g. Cloudflare ranges
+    that GeoLite2 also lists for a country, and leaves them to the tag with the
+    highest priority only
+
+    Args:
+        networks (TaggedNetworks): Cleaned networks of all tags
+        priority (list[str], optional): Tags from the highest to the lowest priority,
+        tags not listed rank after them alphabetically. Overlaps are only reported
+        and not resolved if not given. Defaults to None.
+
+    Returns:
+        tuple: Resolved networks and their Overlaps
+    """
+    print("\n*** Resolving overlaps between tags ***")
+    tags = networks.tags
+    ranks = tag_ranks(tags, priority) if priority else None
+
+    versions, overlap_versions = {}, {}
+    for ipv6 in (False, True):
+        *versions[ipv6], overlap_versions[ipv6] = _resolve_ip_version(
+            *networks.versions[ipv6], tags, ranks, ipv6=ipv6
+        )
+
+    overlaps = Overlaps(overlap_versions)
+    print(f"-> Found {len(overlaps)} overlapping CIDRs between tags")
+    return TaggedNetworks.from_arrays(tags, versions), overlaps
+
+
+def resolve_conflicts(cidr_df: pd.DataFrame, priority=None):
+    """
+    Resolves the overlaps between the tags of a CIDR DataFrame like resolve_networks
+
+    Args:
+        cidr_df (pd.DataFrame): Cleaned CIDR DataFrame of both IP versions
+        priority (list[str], optional): Tags from the highest to the lowest priority. Defaults to None.
+
+    Returns:
+        tuple: Resolved DataFrame sorted by tag and network address, and the
+        overlaps as a DataFrame of the 'Network', the 'Tags' covering it and
+        the 'Winner' keeping it
+    """
+    resolved, overlaps = resolve_networks(TaggedNetworks.from_frames([cidr_df]), priority)
+    return resolved.frame(), overlaps.frame()
+
+
+def pretty_print_overlaps(overlaps: Overlaps):
+    if len(overlaps):
+        print("Overlapping CIDRs between tags (winner)")
+        for (tags, winner), count in overlaps.counts().items():
+            print(f"{tags:<16} {winner or '-':<6} {'{:,}'.format(count)} CIDRs")
+        print()
@@ -1,19 +1,184 @@
+from io import BufferedReader, RawIOBase
+from os.path import getsize
+
 import pandas as pd
 
+from lib.cidr_utils import convert_iprange_to_cidr
+
+DBIP_COLUMNS = ["Range_Start", "Range_End", "Tag"]
+DBIP_DTYPES = {"Range_Start": str, "Range_End": str, "Tag": str}
+
+
+def load_dbip_csv(csv_path: str, tags: list[str]):
+    """
+    Reads a CSV file from DBIP once and keeps only the rows of the wanted countries
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file
+        tags (list[str]): Country codes in ISO to keep rows of
+
+    Returns:
+        DataFrame: DataFrame of the DBIP rows belonging to the given tags
+    """
+    dbip_df = pd.read_csv(
+        csv_path,
+        names=DBIP_COLUMNS,
+        usecols=DBIP_COLUMNS,
+        dtype=DBIP_DTYPES,
+    )
+    return dbip_df.loc[dbip_df["Tag"].isin(tags)]
+
+
+def read_dbip_csv_chunks(csv_path: str, tags: list[str], chunksize: int):
+    """
+    Reads a CSV file from DBIP in chunks, keeping only the rows of the wanted countries
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file
+        tags (list[str]): Country codes in ISO to keep rows of
+        chunksize (int): Number of rows to read at once
+
+    Yields:
+        DataFrame: DataFrame of the DBIP rows of a chunk belonging to the given tags
+    """
+    with pd.read_csv(
+        csv_path,
+        names=DBIP_COLUMNS,
+        usecols=DBIP_COLUMNS,
+        dtype=DBIP_DTYPES,
+        chunksize=chunksize,
+    ) as reader:
+        for dbip_df in reader:
+            yield dbip_df.loc[dbip_df["Tag"].isin(tags)]
+
 
-def extract_dbip_ip_versions(dbip_df: pd.DataFrame, tag: str):
+def extract_dbip_ip_versions(dbip_df: pd.DataFrame, tags: list[str]):
     """
-    Reads CSV file from DBIP
+    Splits DBIP rows of the given countries into IPv4 and IPv6
 
     Args:
         dbip_df (DataFrame): DataFrame of DBIP database.
-        tag (str): Country code in ISO to extract rows of.
+        tags (list[str]): Country codes in ISO to extract rows of.
 
     Returns:
         DataFrame: Two DataFrames containing IPv4 and IPv6 data
     """
-    dbip_df = dbip_df.loc[dbip_df["Tag"].isin([tag])]
-    df_ip4 = dbip_df.loc[~dbip_df["Range_Start"].str.contains(":")]
-    df_ip6 = dbip_df.loc[dbip_df["Range_Start"].str.contains(":")]
+    dbip_df = dbip_df.loc[dbip_df["Tag"].isin(tags)]
+    is_ipv6 = dbip_df["Range_Start"].str.contains(":", regex=False)
+    df_ip4 = dbip_df.loc[~is_ipv6]
+    df_ip6 = dbip_df.loc[is_ipv6]
 
     return df_ip4, df_ip6
+
+
+def iter_dbip_cidrs(csv_path, tags: list[str], chunksize=None):
+    """
+    Loads the CIDRs of the wanted countries from a CSV file from DBIP one chunk at a time
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file or a file object
+        tags (list[str]): Country codes in ISO to load CIDRs of
+        chunksize (int, optional): Number of rows to read at once, the whole file
+        is read at once if not given. Defaults to None.
+
+    Yields:
+        tuple: IPv4 and IPv6 CIDR DataFrames of a chunk
+    """
+    if chunksize:
+        dbip_chunks = read_dbip_csv_chunks(csv_path, tags, chunksize)
+    else:
+        dbip_chunks = [load_dbip_csv(csv_path, tags)]
+
+    for dbip_df in dbip_chunks:
+        dbip_ipv4, dbip_ipv6 = extract_dbip_ip_versions(dbip_df, tags)
+        # Convert IP ranges to CIDR
+        yield (
+            convert_iprange_to_cidr(dbip_ipv4, ipv6=False),
+            convert_iprange_to_cidr(dbip_ipv6, ipv6=True),
+        )
+
+
+def load_dbip_cidrs(csv_path, tags: list[str], chunksize=None):
+    """
+    Loads the CIDRs of the wanted countries from a CSV file from DBIP
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file or a file object
+        tags (list[str]): Country codes in ISO to load CIDRs of
+        chunksize (int, optional): Number of rows to read at once, the whole file
+        is read at once if not given. Defaults to None.
+
+    Returns:
+        DataFrame: Two DataFrames containing IPv4 and IPv6 CIDRs
+    """
+    ipv4_dfs, ipv6_dfs = zip(*iter_dbip_cidrs(csv_path, tags, chunksize=chunksize))
+    return (
+        pd.concat(ipv4_dfs, ignore_index=True),
+        pd.concat(ipv6_dfs, ignore_index=True),
+    )
+
+
+def dbip_partitions(csv_path: str, partitions: int, min_size=1 << 20):
+    """
+    Splits a CSV file from DBIP into byte ranges on line boundaries. DBIP files
+    are sorted by address, so every partition covers a contiguous address range.
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file
+        partitions (int): Maximum number of partitions
+        min_size (int, optional): Minimum size of a partition in bytes. Defaults to 1 MiB.
+
+    Returns:
+        list[tuple]: Start and end offsets of the partitions
+    """
+    size = getsize(csv_path)
+    partitions = max(1, min(partitions, size // min_size))
+    bounds = [0]
+    with open(csv_path, "rb") as f:
+        for i in range(1, partitions):
+            f.seek(max(size * i // partitions, bounds[-1]))
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+class _FileRange(RawIOBase):
+    """Reads a byte range of a file as if it was the whole file, without loading it"""
+
+    def __init__(self, path: str, start: int, end: int):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self._file.readinto(memoryview(buffer)[: max(0, min(len(buffer), self._remaining))])
+        self._remaining -= size
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def iter_dbip_partition(csv_path: str, start: int, end: int, tags: list[str], chunksize=None):
+    """
+    Loads the CIDRs of the wanted countries from a partition of a CSV file from DBIP,
+    reading it from the file one chunk at a time
+
+    Args:
+        csv_path (str): Path to the DBIP CSV file
+        start (int): Start offset of the partition
+        end (int): End offset of the partition
+        tags (list[str]): Country codes in ISO to load CIDRs of
+        chunksize (int, optional): Number of rows to read at once, the whole
+        partition is read at once if not given. Defaults to None.
+
+    Yields:
+        tuple: IPv4 and IPv6 CIDR DataFrames of a chunk
+    """
+    with BufferedReader(_FileRange(csv_path, start, end)) as partition:
+        yield from iter_dbip_cidrs(partition, tags, chunksize=chunksize)
@@ -0,0 +1,384 @@
+import gzip
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename, exists
+
+import pandas as pd
+
+from lib.cache import file_digest
+from lib.geoipdat import geoip_country_codes, geoip_entry
+from lib.geosite import format_geosite_rule
+from lib.networks import TaggedNetworks
+
+try:
+    import zstandard
+except ImportError:  # Only needed for zstd outputs
+    zstandard = None
+
+CHECKSUMS_FILE = "SHA256SUMS"
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Bytes gathered before they are handed to the files and compressors
+WRITE_BUFFER_SIZE = 1 << 20
+# Rows of a DataFrame converted to CSV at a time
+CSV_CHUNK_ROWS = 100_000
+ASN_CSV_COLUMNS = ["Network", "Tag", "ASN", "Organization"]
+# Threads writing the files of different tags at the same time, compression and
+# file writes release the GIL
+EXPORT_WORKERS = min(8, os.cpu_count() or 1)
+GEOIP_DAT_FILE = "geoip-custom.dat"
+
+
+class _HashingFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.digest = hashlib.sha256()
+        self._file = open(path, "wb")
+
+    def write(self, data: bytes):
+        self.digest.update(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def check_compressions(compressions):
+    """
+    Checks that the compressed outputs can be written before the build starts
+
+    Args:
+        compressions (Iterable[str]): Compressions wanted, any of 'gzip' and 'zstd'
+
+    Raises:
+        ValueError: If a compression is not supported
+        ImportError: If zstd is wanted but the zstandard package is not installed
+    """
+    for compression in compressions:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression '{compression}'")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd outputs need the zstandard package")
+
+
+def _open_compressed(compression: str, raw: _HashingFile):
+    if compression == "gzip":
+        # Without a name and timestamp the archives are reproducible
+        return gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+    return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+
+
+class ExportWriter:
+    """
+    Writes an output file together with its compressed copies in a single pass
+    over the data, buffering the writes and calculating the SHA-256 checksum of
+    every file written along the way.
+    """
+
+    def __init__(self, path: str, compressions=()):
+        self.path = path
+        self._buffer = []
+        self._buffered = 0
+        self._raw_files = [_HashingFile(path)]
+        self._streams = [self._raw_files[0]]
+        for compression in compressions:
+            raw = _HashingFile(f"{path}{COMPRESSIONS[compression]}")
+            self._raw_files.append(raw)
+            self._streams.append(_open_compressed(compression, raw))
+
+    def write(self, data: bytes):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= WRITE_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        data = b"".join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        for stream in self._streams:
+            stream.write(data)
+
+    def close(self):
+        """
+        Flushes and closes all files
+
+        Returns:
+            dict[str, str]: SHA-256 checksum of every file written by its name
+        """
+        self.flush()
+        for stream in self._streams[1:]:
+            stream.close()
+        for raw in self._raw_files:
+            raw.close()
+        return {basename(raw.path): raw.digest.hexdigest() for raw in self._raw_files}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.checksums = self.close()
+
+
+def _write_lines(path: str, lines: list[str], compressions=()):
+    with ExportWriter(path, compressions) as writer:
+        if lines:
+            writer.write(("\n".join(lines) + "\n").encode())
+    return writer.checksums
+
+
+def write_sections(cleaned: TaggedNetworks, manifest):
+    """
+    Saves the cleaned CIDRs of every tag to its section, so that incremental
+    builds can reuse the tags whose inputs did not change
+
+    Args:
+        cleaned (TaggedNetworks): Cleaned networks
+        manifest (BuildManifest): Manifest holding the sections
+    """
+    for tag in cleaned.tags:
+        cleaned.save(manifest.section_path(tag), tag)
+
+
+def read_sections(manifest, tags: list[str]):
+    """
+    Loads the cleaned CIDRs of the given tags from their sections
+
+    Args:
+        manifest (BuildManifest): Manifest holding the sections
+        tags (list[str]): Tags to load
+
+    Returns:
+        TaggedNetworks: Cleaned networks of the tags
+    """
+    return TaggedNetworks.load({tag: manifest.section_path(tag) for tag in tags})
+
+
+def _read_section(sections, tag: str, suffix: str):
+    with open(sections.section_path(tag, suffix), "rb") as f:
+        return f.read()
+
+
+def _write_section(sections, tag: str, suffix: str, data: bytes):
+    if sections is not None:
+        with open(sections.section_path(tag, suffix), "wb") as f:
+            f.write(data)
+
+
+def _map_tags(function, tags: list[str]):
+    """
+    Calls a function on every tag in a thread pool, yielding the results in the
+    order of the tags. No more than one tag per thread is held at a time, so the
+    results can be written to a single file as they come in.
+    """
+    with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as executor:
+        pending = deque()
+        for tag in tags:
+            pending.append(executor.submit(function, tag))
+            if len(pending) >= EXPORT_WORKERS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def export_networks(
+    build_dir: str, networks: TaggedNetworks, compressions=(), sections=None, reused=()
+):
+    """
+    Exports the CIDRs of every tag to its text file and the CIDRs of all tags
+    to 'agg_cidrs.csv' in a single pass. The tags are formatted and their text
+    files written in a thread pool, their rows are added to 'agg_cidrs.csv' in
+    the order of the tags.
+
+    Args:
+        build_dir (str): Path to the build directory
+        networks (TaggedNetworks): Networks of all tags
+        compressions (Iterable[str], optional): Compressed copies of the files
+        to write, any of 'gzip' and 'zstd'. Defaults to ().
+        sections (BuildManifest, optional): Manifest to save the 'csv' section
+        of every tag to, its rows of 'agg_cidrs.csv'. Defaults to None.
+        reused (Iterable[str], optional): Tags whose text files and sections of
+        the last build are kept as they are. Defaults to ().
+
+    Returns:
+        dict[str, str]: SHA-256 checksum of every file written by its name
+    """
+
+    def export_tag(tag: str):
+        if tag in reused:
+            return {}, _read_section(sections, tag, "csv")
+        tag_networks = networks.networks(tag)
+        tag_checksums = _write_lines(
+            f"{build_dir}/geoip_{tag.lower()}.txt", tag_networks, compressions
+        )
+        rows = "".join(f"{network},{tag}\n" for network in tag_networks).encode()
+        _write_section(sections, tag, "csv", rows)
+        return tag_checksums, rows
+
+    checksums = {}
+    with ExportWriter(f"{build_dir}/agg_cidrs.csv", compressions) as merged:
+        merged.write(b"Network,Tag\n")
+        for tag_checksums, rows in _map_tags(export_tag, networks.tags):
+            checksums.update(tag_checksums)
+            merged.write(rows)
+    checksums.update(merged.checksums)
+    return checksums
+
+
+def _csv_chunks(df: pd.DataFrame, header=True):
+    # Rows are converted in chunks, so that the CSV text of the whole frame is never built
+    if header:
+        yield df.iloc[:0].to_csv(index=False).encode()
+    for first in range(0, len(df), CSV_CHUNK_ROWS):
+        yield df.iloc[first : first + CSV_CHUNK_ROWS].to_csv(index=False, header=False).encode()
+
+
+def write_geoip_dat(
+    build_dir: str, networks: TaggedNetworks, names=None, compressions=(), sections=None, reused=()
+):
+    """
+    Writes the CIDRs of all tags to 'geoip-custom.dat' for v2ray/xray, one entry
+    per tag encoded in a thread pool. The name keeps it apart from the geoip.dat
+    that v2fly/geoip builds with the third-party lists in the release workflow.
+
+    Args:
+        build_dir (str): Path to the build directory
+        networks (TaggedNetworks): Networks of all tags
+        names (dict[str, str], optional): Country codes of tags that are not
+        written under their own name. Defaults to None.
+        compressions (Iterable[str], optional): Compressed copies to write,
+        any of 'gzip' and 'zstd'. Defaults to ().
+        sections (BuildManifest, optional): Manifest to save the 'dat' section
+        of every tag to, its encoded entry. Defaults to None.
+        reused (Iterable[str], optional): Tags whose sections of the last build
+        are kept as they are. Defaults to ().
+
+    Returns:
+        dict[str, str]: SHA-256 checksum of every file written by its name
+    """
+    country_codes = geoip_country_codes(networks.tags, names)
+
+    def encode_tag(tag: str):
+        if tag in reused:
+            return _read_section(sections, tag, "dat")
+        entry = geoip_entry(networks, tag, country_codes[tag])
+        _write_section(sections, tag, "dat", entry)
+        return entry
+
+    with ExportWriter(f"{build_dir}/{GEOIP_DAT_FILE}", compressions) as writer:
+        for entry in _map_tags(encode_tag, list(country_codes)):
+            writer.write(entry)
+    return writer.checksums
+
+
+def write_asn_csv(build_dir: str, annotated_dfs, compressions=(), sections=None):
+    """
+    Writes the merged CIDRs annotated with their ASNs to 'agg_cidrs_asn.csv'
+
+    Args:
+        build_dir (str): Path to the build directory
+        annotated_dfs (Iterable[tuple]): Tags with their CIDRs with 'ASN' and
+        'Organization' columns, None for tags whose section of the last build
+        is kept as it is
+        compressions (Iterable[str], optional): Compressed copies to write,
+        any of 'gzip' and 'zstd'. Defaults to ().
+        sections (BuildManifest, optional): Manifest to save the 'asn.csv'
+        section of every tag to, its rows of 'agg_cidrs_asn.csv'. Defaults to None.
+
+    Returns:
+        dict[str, str]: SHA-256 checksum of every file written by its name
+    """
+    with ExportWriter(f"{build_dir}/agg_cidrs_asn.csv", compressions) as writer:
+        writer.write((",".join(ASN_CSV_COLUMNS) + "\n").encode())
+        for tag, annotated_df in annotated_dfs:
+            if annotated_df is None:
+                writer.write(_read_section(sections, tag, "asn.csv"))
+                continue
+            chunks = list(_csv_chunks(annotated_df[ASN_CSV_COLUMNS], header=False))
+            for chunk in chunks:
+                writer.write(chunk)
+            _write_section(sections, tag, "asn.csv", b"".join(chunks))
+    return writer.checksums
+
+
+def write_overlap_report(build_dir: str, overlaps, previous=None):
+    """
+    Writes the CIDRs covered by more than one tag to 'overlaps.csv'
+
+    Args:
+        build_dir (str): Path to the build directory
+        overlaps (Overlaps): Overlaps to write
+        previous (Overlaps, optional): Report of the last build, its lines are
+        reused if the file still holds them. Defaults to None.
+
+    Returns:
+        dict[str, str]: SHA-256 checksum of every file written by its name
+    """
+    path = f"{build_dir}/overlaps.csv"
+    previous_lines = None
+    if previous is not None and exists(path) and file_digest(path) == previous.checksum:
+        with open(path, "rb") as f:
+            previous_lines = f.read().split(b"\n")[1:-1]
+    if previous_lines is None or len(previous_lines) != len(previous):
+        previous = previous_lines = None
+
+    with ExportWriter(path) as writer:
+        writer.write((",".join(overlaps.COLUMNS) + "\n").encode())
+        for chunk in overlaps.lines(previous, previous_lines):
+            writer.write(chunk)
+    overlaps.checksum = writer.checksums["overlaps.csv"]
+    return writer.checksums
+
+
+def write_geosite_lists(build_dir: str, compiled: dict[str, list[tuple]], compressions=()):
+    """
+    Writes every compiled geosite list to its 'geosite_<name>.txt' file
+
+    Args:
+        build_dir (str): Path to the build directory
+        compiled (dict[str, list[tuple]]): Rules of every list by its name
+        compressions (Iterable[str], optional): Compressed copies to write,
+        any of 'gzip' and 'zstd'. Defaults to ().
+
+    Returns:
+        dict[str, str]: SHA-256 checksum of every file written by its name
+    """
+    checksums = {}
+    for name, rules in compiled.items():
+        checksums.update(
+            _write_lines(
+                f"{build_dir}/geosite_{name}.txt",
+                [format_geosite_rule(rule) for rule in rules],
+                compressions,
+            )
+        )
+    return checksums
+
+
+def write_checksums(build_dir: str, checksums: dict[str, str]):
+    """
+    Updates the checksum manifest of the build directory in the format of
+    sha256sum, files that were not rewritten keep their previous checksum
+    and files that no longer exist are dropped
+
+    Args:
+        build_dir (str): Path to the build directory
+        checksums (dict[str, str]): SHA-256 checksum of every file written by its name
+    """
+    checksums_path = f"{build_dir}/{CHECKSUMS_FILE}"
+    entries = {}
+    if exists(checksums_path):
+        with open(checksums_path) as f:
+            for line in f:
+                checksum, name = line.rstrip("\n").split("  ", 1)
+                entries[name] = checksum
+    entries.update(checksums)
+
+    with open(checksums_path, "w") as f:
+        for name, checksum in sorted(entries.items()):
+            if exists(f"{build_dir}/{name}"):
+                f.write(f"{checksum}  {name}\n")
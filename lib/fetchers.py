@@ -1,12 +1,13 @@
 #!/usr/bin/env python
+import hashlib
+import json
 import os
-import sys
-import zipfile
-import socket
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Check for Tomli
 try:
@@ -21,17 +22,178 @@ except ModuleNotFoundError:
         exit(0)
 
 
-def fetch_remote_ip_list(url: str, network_tag: str, proxies=None):
-    ip_list = []
-    df = pd.DataFrame()
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.149 Safari/537.36"
-    }
-    response = requests.get(url, headers=headers, proxies=proxies)
-    data = response.content.decode()
-    for entry in data.split():
-        ip_list.append(entry)
-    if ip_list:
-        df = pd.DataFrame(ip_list, columns=["Network"])
-        df["Tag"] = network_tag
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.149 Safari/537.36"
+}
+DEFAULT_TIMEOUT = 30
+
+
+class RemoteListCache:
+    """
+    Keeps the last good copy of every remote list on disk together with its
+    ETag and Last-Modified validators, so unchanged lists can be revalidated
+    with a conditional request and failed fetches can fall back to them.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, url: str):
+        return f"{self.cache_dir}/{hashlib.sha256(url.encode()).hexdigest()}"
+
+    def validators(self, url: str):
+        """
+        Builds the conditional request headers of a cached list
+
+        Args:
+            url (str): URL of the list
+
+        Returns:
+            dict: If-None-Match and If-Modified-Since headers, empty if the list is not cached
+        """
+        meta_path = f"{self._entry_path(url)}.json"
+        if not os.path.exists(meta_path) or not os.path.exists(self._entry_path(url)):
+            return {}
+        with open(meta_path) as f:
+            meta = json.load(f)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, url: str):
+        if not os.path.exists(self._entry_path(url)):
+            return None
+        with open(self._entry_path(url), "rb") as f:
+            return f.read()
+
+    def store(self, url: str, content: bytes, etag=None, last_modified=None):
+        with open(f"{self._entry_path(url)}.tmp", "wb") as f:
+            f.write(content)
+        os.replace(f"{self._entry_path(url)}.tmp", self._entry_path(url))
+        with open(f"{self._entry_path(url)}.json", "w") as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+
+
+def create_session(retries=3, backoff_factor=1.0, pool_size=10):
+    """
+    Creates an HTTP session with connection pooling and retries with exponential backoff
+
+    Args:
+        retries (int, optional): Number of retries on connection errors and 429/5xx responses. Defaults to 3.
+        backoff_factor (float, optional): Backoff factor between retries in seconds. Defaults to 1.0.
+        pool_size (int, optional): Number of pooled connections per host. Defaults to 10.
+
+    Returns:
+        requests.Session: HTTP session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _empty_ip_list():
+    return pd.DataFrame(columns=["Network", "Tag"])
+
+
+def _parse_ip_list(content: bytes, network_tag: str):
+    ip_list = content.decode().split()
+    if not ip_list:
+        return _empty_ip_list()
+    df = pd.DataFrame(ip_list, columns=["Network"])
+    df["Tag"] = network_tag
     return df
+
+
+def fetch_remote_ip_list(
+    url: str,
+    network_tag: str,
+    proxies=None,
+    timeout=DEFAULT_TIMEOUT,
+    session=None,
+    cache=None,
+):
+    """
+    Fetches a whitespace-separated list of CIDRs
+
+    Args:
+        url (str): URL of the list
+        network_tag (str): Tag to assign to the CIDRs
+        proxies (dict, optional): Proxies to pass to requests. Defaults to None.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to DEFAULT_TIMEOUT.
+        session (requests.Session, optional): Session to send the request with. Defaults to a new one.
+        cache (RemoteListCache, optional): Cache of the last good copies. Defaults to None.
+
+    Returns:
+        DataFrame: DataFrame with 'Network' and 'Tag' columns containing the CIDRs,
+        without rows if the list is empty or could not be fetched
+    """
+    session = session or create_session()
+    headers = cache.validators(url) if cache else {}
+    try:
+        response = session.get(url, headers=headers, proxies=proxies, timeout=timeout)
+        if response.status_code == 304 and cache:
+            print(f"-> {url} has not changed")
+            return _parse_ip_list(cache.load(url), network_tag)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        content = cache.load(url) if cache else None
+        if content is None:
+            print(f"-> Failed to fetch {url}: {e}")
+            return _empty_ip_list()
+        print(f"-> Failed to fetch {url}, falling back to the last good copy: {e}")
+        return _parse_ip_list(content, network_tag)
+
+    if cache:
+        cache.store(
+            url,
+            response.content,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    return _parse_ip_list(response.content, network_tag)
+
+
+def fetch_remote_ip_lists(remote_lists: list[dict], cache_dir=None, max_workers=8):
+    """
+    Fetches many lists of CIDRs concurrently over a shared pooled session
+
+    Args:
+        remote_lists (list[dict]): Lists to fetch, each with 'url' and 'tag' and
+        optionally 'proxies' and 'timeout' keys
+        cache_dir (str, optional): Directory to keep the last good copies in. Defaults to None.
+        max_workers (int, optional): Maximum number of concurrent requests. Defaults to 8.
+
+    Returns:
+        list[DataFrame]: DataFrames containing the CIDRs of every list, in the given order
+    """
+    cache = RemoteListCache(cache_dir) if cache_dir else None
+    session = create_session(pool_size=max_workers)
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                fetch_remote_ip_list,
+                remote_list["url"],
+                remote_list["tag"],
+                proxies=remote_list.get("proxies"),
+                timeout=remote_list.get("timeout", DEFAULT_TIMEOUT),
+                session=session,
+                cache=cache,
+            )
+            for remote_list in remote_lists
+        ]
+        return [future.result() for future in futures]
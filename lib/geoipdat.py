@@ -0,0 +1,139 @@
+import numpy as np
+
+from lib.intervals import merge_intervals, ranges_to_networks
+from lib.networks import TaggedNetworks
+
+# geoip.dat is a v2ray GeoIPList protobuf message:
+#   GeoIPList  repeated GeoIP entry = 1
+#   GeoIP      string country_code = 1, repeated CIDR cidr = 2, bool reverse_match = 3
+#   CIDR       bytes ip = 1, uint32 prefix = 2
+# Fields holding their default value, e.g. a prefix of 0, are left out as proto3 does.
+VARINT = 0
+LENGTH_DELIMITED = 2
+
+
+def _key(field: int, wire_type: int):
+    return (field << 3) | wire_type
+
+
+def _varint(value: int):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_cidrs(start: np.ndarray, prefix: np.ndarray, ipv6=False):
+    """
+    Encodes networks as the repeated 'cidr' field of a GeoIP message, every
+    network becomes one fixed-width row of bytes of which only the fields
+    it needs are kept
+
+    Args:
+        start (np.ndarray): Network addresses
+        prefix (np.ndarray): Prefix lengths
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        bytes: Encoded fields
+    """
+    size = 16 if ipv6 else 4
+    packed = np.asarray(start, dtype=">u8" if ipv6 else ">u4").view(np.uint8).reshape(-1, size)
+    prefix = np.asarray(prefix, dtype=np.int64)
+    # A prefix of 128 takes two varint bytes, every other one a single byte
+    prefix_size = np.where(prefix == 0, 0, np.where(prefix < 0x80, 2, 3))
+
+    # cidr key, CIDR length, ip key, ip length, ip, prefix key, prefix varint
+    rows = np.zeros((len(prefix), 4 + size + 3), dtype=np.uint8)
+    rows[:, 0] = _key(2, LENGTH_DELIMITED)
+    rows[:, 1] = 2 + size + prefix_size
+    rows[:, 2] = _key(1, LENGTH_DELIMITED)
+    rows[:, 3] = size
+    rows[:, 4 : 4 + size] = packed
+    rows[:, 4 + size] = _key(2, VARINT)
+    rows[:, 5 + size] = (prefix & 0x7F) | np.where(prefix >= 0x80, 0x80, 0)
+    rows[:, 6 + size] = prefix >> 7
+    is_kept = np.arange(rows.shape[1]) < (4 + size + prefix_size)[:, None]
+    return rows[is_kept].tobytes()
+
+
+def _tag_networks(networks: TaggedNetworks, tag: str, ipv6=False):
+    """Merges the networks of a tag into its minimal cover, ordered by address"""
+    start, end = networks.intervals(tag, ipv6=ipv6)
+    start_indices, end_indices = merge_intervals(start, end)
+    network_start, prefix, _ = ranges_to_networks(start[start_indices], end[end_indices], ipv6=ipv6)
+    return network_start, prefix
+
+
+def geoip_country_codes(tags: list[str], names=None):
+    """
+    Finds the country code every tag is written under in geoip.dat
+
+    Args:
+        tags (list[str]): Tags to write
+        names (dict[str, str], optional): Country codes of tags that are not
+        written under their own name. Defaults to None.
+
+    Raises:
+        ValueError: If tags share a country code
+
+    Returns:
+        dict[str, str]: Country code of every tag, ordered by country code
+    """
+    names = names or {}
+    country_codes = {tag: names.get(tag, tag).upper() for tag in tags}
+    if len(set(country_codes.values())) != len(country_codes):
+        raise ValueError(f"Tags share a country code in geoip.dat: {country_codes}")
+    return dict(sorted(country_codes.items(), key=lambda item: item[1]))
+
+
+def geoip_entry(networks: TaggedNetworks, tag: str, country_code: str):
+    """
+    Encodes the networks of a tag as an entry of a v2ray GeoIPList, merged into
+    their minimal cover with the IPv4 networks ahead of the IPv6 ones the way
+    v2fly/geoip writes them
+
+    Args:
+        networks (TaggedNetworks): Networks of all tags
+        tag (str): Tag to encode
+        country_code (str): Country code of the entry
+
+    Returns:
+        bytes: Encoded entry
+    """
+    country_code = country_code.encode()
+    cidrs = b"".join(
+        encode_cidrs(*_tag_networks(networks, tag, ipv6=ipv6), ipv6=ipv6)
+        for ipv6 in (False, True)
+    )
+    entry_size = 1 + len(_varint(len(country_code))) + len(country_code) + len(cidrs)
+    return (
+        bytes([_key(1, LENGTH_DELIMITED)])
+        + _varint(entry_size)
+        + bytes([_key(1, LENGTH_DELIMITED)])
+        + _varint(len(country_code))
+        + country_code
+        + cidrs
+    )
+
+
+def geoip_entries(networks: TaggedNetworks, names=None):
+    """
+    Encodes the networks of every tag as an entry of a v2ray GeoIPList, see
+    geoip_entry. Entries are ordered by country code.
+
+    Args:
+        networks (TaggedNetworks): Networks of all tags
+        names (dict[str, str], optional): Country codes of tags that are not
+        written under their own name. Defaults to None.
+
+    Raises:
+        ValueError: If tags share a country code
+
+    Yields:
+        bytes: Encoded entries, which concatenated make up geoip.dat
+    """
+    for tag, country_code in geoip_country_codes(networks.tags, names).items():
+        yield geoip_entry(networks, tag, country_code)
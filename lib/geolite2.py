@@ -1,5 +1,31 @@
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
+from lib.intervals import containing_intervals, merge_intervals, parse_networks
+from lib.networks import TaggedNetworks
+
+GEOLITE2_CSV_FILES = [
+    "GeoLite2-Country-Locations-en.csv",
+    "GeoLite2-Country-Blocks-IPv4.csv",
+    "GeoLite2-Country-Blocks-IPv6.csv",
+]
+GEOLITE2_ASN_CSV_FILES = [
+    "GeoLite2-ASN-Blocks-IPv4.csv",
+    "GeoLite2-ASN-Blocks-IPv6.csv",
+]
+GEOLITE2_ASN_DTYPES = {
+    "network": str,
+    "autonomous_system_number": "Int64",
+    "autonomous_system_organization": str,
+}
+GEOLITE2_BLOCK_DTYPES = {
+    "network": str,
+    "geoname_id": "Int64",
+    "registered_country_geoname_id": "Int64",
+}
+
 
 def get_geolite2_id(geolite2_countries_df: pd.DataFrame, country: str):
     """
@@ -18,63 +44,318 @@ def get_geolite2_id(geolite2_countries_df: pd.DataFrame, country: str):
     return int(str(geoid.values[0]))
 
 
-def extract_geolite2_cidrs(geolite2_ipblocks: pd.DataFrame, geoid: int, tag: str):
+def get_geolite2_ids(geolite2_countries_df: pd.DataFrame, countries: dict[str, str]):
+    """
+    Extracts GeoIDs of the given countries from the 'geolite2-Country-Locations-en.csv'
+
+    Args:
+        geolite2_countries_df: DataFrame loaded from 'geolite2-Country-Locations-en.csv' file
+        countries (dict[str, str]): Mapping of country names to their ISO tags
+
+    Returns:
+        dict[int, str]: Mapping of GeoIDs to ISO tags
+    """
+    matched_df = geolite2_countries_df.loc[
+        geolite2_countries_df["country_name"].isin(countries.keys())
+    ]
+    return {
+        int(geoid): countries[name]
+        for geoid, name in zip(matched_df["geoname_id"], matched_df["country_name"])
+    }
+
+
+def load_geolite2_blocks(csv_path: str):
     """
-    Extracts CIDR data from the 'geolite2-Country-Blocks-IPv*.csv' files
+    Reads a 'geolite2-Country-Blocks-IPv*.csv' file with only the columns needed for extraction
+
+    Args:
+        csv_path (str): Path to the GeoLite2 blocks CSV file
+
+    Returns:
+        DataFrame: DataFrame of network and GeoID columns
+    """
+    return pd.read_csv(
+        csv_path,
+        usecols=GEOLITE2_BLOCK_DTYPES.keys(),
+        dtype=GEOLITE2_BLOCK_DTYPES,
+    )
+
+
+def read_geolite2_blocks_chunks(csv_path: str, chunksize: int):
+    """
+    Reads a 'geolite2-Country-Blocks-IPv*.csv' file in chunks with only the columns needed for extraction
+
+    Args:
+        csv_path (str): Path to the GeoLite2 blocks CSV file
+        chunksize (int): Number of rows to read at once
+
+    Yields:
+        DataFrame: DataFrame of network and GeoID columns of a chunk
+    """
+    with pd.read_csv(
+        csv_path,
+        usecols=GEOLITE2_BLOCK_DTYPES.keys(),
+        dtype=GEOLITE2_BLOCK_DTYPES,
+        chunksize=chunksize,
+    ) as reader:
+        yield from reader
+
+
+def extract_geolite2_cidrs(geolite2_ipblocks: pd.DataFrame, geoids: dict[int, str]):
+    """
+    Extracts CIDR data of all the wanted countries from the 'geolite2-Country-Blocks-IPv*.csv' files
 
     Args:
         geolite2_ipblocks: DataFrame loaded from 'geolite2-Country-Blocks-IPv*.csv'
-        geoid (int): GeoID of the CIDRs to extract
-        tag (str): Country ISO code to append at the end
+        geoids (dict[int, str]): Mapping of GeoIDs of the CIDRs to extract to their ISO tags
 
     Returns:
         DataFrame: DataFrame containing CIDR data
     """
     extracted_df = geolite2_ipblocks.loc[
-        (geolite2_ipblocks["geoname_id"] == geoid)
-        & (geolite2_ipblocks["registered_country_geoname_id"] == geoid)
+        (geolite2_ipblocks["geoname_id"].isin(geoids.keys()))
+        & (
+            geolite2_ipblocks["registered_country_geoname_id"]
+            == geolite2_ipblocks["geoname_id"]
+        )
     ]
-    extracted_df = extracted_df.drop(
-        columns=[
-            "geoname_id",
-            "registered_country_geoname_id",
-            "represented_country_geoname_id",
-            "is_anonymous_proxy",
-            "is_satellite_provider",
-        ]
+    return pd.DataFrame(
+        {
+            "Network": extracted_df["network"].to_numpy(),
+            "Tag": extracted_df["geoname_id"].map(geoids).to_numpy(),
+        }
     )
-    extracted_df = extracted_df.rename(columns={"network": "Network"})
-    extracted_df["Tag"] = tag
-    return extracted_df
 
 
-def extract_geo_networks(geo_id: int):
-    asn_df = pd.read_csv("./resources/geolite2/GeoLite2-ASN-Blocks-IPv4.csv")
-    cidr_df = pd.read_csv("./resources/geolite2/GeoLite2-Country-Blocks-IPv4.csv")
+def iter_geolite2_cidrs(
+    geolite2_db_dir: str, countries: dict[str, str], chunksize=None, versions=(4, 6)
+):
+    """
+    Loads the CIDRs of the wanted countries from the GeoLite2 country CSV files
+    one chunk at a time
+
+    Args:
+        geolite2_db_dir (str): Path to the directory of the GeoLite2 CSV files
+        countries (dict[str, str]): Mapping of country names to their ISO tags
+        chunksize (int, optional): Number of rows to read at once, the whole files
+        are read at once if not given. Defaults to None.
+        versions (tuple, optional): IP versions to load. Defaults to (4, 6).
 
-    print("Filtering CIDRs based on Geo ID...")
-    cidr_df = cidr_df.loc[
-        (cidr_df["geoname_id"].isin([geo_id]))
-        & (cidr_df["registered_country_geoname_id"].isin([geo_id]))
-    ]
-    cidr_df = cidr_df.drop(
-        columns=[
-            "geoname_id",
-            "registered_country_geoname_id",
-            "represented_country_geoname_id",
-            "is_anonymous_proxy",
-            "is_satellite_provider",
-        ]
+    Yields:
+        tuple: IPv4 and IPv6 CIDR DataFrames of a chunk, one of them empty
+    """
+    geolite2_countries_df = pd.read_csv(
+        f"{geolite2_db_dir}/GeoLite2-Country-Locations-en.csv",
+        usecols=["geoname_id", "country_name"],
+    )
+    geo_ids = get_geolite2_ids(geolite2_countries_df, countries)
+
+    for version in versions:
+        blocks_csv = f"{geolite2_db_dir}/GeoLite2-Country-Blocks-IPv{version}.csv"
+        if chunksize:
+            blocks_chunks = read_geolite2_blocks_chunks(blocks_csv, chunksize)
+        else:
+            blocks_chunks = [load_geolite2_blocks(blocks_csv)]
+
+        for blocks_df in blocks_chunks:
+            cidr_df = extract_geolite2_cidrs(blocks_df, geo_ids)
+            empty_df = pd.DataFrame(columns=["Network", "Tag"])
+            yield (cidr_df, empty_df) if version == 4 else (empty_df, cidr_df)
+
+
+def load_geolite2_cidrs(
+    geolite2_db_dir: str, countries: dict[str, str], chunksize=None, versions=(4, 6)
+):
+    """
+    Loads the CIDRs of the wanted countries from the GeoLite2 country CSV files
+
+    Args:
+        geolite2_db_dir (str): Path to the directory of the GeoLite2 CSV files
+        countries (dict[str, str]): Mapping of country names to their ISO tags
+        chunksize (int, optional): Number of rows to read at once, the whole files
+        are read at once if not given. Defaults to None.
+        versions (tuple, optional): IP versions to load, the DataFrames of the others
+        are left empty. Defaults to (4, 6).
+
+    Returns:
+        DataFrame: Two DataFrames containing IPv4 and IPv6 CIDRs
+    """
+    chunks = list(iter_geolite2_cidrs(geolite2_db_dir, countries, chunksize, versions))
+    return tuple(
+        pd.concat(
+            [chunk[i] for chunk in chunks] or [pd.DataFrame(columns=["Network", "Tag"])],
+            ignore_index=True,
+        )
+        for i in range(2)
+    )
+
+
+def load_asn_blocks(csv_path: str):
+    """
+    Reads a 'GeoLite2-ASN-Blocks-IPv*.csv' file
+
+    Args:
+        csv_path (str): Path to the GeoLite2 ASN blocks CSV file
+
+    Returns:
+        DataFrame: DataFrame of network, ASN and organization columns
+    """
+    return pd.read_csv(
+        csv_path,
+        usecols=GEOLITE2_ASN_DTYPES.keys(),
+        dtype=GEOLITE2_ASN_DTYPES,
+    )
+
+
+def _matched_asns(asn_blocks: pd.DataFrame, matches: np.ndarray):
+    """'ASN' and 'Organization' of the matched blocks, missing where the match is -1"""
+    if asn_blocks.empty:
+        return pd.DataFrame(
+            {
+                "ASN": pd.array([pd.NA] * len(matches), dtype="Int64"),
+                "Organization": pd.array([pd.NA] * len(matches), dtype=object),
+            }
+        )
+
+    is_match = matches >= 0
+    matched = asn_blocks.iloc[np.maximum(matches, 0)].reset_index(drop=True)
+    return pd.DataFrame(
+        {
+            "ASN": matched["autonomous_system_number"].astype("Int64").where(is_match),
+            "Organization": matched["autonomous_system_organization"].where(is_match),
+        }
     )
 
+
+def join_asn_blocks(networks: pd.Series, asn_blocks: pd.DataFrame, ipv6=False):
+    """
+    Finds the ASN block containing the network address of every network with
+    a sorted-interval join, networks wider than their block get its ASN too
+
+    Args:
+        networks (pd.Series): CIDRs of a single IP version
+        asn_blocks (pd.DataFrame): ASN blocks of the same IP version
+        ipv6 (bool, optional): Whether the CIDRs are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        DataFrame: 'ASN' and 'Organization' of every network, missing where no block matches
+    """
+    if networks.empty or asn_blocks.empty:
+        return _matched_asns(asn_blocks.iloc[:0], np.full(len(networks), -1))
+
+    start, _, _ = parse_networks(networks.astype(str), ipv6=ipv6)
+    block_start, block_end, _ = parse_networks(asn_blocks["network"], ipv6=ipv6)
+    return _matched_asns(asn_blocks, containing_intervals(start, block_start, block_end))
+
+
+def annotate_asns(networks: TaggedNetworks, geolite2_db_dir: str, reused=()):
+    """
+    Attaches the ASN numbers and organizations from the GeoLite2 ASN CSV files
+    to CIDRs, the ASNs of an IP version stay missing if its file does not exist.
+    The blocks are joined with the networks of all tags at once, the annotated
+    CIDRs are formatted one tag at a time.
+
+    Args:
+        networks (TaggedNetworks): Networks of all tags
+        geolite2_db_dir (str): Path to the directory of the GeoLite2 ASN CSV files
+        reused (Iterable[str], optional): Tags that are not annotated, as the
+        annotations of the last build are kept. Defaults to ().
+
+    Yields:
+        tuple: Every tag with its CIDR DataFrame with 'ASN' and 'Organization'
+        columns, None for the reused tags
+    """
+    matched_blocks = {}
+    for csv_file, ipv6 in zip(GEOLITE2_ASN_CSV_FILES, (False, True)):
+        csv_path = f"{geolite2_db_dir}/{csv_file}"
+        asn_blocks = (
+            load_asn_blocks(csv_path)
+            if Path(csv_path).is_file()
+            else pd.DataFrame(columns=GEOLITE2_ASN_DTYPES.keys())
+        )
+        start, _, _ = networks.versions[ipv6]
+        matches = np.full(len(start), -1, dtype=np.int64)
+        if len(start) and not asn_blocks.empty:
+            block_start, block_end, _ = parse_networks(asn_blocks["network"], ipv6=ipv6)
+            matches = containing_intervals(start, block_start, block_end)
+        # The network strings of the blocks are no longer needed
+        matched_blocks[ipv6] = (asn_blocks.drop(columns="network"), matches)
+
+    for tag in networks.tags:
+        if tag in reused:
+            yield tag, None
+            continue
+        asns = [
+            _matched_asns(asn_blocks, matches[networks.span(tag, ipv6=ipv6)])
+            for ipv6, (asn_blocks, matches) in matched_blocks.items()
+        ]
+        yield tag, networks.frame(tag).join(pd.concat(asns, ignore_index=True))
+
+
+def load_asn_cidrs(geolite2_db_dir: str, asns: list[int], tag: str, versions=(4, 6)):
+    """
+    Loads all networks of the given autonomous systems from the GeoLite2 ASN CSV files
+
+    Args:
+        geolite2_db_dir (str): Path to the directory of the GeoLite2 ASN CSV files
+        asns (list[int]): Numbers of the autonomous systems to load the networks of
+        tag (str): Tag of the loaded CIDRs
+        versions (tuple, optional): IP versions to load, the DataFrames of the others
+        are left empty. Defaults to (4, 6).
+
+    Returns:
+        DataFrame: Two DataFrames containing IPv4 and IPv6 CIDRs
+    """
+    cidr_dfs = []
+    for version, csv_file in zip((4, 6), GEOLITE2_ASN_CSV_FILES):
+        if version not in versions:
+            cidr_dfs.append(pd.DataFrame(columns=["Network", "Tag"]))
+            continue
+        asn_blocks = load_asn_blocks(f"{geolite2_db_dir}/{csv_file}")
+        selected = asn_blocks.loc[asn_blocks["autonomous_system_number"].isin(asns), "network"]
+        cidr_dfs.append(pd.DataFrame({"Network": selected.to_numpy(), "Tag": tag}))
+
+    return tuple(cidr_dfs)
+
+
+def extract_geo_networks(
+    geo_id: int, geolite2_db_dir="./resources/geolite2", output_path="asns.csv"
+):
+    """
+    Lists the ASN blocks lying within the IPv4 networks of a country sorted by
+    their ASNs and saves them to a CSV, matching the blocks to the networks of
+    the country with a sorted-interval join instead of comparing every pair
+
+    Args:
+        geo_id (int): GeoID of the country
+        geolite2_db_dir (str, optional): Path to the directory of the GeoLite2 CSV files.
+        Defaults to "./resources/geolite2".
+        output_path (str, optional): Path to save the CSV to. Defaults to "asns.csv".
+
+    Returns:
+        DataFrame: ASN blocks of the country
+    """
+    asn_df = load_asn_blocks(f"{geolite2_db_dir}/GeoLite2-ASN-Blocks-IPv4.csv")
+    cidr_df = load_geolite2_blocks(f"{geolite2_db_dir}/GeoLite2-Country-Blocks-IPv4.csv")
+
+    print("Filtering CIDRs based on Geo ID...")
+    cidr_df = extract_geolite2_cidrs(cidr_df, {geo_id: geo_id})
+
     print("Cross matching autonomous systems with filtered CIDRs...")
-    asn_df = asn_df[asn_df["network"].apply(lambda x: x in cidr_df["network"].values)]
+    start, end, _ = parse_networks(cidr_df["Network"])
+    start_indices, end_indices = merge_intervals(start, end)
+    start, end = start[start_indices], end[end_indices]
+    asn_start, asn_end, _ = parse_networks(asn_df["network"])
+    matches = containing_intervals(asn_start, start, end)
+    is_within = (matches >= 0) & (asn_end <= end[np.maximum(matches, 0)])
+    asn_df = asn_df.loc[is_within]
 
     print("Sorting the result based ASNs...")
-    asn_df = asn_df.sort_values(by=["autonomous_system_number"])
+    asn_df = asn_df.sort_values(by=["autonomous_system_number"], kind="stable")
     print(asn_df.head())
 
     print("Saving to CSV...")
-    asn_df.to_csv("asns.csv")
+    asn_df.to_csv(output_path)
 
     print("Finished!")
+    return asn_df
@@ -0,0 +1,374 @@
+import re
+from collections import defaultdict
+from os import listdir
+from os.path import isfile
+
+# Rule types of the domain-list-community format, a line without a type is a domain rule
+GEOSITE_RULE_TYPES = ("domain", "full", "keyword", "regexp")
+GEOSITE_INCLUDE = "include"
+
+DOMAIN_PATTERN = re.compile(r"^(?!-)[a-z0-9_-]+(?:\.(?!-)[a-z0-9_-]+)*$")
+LIST_NAME_PATTERN = re.compile(r"^[a-z0-9!-]+$")
+
+
+def parse_geosite_line(line: str, location="<line>"):
+    """
+    Parses a line of a geosite list in the domain-list-community format, e.g.
+    'full:www.example.com @ads', 'keyword:example' or 'include:example @-ads'
+
+    Args:
+        line (str): Line of the list
+        location (str, optional): File and line number used in errors. Defaults to "<line>".
+
+    Raises:
+        ValueError: If the line is not a valid rule
+
+    Returns:
+        tuple: Rule type, value and the sorted tuple of its '@attribute' and
+        '&affiliation' tokens, None for empty and comment lines
+    """
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+
+    value, *tokens = line.split()
+    rule_type, separator, rule_value = value.partition(":")
+    if not separator:
+        rule_type, rule_value = "domain", value
+    elif rule_type not in GEOSITE_RULE_TYPES + (GEOSITE_INCLUDE,):
+        raise ValueError(f"{location}: Unknown rule type '{rule_type}'")
+    # Regular expressions are case-sensitive, everything else is normalized
+    if rule_type != "regexp":
+        rule_value = rule_value.lower().rstrip(".")
+    if not rule_value:
+        raise ValueError(f"{location}: Empty {rule_type} rule")
+
+    if rule_type in ("domain", "full") and not DOMAIN_PATTERN.match(rule_value):
+        raise ValueError(f"{location}: Invalid domain '{rule_value}'")
+    if rule_type == GEOSITE_INCLUDE and not LIST_NAME_PATTERN.match(rule_value):
+        raise ValueError(f"{location}: Invalid list name '{rule_value}'")
+
+    for token in tokens:
+        if token[:1] not in ("@", "&") or len(token) < 2:
+            raise ValueError(f"{location}: Invalid attribute '{token}'")
+        if token.startswith("@-") and rule_type != GEOSITE_INCLUDE:
+            raise ValueError(f"{location}: Only includes can exclude attributes, got '{token}'")
+    return rule_type, rule_value, tuple(sorted(set(token.lower() for token in tokens)))
+
+
+def read_geosite_list(path: str):
+    """
+    Reads the rules of a geosite list file
+
+    Args:
+        path (str): Path to the list file
+
+    Returns:
+        list[tuple]: Rule type, value and attributes of every rule
+    """
+    rules = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            rule = parse_geosite_line(line, location=f"{path}:{number}")
+            if rule:
+                rules.append(rule)
+    return rules
+
+
+def _attributes(rule: tuple):
+    return {token for token in rule[2] if token.startswith("@")}
+
+
+def _included(rule: tuple, include_tokens: tuple):
+    # 'include:name @a' only takes the rules having attribute a, '@-a' the ones without it
+    attributes = _attributes(rule)
+    return all(
+        (token[2:] not in {attribute[1:] for attribute in attributes})
+        if token.startswith("@-")
+        else token in attributes
+        for token in include_tokens
+        if token.startswith("@")
+    )
+
+
+def resolve_includes(lists: dict[str, list[tuple]]):
+    """
+    Replaces the includes of lists that are defined locally with their rules,
+    includes of other lists are kept for the upstream builder to resolve
+
+    Args:
+        lists (dict[str, list[tuple]]): Rules of every list by its name
+
+    Raises:
+        ValueError: If lists include each other in a cycle
+
+    Returns:
+        dict[str, list[tuple]]: Rules of every list with the local includes resolved
+    """
+    resolved = {}
+
+    def resolve(name: str, stack: tuple):
+        if name in stack:
+            raise ValueError(f"Geosite lists include each other: {' -> '.join(stack + (name,))}")
+        if name not in resolved:
+            rules = []
+            for rule in lists[name]:
+                rule_type, value, tokens = rule
+                if rule_type == GEOSITE_INCLUDE and value in lists:
+                    for included in resolve(value, stack + (name,)):
+                        if included[0] == GEOSITE_INCLUDE:
+                            # Both attribute filters apply to the lists included further down
+                            filters = tuple(sorted(set(included[2]) | set(tokens)))
+                            rules.append((GEOSITE_INCLUDE, included[1], filters))
+                        elif _included(included, tokens):
+                            rules.append(included)
+                else:
+                    rules.append(rule)
+            resolved[name] = rules
+        return resolved[name]
+
+    for name in lists:
+        resolve(name, ())
+    return resolved
+
+
+class DomainTrie:
+    """
+    Holds domain and full rules by their labels in reverse, e.g. 'www.example.com'
+    under com -> example -> www, so that the rules covering a domain are all found
+    on the single path from the root to the domain.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    @staticmethod
+    def labels(domain: str):
+        return reversed(domain.split("."))
+
+    def _node(self, domain: str, create=False):
+        node = self.root
+        for label in self.labels(domain):
+            if label not in node:
+                if not create:
+                    return None
+                node[label] = {}
+            node = node[label]
+        return node
+
+    def add(self, rule_type: str, domain: str, attributes: set):
+        # Rules are kept under tuple keys, which no label can collide with
+        self._node(domain, create=True).setdefault((rule_type,), []).append(attributes)
+
+    def covering_domain(self, domain: str, attributes: set):
+        """
+        Finds a domain rule that matches the domain and all of its subdomains,
+        carrying exactly the given attributes
+
+        Args:
+            domain (str): Domain to look up
+            attributes (set[str]): Attributes the covering rule must carry, no more and no less
+
+        Returns:
+            str: Domain of the covering rule, None if there is none
+        """
+        node, path = self.root, []
+        for label in self.labels(domain):
+            node = node.get(label)
+            if node is None:
+                return None
+            path.append(label)
+            if attributes in node.get(("domain",), []):
+                return ".".join(reversed(path))
+        return None
+
+    def has_full(self, domain: str, attributes: set):
+        node = self._node(domain)
+        return node is not None and attributes in node.get(("full",), [])
+
+
+def _regexp_matcher(pattern: str):
+    try:
+        return re.compile(pattern).search
+    except re.error:
+        # Some RE2 syntax is unknown to Python, such rules cover nothing here
+        return None
+
+
+def _rule_key(rule: tuple):
+    rule_type, value, _ = rule
+    # Includes first, then the domains grouped by their parent domains
+    order = (GEOSITE_INCLUDE,) + GEOSITE_RULE_TYPES
+    if rule_type in ("domain", "full"):
+        return order.index(rule_type), tuple(DomainTrie.labels(value)), rule[2]
+    return order.index(rule_type), (value,), rule[2]
+
+
+def deduplicate_rules(rules: list[tuple]):
+    """
+    Drops the rules that broader rules of the same list already match, e.g.
+    'full:a.example.ir' or 'example.ir' next to 'ir', 'example.com' next to
+    'keyword:example' and full rules that a regular expression matches
+
+    A rule is only dropped if the broader rule carries exactly its attributes.
+    A broader rule with fewer attributes is not selected by them, and one with
+    more attributes is dropped by selections excluding its extra attributes,
+    e.g. 'include:name @-cn'. Rules with affiliations to other lists are
+    always kept.
+
+    Args:
+        rules (list[tuple]): Rules of the list with the local includes resolved
+
+    Returns:
+        tuple: Remaining rules sorted and the dropped rules as (rule, reason)
+    """
+    kept, dropped = [], []
+    trie = DomainTrie()
+    keywords = []
+    matchers = []
+
+    def is_affiliated(rule: tuple):
+        return any(token.startswith("&") for token in rule[2])
+
+    # Wider rules first, so that they cover the others
+    by_type = defaultdict(list)
+    seen = set()
+    for rule in rules:
+        if rule in seen:
+            dropped.append((rule, "duplicate"))
+        else:
+            seen.add(rule)
+            by_type[rule[0]].append(rule)
+    for rule_type in by_type:
+        by_type[rule_type].sort(
+            key=lambda rule: (rule[1].count("."), len(rule[1]), -len(rule[2]), rule)
+        )
+
+    for rule in by_type[GEOSITE_INCLUDE]:
+        kept.append(rule)
+
+    for rule in by_type["keyword"]:
+        attributes = _attributes(rule)
+        covering = next(
+            (
+                keyword
+                for keyword, keyword_attributes in keywords
+                if keyword in rule[1] and attributes == keyword_attributes
+            ),
+            None,
+        )
+        if covering is not None and not is_affiliated(rule):
+            dropped.append((rule, f"keyword:{covering}"))
+            continue
+        keywords.append((rule[1], attributes))
+        kept.append(rule)
+
+    for rule in by_type["regexp"]:
+        matcher = _regexp_matcher(rule[1])
+        if matcher:
+            matchers.append((rule[1], matcher, _attributes(rule)))
+        kept.append(rule)
+
+    for rule_type in ("domain", "full"):
+        for rule in by_type[rule_type]:
+            _, domain, _ = rule
+            attributes = _attributes(rule)
+            reason = None
+            covering = trie.covering_domain(domain, attributes)
+            if covering is not None:
+                reason = f"domain:{covering}"
+            elif rule_type == "full" and trie.has_full(domain, attributes):
+                reason = f"full:{domain}"
+            else:
+                reason = next(
+                    (
+                        f"keyword:{keyword}"
+                        for keyword, keyword_attributes in keywords
+                        if keyword in domain and attributes == keyword_attributes
+                    ),
+                    None,
+                )
+            if reason is None and rule_type == "full":
+                reason = next(
+                    (
+                        f"regexp:{pattern}"
+                        for pattern, matcher, pattern_attributes in matchers
+                        if attributes == pattern_attributes and matcher(domain)
+                    ),
+                    None,
+                )
+            if reason is not None and not is_affiliated(rule):
+                dropped.append((rule, reason))
+                continue
+            trie.add(rule_type, domain, attributes)
+            kept.append(rule)
+
+    return sorted(kept, key=_rule_key), dropped
+
+
+def format_geosite_rule(rule: tuple):
+    rule_type, value, tokens = rule
+    line = value if rule_type == "domain" else f"{rule_type}:{value}"
+    return " ".join((line,) + tokens)
+
+
+def find_duplicates(lists: dict[str, list[tuple]]):
+    """
+    Finds the rules that more than one list defines itself, includes not counted
+
+    Args:
+        lists (dict[str, list[tuple]]): Rules of every list by its name
+
+    Returns:
+        dict[str, list[str]]: Names of the lists defining every duplicate rule
+    """
+    defined_in = defaultdict(list)
+    for name, rules in sorted(lists.items()):
+        for rule_type, value, _ in dict.fromkeys(rules):
+            if rule_type != GEOSITE_INCLUDE:
+                defined_in[format_geosite_rule((rule_type, value, ()))].append(name)
+    return {
+        rule: names
+        for rule, names in sorted(defined_in.items())
+        if len(set(names)) > 1
+    }
+
+
+def compile_geosite_lists(geosite_dir: str):
+    """
+    Compiles the geosite lists of a directory into normalized, sorted lists
+    without redundant rules, ready for the geosite.dat/geosite.db builders
+
+    Args:
+        geosite_dir (str): Directory of the list files, named after the lists
+
+    Returns:
+        tuple: Rules of every compiled list by its name, the rules dropped from
+        every list and the rules defined by more than one list
+    """
+    print("\n*** Compiling geosite lists ***")
+    lists = {
+        name: read_geosite_list(f"{geosite_dir}/{name}")
+        for name in sorted(listdir(geosite_dir))
+        if isfile(f"{geosite_dir}/{name}") and LIST_NAME_PATTERN.match(name)
+    }
+    resolved = resolve_includes(lists)
+
+    compiled, dropped = {}, {}
+    for name, rules in resolved.items():
+        compiled[name], dropped[name] = deduplicate_rules(rules)
+        print(
+            f"-> {name}: {len(compiled[name])} rules, "
+            f"{len(rules) - len(compiled[name])} duplicate or redundant rules dropped"
+        )
+    return compiled, dropped, find_duplicates(lists)
+
+
+def pretty_print_geosite_report(dropped: dict[str, list], duplicates: dict[str, list[str]]):
+    for name, rules in dropped.items():
+        for rule, reason in rules:
+            print(f"{name:<16} {format_geosite_rule(rule):<40} covered by {reason}")
+    for rule, names in duplicates.items():
+        print(f"{rule:<40} defined in {', '.join(names)}")
+    if any(dropped.values()) or duplicates:
+        print()
@@ -0,0 +1,479 @@
+import ipaddress
+import socket
+
+import numpy as np
+
+# IPv4 networks are stored as uint32 arrays of their first and last addresses,
+# IPv6 networks as (n, 2) uint64 arrays holding the (hi, lo) words of each address.
+UINT64_MAX = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _high_mask(bits: np.ndarray, width: int):
+    """
+    Builds masks with the given number of leading bits set
+
+    Args:
+        bits (np.ndarray): Number of leading bits to set, between 0 and width
+        width (int): Width of the mask in bits, 32 or 64
+
+    Returns:
+        np.ndarray: uint64 array of masks
+    """
+    bits = np.asarray(bits, dtype=np.uint64)
+    all_ones = np.uint64((1 << width) - 1)
+    shift = np.uint64(width) - np.maximum(bits, np.uint64(1))
+    mask = (all_ones << shift) & all_ones
+    return np.where(bits == 0, np.uint64(0), mask)
+
+
+def parse_addresses(addresses, ipv6=False):
+    """
+    Converts IP address strings to integers
+
+    Args:
+        addresses (Iterable[str]): IP addresses of a single IP version
+        ipv6 (bool, optional): Whether the addresses are IPv6 or IPv4. Defaults to False.
+
+    Raises:
+        ValueError: If an address is not a valid address of the IP version
+
+    Returns:
+        np.ndarray: uint32 array for IPv4, (n, 2) uint64 array for IPv6
+    """
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    try:
+        packed = b"".join(socket.inet_pton(family, a) for a in addresses)
+    except (OSError, TypeError):
+        invalid = next((a for a in addresses if not _is_address(a, family)), None)
+        raise ValueError(f"Invalid IPv{6 if ipv6 else 4} address: {invalid!r}") from None
+
+    if ipv6:
+        return np.frombuffer(packed, dtype=">u8").astype(np.uint64).reshape(-1, 2)
+    return np.frombuffer(packed, dtype=">u4").astype(np.uint32)
+
+
+def _is_address(address: str, family: int):
+    try:
+        socket.inet_pton(family, address)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+def _is_prefix(prefix: str, max_prefix: int):
+    # Only plain decimal prefix lengths up to the address width, as ipaddress.ip_network takes them
+    return prefix.isascii() and prefix.isdecimal() and int(prefix) <= max_prefix
+
+
+def _split_prefix(networks, max_prefix: int):
+    networks = [str(network) for network in networks]
+    addresses = []
+    prefixes = []
+    for network in networks:
+        address, separator, prefix = network.partition("/")
+        addresses.append(address)
+        prefixes.append(prefix if separator else str(max_prefix))
+
+    # Checking all prefixes at once keeps the common case fast, only an invalid
+    # one is searched for so that the error can name its network
+    joined = "".join(prefixes)
+    is_valid = not prefixes or (joined.isascii() and joined.isdecimal() and "" not in prefixes)
+    if is_valid:
+        try:
+            prefix = np.array(prefixes, dtype=np.int64)
+            is_valid = bool((prefix <= max_prefix).all())
+        except OverflowError:
+            is_valid = False
+    if not is_valid:
+        invalid = next(i for i, p in enumerate(prefixes) if not _is_prefix(p, max_prefix))
+        raise ValueError(f"Invalid prefix length in network: {networks[invalid]!r}")
+    return networks, addresses, prefix.astype(np.uint8)
+
+
+def network_addresses(addresses: np.ndarray, prefix: np.ndarray, ipv6=False):
+    """
+    Clears the host bits of addresses
+
+    Args:
+        addresses (np.ndarray): Addresses of a single IP version
+        prefix (np.ndarray): Prefix lengths
+        ipv6 (bool, optional): Whether the addresses are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        np.ndarray: Network addresses
+    """
+    if ipv6:
+        mask = np.column_stack(
+            (
+                _high_mask(np.minimum(prefix, 64), 64),
+                _high_mask(np.maximum(prefix, 64) - 64, 64),
+            )
+        )
+        return addresses & mask
+    return (addresses.astype(np.uint64) & _high_mask(prefix, 32)).astype(np.uint32)
+
+
+def last_addresses(start: np.ndarray, prefix: np.ndarray, ipv6=False):
+    """
+    Sets the host bits of network addresses
+
+    Args:
+        start (np.ndarray): Network addresses of a single IP version
+        prefix (np.ndarray): Prefix lengths
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        np.ndarray: Last address of every network
+    """
+    all_ones = UINT64_MAX if ipv6 else 0xFFFFFFFF
+    return start | ~network_addresses(np.full_like(start, all_ones), prefix, ipv6=ipv6)
+
+
+def parse_networks(networks, ipv6=False):
+    """
+    Converts CIDR strings to integer intervals, host bits are ignored
+    the same way as ipaddress.ip_network(strict=False) does
+
+    Args:
+        networks (Iterable[str]): CIDR strings of a single IP version
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Raises:
+        ValueError: If a network has an invalid address or prefix length
+
+    Returns:
+        tuple: Start addresses, end addresses and prefix lengths
+    """
+    networks, addresses, prefix = _split_prefix(networks, 128 if ipv6 else 32)
+    try:
+        words = parse_addresses(addresses, ipv6=ipv6)
+    except ValueError:
+        family = socket.AF_INET6 if ipv6 else socket.AF_INET
+        invalid = next(i for i, a in enumerate(addresses) if not _is_address(a, family))
+        raise ValueError(f"Invalid address in network: {networks[invalid]!r}") from None
+    start = network_addresses(words, prefix, ipv6=ipv6)
+
+    return start, last_addresses(start, prefix, ipv6=ipv6), prefix
+
+
+def format_networks(start: np.ndarray, prefix: np.ndarray, ipv6=False):
+    """
+    Converts integer network addresses back to CIDR strings
+
+    Args:
+        start (np.ndarray): Network addresses
+        prefix (np.ndarray): Prefix lengths
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        list[str]: CIDR strings
+    """
+    if ipv6:
+        packed = np.asarray(start, dtype=">u8").tobytes()
+        addresses = [
+            socket.inet_ntop(socket.AF_INET6, packed[i : i + 16])
+            for i in range(0, len(packed), 16)
+        ]
+        # inet_ntop spells IPv4-mapped and IPv4-compatible addresses in dotted
+        # notation, let ipaddress format those the way it always did
+        embedded_ipv4 = (start[:, 0] == 0) & np.isin(start[:, 1] >> np.uint64(32), [0, 0xFFFF])
+        for i in np.flatnonzero(embedded_ipv4).tolist():
+            addresses[i] = str(ipaddress.IPv6Address(packed[i * 16 : (i + 1) * 16]))
+    else:
+        packed = np.asarray(start, dtype=">u4").tobytes()
+        addresses = [
+            socket.inet_ntop(socket.AF_INET, packed[i : i + 4])
+            for i in range(0, len(packed), 4)
+        ]
+    return [f"{address}/{length}" for address, length in zip(addresses, prefix.tolist())]
+
+
+def ordinals(*addresses: np.ndarray):
+    """
+    Maps addresses to int64 keys with the same numeric order, so IPv4 and
+    IPv6 intervals can be compared, sorted and accumulated the same way.
+    IPv6 addresses are replaced by their dense rank among all given arrays.
+
+    Args:
+        *addresses (np.ndarray): Address arrays of a single IP version
+
+    Returns:
+        list[np.ndarray]: int64 keys for each given array
+    """
+    if addresses[0].ndim == 1:
+        return [a.astype(np.int64) for a in addresses]
+
+    words = np.concatenate(addresses)
+    order = np.lexsort((words[:, 1], words[:, 0]))
+    sorted_words = words[order]
+    is_new = np.ones(len(words), dtype=bool)
+    is_new[1:] = np.any(sorted_words[1:] != sorted_words[:-1], axis=1)
+    ranks = np.empty(len(words), dtype=np.int64)
+    ranks[order] = np.cumsum(is_new) - 1
+
+    return np.split(ranks, np.cumsum([len(a) for a in addresses])[:-1])
+
+
+def _group_keys(keys: list[np.ndarray], groups):
+    """Offsets keys per group so that every group occupies its own disjoint key range"""
+    if groups is None:
+        return keys
+    span = max(int(k.max()) for k in keys) + 1
+    offset = np.asarray(groups, dtype=np.int64) * span
+    return [k + offset for k in keys]
+
+
+def remove_covered(start: np.ndarray, end: np.ndarray, groups=None):
+    """
+    Finds the intervals that are neither duplicates nor contained in another
+    interval of the same group. Intervals are sorted numerically by start
+    address (widest first on ties) and every interval whose end does not
+    exceed the running maximum end of the preceding ones is dropped.
+
+    Args:
+        start (np.ndarray): Start addresses
+        end (np.ndarray): End addresses
+        groups (np.ndarray, optional): Integer group codes, e.g. factorized tags. Defaults to None.
+
+    Returns:
+        np.ndarray: Indices of the remaining intervals ordered by group and start address
+    """
+    if len(start) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    start_keys, end_keys = _group_keys(ordinals(start, end), groups)
+    order = np.lexsort((-end_keys, start_keys))
+    sorted_ends = end_keys[order]
+    running_max = np.maximum.accumulate(sorted_ends)
+    is_covered = np.zeros(len(order), dtype=bool)
+    is_covered[1:] = sorted_ends[1:] <= running_max[:-1]
+
+    return order[~is_covered]
+
+
+def successor(addresses: np.ndarray):
+    """
+    Adds one to every address, the last address of the space is kept as is
+
+    Args:
+        addresses (np.ndarray): Addresses of a single IP version
+
+    Returns:
+        np.ndarray: Following addresses
+    """
+    if addresses.ndim == 1:
+        return np.minimum(addresses.astype(np.uint64) + np.uint64(1), np.uint64(0xFFFFFFFF))
+
+    hi = addresses[:, 0]
+    lo = addresses[:, 1]
+    is_last = (hi == UINT64_MAX) & (lo == UINT64_MAX)
+    next_lo = lo + np.uint64(1)
+    next_hi = hi + (next_lo == 0).astype(np.uint64)
+    return np.where(is_last[:, None], addresses, np.column_stack((next_hi, next_lo)))
+
+
+def boundaries(*intervals: tuple, ipv6=False):
+    """
+    Finds the boundaries of intervals for sweeps over the address space, the
+    start of every interval and the address right after its end, with keys
+    that order them. IPv4 boundaries are widened to int64 so that the end of
+    the address space can be passed. IPv6 ones after the last address wrap
+    around to :: and get a key past all others instead, so differences and
+    predecessors of the boundaries stay exact in uint64 arithmetic.
+
+    Args:
+        *intervals (tuple): Start and end addresses of intervals of a single IP version
+        ipv6 (bool, optional): Whether the addresses are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        tuple: Start and next addresses of every interval array in turn, and
+        their int64 keys in the same order
+    """
+    bounds = []
+    for start, end in intervals:
+        if ipv6:
+            next_lo = end[:, 1] + np.uint64(1)
+            next_hi = end[:, 0] + (next_lo == 0).astype(np.uint64)
+            bounds += [start, np.column_stack((next_hi, next_lo))]
+        else:
+            bounds += [start.astype(np.int64), end.astype(np.int64) + 1]
+    keys = ordinals(*bounds)
+
+    if ipv6 and sum(len(k) for k in keys):
+        past_end = int(max(k.max() for k in keys if len(k))) + 1
+        for (_, end), next_keys in zip(intervals, keys[1::2]):
+            next_keys[(end == UINT64_MAX).all(axis=1)] = past_end
+    return bounds, keys
+
+
+def previous_addresses(bounds: np.ndarray, ipv6=False):
+    """
+    Finds the last address before every boundary of boundaries
+
+    Args:
+        bounds (np.ndarray): int64 IPv4 or (n, 2) uint64 IPv6 boundaries
+        ipv6 (bool, optional): Whether the addresses are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        np.ndarray: uint32 IPv4 or (n, 2) uint64 IPv6 addresses
+    """
+    if not ipv6:
+        return (bounds - 1).astype(np.uint32)
+    hi, lo = bounds[:, 0], bounds[:, 1]
+    return np.column_stack((hi - (lo == 0).astype(np.uint64), lo - np.uint64(1)))
+
+
+def merge_intervals(start: np.ndarray, end: np.ndarray, groups=None):
+    """
+    Unions overlapping and adjacent intervals of the same group
+
+    Args:
+        start (np.ndarray): Start addresses
+        end (np.ndarray): End addresses
+        groups (np.ndarray, optional): Integer group codes, e.g. factorized tags. Defaults to None.
+
+    Returns:
+        tuple: Indices of the start and of the end address of every merged
+        interval, ordered by group and start address
+    """
+    if len(start) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    start_keys, end_keys, next_keys = _group_keys(
+        ordinals(start, end, successor(end)), groups
+    )
+    order = np.argsort(start_keys, kind="stable")
+    reach = np.maximum.accumulate(next_keys[order])
+    is_new_run = np.ones(len(order), dtype=bool)
+    is_new_run[1:] = start_keys[order][1:] > reach[:-1]
+    run_ids = np.cumsum(is_new_run) - 1
+
+    # The widest end of every run is the last one once sorted by run and end
+    by_end = np.lexsort((end_keys[order], run_ids))
+    is_run_last = np.ones(len(order), dtype=bool)
+    is_run_last[:-1] = run_ids[by_end][1:] != run_ids[by_end][:-1]
+
+    return order[is_new_run], order[by_end[is_run_last]]
+
+
+def containing_intervals(addresses: np.ndarray, start: np.ndarray, end: np.ndarray):
+    """
+    Joins addresses with the disjoint intervals containing them, as a
+    merge-as-of that matches every address with the last interval starting
+    at or before it and keeps the match if the interval reaches the address
+
+    Args:
+        addresses (np.ndarray): Addresses to look up
+        start (np.ndarray): Start addresses of disjoint intervals in any order
+        end (np.ndarray): End addresses of the intervals
+
+    Returns:
+        np.ndarray: Index of the interval containing every address, -1 where none does
+    """
+    if len(start) == 0:
+        return np.full(len(addresses), -1, dtype=np.int64)
+
+    address_keys, start_keys, end_keys = ordinals(addresses, start, end)
+    order = np.argsort(start_keys, kind="stable")
+    positions = np.searchsorted(start_keys[order], address_keys, side="right") - 1
+    matches = order[np.maximum(positions, 0)]
+    return np.where((positions >= 0) & (address_keys <= end_keys[matches]), matches, -1)
+
+
+def _bit_length(x: np.ndarray):
+    """Number of bits needed to represent each uint64 value, 0 for 0"""
+    x = x.copy()
+    for shift in (1, 2, 4, 8, 16, 32):
+        x |= x >> np.uint64(shift)
+    # Population count of the smeared bits
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + (
+        (x >> np.uint64(2)) & np.uint64(0x3333333333333333)
+    )
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((x * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def _trailing_zeros(x: np.ndarray):
+    """Number of trailing zero bits of each uint64 value, 64 for 0"""
+    lowest_bit = x & (~x + np.uint64(1))
+    return np.where(x == 0, 64, _bit_length(lowest_bit) - 1)
+
+
+def ranges_to_networks(start: np.ndarray, end: np.ndarray, ipv6=False):
+    """
+    Splits address ranges into the minimal list of CIDR networks covering them.
+    All ranges are processed at once, every round emits the largest aligned
+    block at the current start of each range, its size being bounded by the
+    lowest set bit of the start and the bit length of the remaining span.
+
+    Args:
+        start (np.ndarray): Start addresses
+        end (np.ndarray): End addresses
+        ipv6 (bool, optional): Whether the ranges are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        tuple: Network addresses, prefix lengths and the index of the range each network belongs to
+    """
+    width = 128 if ipv6 else 32
+    if ipv6:
+        hi, lo = start[:, 0].copy(), start[:, 1].copy()
+        end_hi, end_lo = end[:, 0], end[:, 1]
+    else:
+        hi, lo = np.zeros(len(start), dtype=np.uint64), start.astype(np.uint64)
+        end_hi, end_lo = np.zeros(len(end), dtype=np.uint64), end.astype(np.uint64)
+    active = np.flatnonzero((hi < end_hi) | ((hi == end_hi) & (lo <= end_lo)))
+
+    emitted = []
+    while len(active):
+        a_hi, a_lo = hi[active], lo[active]
+
+        # Remaining span minus one, i.e. end - start
+        rest_lo = end_lo[active] - a_lo
+        rest_hi = end_hi[active] - a_hi - (end_lo[active] < a_lo).astype(np.uint64)
+        # Largest power of two not exceeding end - start + 1
+        count_lo = rest_lo + np.uint64(1)
+        count_hi = rest_hi + (count_lo == 0).astype(np.uint64)
+        span_bits = np.where(
+            count_hi != 0, 64 + _bit_length(count_hi), _bit_length(count_lo)
+        ) - 1
+        span_bits = np.where((count_hi == 0) & (count_lo == 0), width, span_bits)
+
+        alignment = np.where(a_lo != 0, _trailing_zeros(a_lo), 64 + _trailing_zeros(a_hi))
+        size = np.minimum(np.minimum(span_bits, alignment), width)
+        emitted.append((active, a_hi, a_lo, (width - size).astype(np.uint8)))
+
+        # Advance the start past the emitted block, the space may wrap around at its end
+        shift = size.astype(np.uint64)
+        step_lo = np.where(size < 64, np.uint64(1) << np.minimum(shift, 63), np.uint64(0))
+        step_hi = np.where(
+            size >= 64, np.uint64(1) << np.minimum(np.maximum(shift, 64) - 64, 63), np.uint64(0)
+        )
+        next_lo = a_lo + step_lo
+        next_hi = a_hi + step_hi + (next_lo < a_lo).astype(np.uint64)
+        is_done = (
+            (size == width)
+            | (next_hi < a_hi)
+            | (next_hi > end_hi[active])
+            | ((next_hi == end_hi[active]) & (next_lo > end_lo[active]))
+        )
+        hi[active], lo[active] = next_hi, next_lo
+        active = active[~is_done]
+
+    if emitted:
+        range_indices, network_hi, network_lo, prefix = (
+            np.concatenate(column) for column in zip(*emitted)
+        )
+    else:
+        range_indices = np.empty(0, dtype=np.int64)
+        network_hi = network_lo = np.empty(0, dtype=np.uint64)
+        prefix = np.empty(0, dtype=np.uint8)
+
+    # Rounds emit networks in ascending address order within every range
+    order = np.argsort(range_indices, kind="stable")
+    if ipv6:
+        network_start = np.column_stack((network_hi[order], network_lo[order]))
+    else:
+        network_start = network_lo[order].astype(np.uint32)
+
+    return network_start, prefix[order], range_indices[order]
@@ -0,0 +1,240 @@
+import socket
+
+import numpy as np
+import pandas as pd
+
+from lib.intervals import boundaries, last_addresses, parse_networks, previous_addresses
+from lib.networks import TaggedNetworks
+
+
+def _pack_addresses(addresses: list[str], ipv6=False):
+    """Packs IP addresses into sortable fixed-width values, invalid ones become None"""
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    packed = []
+    for address in addresses:
+        try:
+            packed.append(socket.inet_pton(family, address))
+        except OSError:
+            packed.append(None)
+    return packed
+
+
+def _pack_bounds(addresses: np.ndarray, ipv6=False):
+    if ipv6:
+        return np.ascontiguousarray(addresses, dtype=">u8").view("S16").reshape(-1)
+    return addresses.astype(np.uint32)
+
+
+def _flatten_networks(start: np.ndarray, end: np.ndarray, tag_codes: np.ndarray, ipv6=False):
+    """
+    Splits possibly nested networks into disjoint segments, each labeled
+    with the tag of the most specific network covering it
+
+    CIDRs either nest or are disjoint, so the networks covering a segment form
+    a chain and the most specific one is nested deepest. Networks of the same
+    depth never overlap, so the one covering a segment of depth d is the last
+    network of depth d starting before it. Of identical networks, the one of
+    the highest tag code is treated as the deepest.
+
+    Args:
+        start (np.ndarray): Network addresses of a single IP version
+        end (np.ndarray): Last addresses of the networks
+        tag_codes (np.ndarray): Integer tag code of every network
+        ipv6 (bool, optional): Whether the networks are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        tuple: Segment starts and ends as uint32 or S16 arrays, and their tag codes
+    """
+    if len(tag_codes) == 0:
+        no_addresses = np.empty(0, dtype="S16" if ipv6 else np.uint32)
+        return no_addresses, no_addresses, np.empty(0, dtype=np.int64)
+
+    (start_bounds, next_bounds), (start_keys, next_keys) = boundaries((start, end), ipv6=ipv6)
+    # Enclosing networks ahead of the ones they contain
+    order = np.lexsort((tag_codes, -next_keys, start_keys))
+    sorted_next_keys = np.sort(next_keys)
+    # Every network is nested in the networks ahead of it that have not ended yet
+    depth = np.empty(len(order), dtype=np.int64)
+    depth[order] = np.arange(len(order)) - np.searchsorted(
+        sorted_next_keys, start_keys[order], side="right"
+    )
+
+    bound_keys, first = np.unique(np.concatenate([start_keys, next_keys]), return_index=True)
+    bound_addresses = np.concatenate([start_bounds, next_bounds])[first]
+    segment_keys = bound_keys[:-1]
+    covering = np.searchsorted(start_keys[order], segment_keys, side="right") - np.searchsorted(
+        sorted_next_keys, segment_keys, side="right"
+    )
+
+    # Networks sorted by depth and start, so that every depth is searched on its own
+    span = int(bound_keys[-1]) + 1
+    depth_keys = depth * span + start_keys
+    by_depth = np.argsort(depth_keys, kind="stable")
+    owners = by_depth[
+        np.searchsorted(
+            depth_keys[by_depth], (np.maximum(covering, 1) - 1) * span + segment_keys, side="right"
+        )
+        - 1
+    ]
+    segment_tags = np.where(covering > 0, tag_codes[owners], -1)
+
+    # Consecutive segments of the same tag make up one segment
+    is_new = np.ones(len(segment_tags), dtype=bool)
+    is_new[1:] = segment_tags[1:] != segment_tags[:-1]
+    firsts = np.flatnonzero(is_new)
+    is_covered = segment_tags[firsts] >= 0
+    run_starts = bound_addresses[firsts]
+    run_nexts = bound_addresses[np.append(firsts[1:], len(segment_tags))]
+    return (
+        _pack_bounds(run_starts[is_covered], ipv6),
+        _pack_bounds(previous_addresses(run_nexts[is_covered], ipv6=ipv6), ipv6),
+        segment_tags[firsts][is_covered],
+    )
+
+
+class VersionIndex:
+    """
+    Sorted disjoint address segments of a single IP version with their tag
+    codes. IPv4 addresses are kept as uint32, IPv6 ones as big-endian S16
+    byte strings so that both can be searched with np.searchsorted.
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, tags: np.ndarray, ipv6=False):
+        self.starts = starts
+        self.ends = ends
+        self.tags = tags
+        self.ipv6 = ipv6
+
+    @classmethod
+    def from_networks(cls, df: pd.DataFrame, tag_codes: np.ndarray, ipv6=False):
+        start, end, _ = parse_networks(df["Network"], ipv6=ipv6)
+        return cls.from_intervals(start, end, tag_codes, ipv6=ipv6)
+
+    @classmethod
+    def from_intervals(cls, start: np.ndarray, end: np.ndarray, tag_codes: np.ndarray, ipv6=False):
+        starts, ends, tags = _flatten_networks(start, end, tag_codes, ipv6=ipv6)
+        return cls(starts, ends, tags.astype(np.uint16), ipv6=ipv6)
+
+    def lookup(self, addresses: list[str]):
+        """
+        Finds the tag codes of IP addresses of this version
+
+        Args:
+            addresses (list[str]): IP addresses
+
+        Returns:
+            np.ndarray: Tag code of every address, -1 where no segment matches
+        """
+        packed = _pack_addresses(addresses, ipv6=self.ipv6)
+        is_valid = np.array([address is not None for address in packed], dtype=bool)
+        blob = b"".join(address for address in packed if address is not None)
+        if self.ipv6:
+            queries = np.frombuffer(blob, dtype="S16")
+        else:
+            queries = np.frombuffer(blob, dtype=">u4").astype(np.uint32)
+
+        codes = np.full(len(addresses), -1, dtype=np.int32)
+        if len(self.starts) == 0:
+            return codes
+
+        positions = np.searchsorted(self.starts, queries, side="right") - 1
+        clipped = np.maximum(positions, 0)
+        is_match = (positions >= 0) & (queries <= self.ends[clipped])
+        codes[is_valid] = np.where(is_match, self.tags[clipped].astype(np.int32), -1)
+        return codes
+
+
+class CidrIndex:
+    """
+    Longest-prefix-match index over cleaned CIDRs, answering which tag an
+    IP address belongs to with a binary search over disjoint address segments
+    """
+
+    def __init__(self, tag_names: list[str], ipv4_index: VersionIndex, ipv6_index: VersionIndex):
+        self.tag_names = list(tag_names)
+        self._tag_lookup = np.append(np.array(self.tag_names, dtype=object), None)
+        self.indexes = {False: ipv4_index, True: ipv6_index}
+
+    @classmethod
+    def from_df(cls, cidr_df: pd.DataFrame):
+        """
+        Builds the index from a CIDR DataFrame
+
+        Args:
+            cidr_df (pd.DataFrame): CIDR DataFrame of both IP versions
+
+        Returns:
+            CidrIndex: Lookup index
+        """
+        tag_codes, tags = pd.factorize(cidr_df["Tag"], sort=True)
+        is_ipv6 = cidr_df["Network"].str.contains(":", regex=False).to_numpy(dtype=bool)
+        return cls(
+            tags.tolist(),
+            VersionIndex.from_networks(cidr_df[~is_ipv6], tag_codes[~is_ipv6]),
+            VersionIndex.from_networks(cidr_df[is_ipv6], tag_codes[is_ipv6], ipv6=True),
+        )
+
+    @classmethod
+    def from_tagged(cls, networks: TaggedNetworks):
+        """
+        Builds the index from the networks of many tags
+
+        Args:
+            networks (TaggedNetworks): Networks of both IP versions
+
+        Returns:
+            CidrIndex: Lookup index
+        """
+        indexes = []
+        for ipv6 in (False, True):
+            start, prefix, tag_codes = networks.versions[ipv6]
+            indexes.append(
+                VersionIndex.from_intervals(
+                    start, last_addresses(start, prefix, ipv6=ipv6), tag_codes, ipv6=ipv6
+                )
+            )
+        return cls(networks.tags, *indexes)
+
+    @classmethod
+    def from_csv(cls, csv_path: str):
+        """
+        Builds the index from a merged CSV such as 'agg_cidrs.csv'
+
+        Args:
+            csv_path (str): Path to the CSV file
+
+        Returns:
+            CidrIndex: Lookup index
+        """
+        return cls.from_df(pd.read_csv(csv_path, dtype={"Network": str, "Tag": str}))
+
+    def lookup_many(self, addresses: list[str]):
+        """
+        Finds the tags of many IP addresses at once
+
+        Args:
+            addresses (list[str]): IPv4 and/or IPv6 addresses
+
+        Returns:
+            np.ndarray: Tag of every address, None where no network matches
+        """
+        addresses = np.asarray(addresses, dtype=object)
+        is_ipv6 = np.array([":" in address for address in addresses], dtype=bool)
+        codes = np.full(len(addresses), -1, dtype=np.int32)
+        for ipv6 in (False, True):
+            mask = is_ipv6 if ipv6 else ~is_ipv6
+            if mask.any():
+                codes[mask] = self.indexes[ipv6].lookup(addresses[mask].tolist())
+        return self._tag_lookup[codes]
+
+    def lookup(self, address: str):
+        """
+        Finds the tag of an IP address
+
+        Args:
+            address (str): IPv4 or IPv6 address
+
+        Returns:
+            str: Tag of the most specific network containing the address, None if there is none
+        """
+        return self.lookup_many([address])[0]
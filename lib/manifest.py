@@ -0,0 +1,90 @@
+import hashlib
+import json
+from os import makedirs, replace
+from os.path import dirname, exists
+
+
+class BuildManifest:
+    """
+    Remembers the input fingerprint and the results of every tag of the
+    last builds, so that an incremental build only reprocesses the tags
+    whose inputs changed and reuses the cleaned CIDRs of all the others.
+    """
+
+    def __init__(self, manifest_path: str, sections_dir: str):
+        self.manifest_path = manifest_path
+        self.sections_dir = sections_dir
+        self.tags = {}
+        if exists(manifest_path):
+            with open(manifest_path) as f:
+                self.tags = json.load(f)["tags"]
+        makedirs(sections_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(*digests: str):
+        """
+        Combines the digests of all inputs of a tag into its fingerprint
+
+        Args:
+            *digests (str): Digests of the inputs, e.g. source file digests
+
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.sha256()
+        for item in digests:
+            digest.update(item.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def section_path(self, tag: str, suffix="npz"):
+        """
+        Path to the cleaned CIDRs of a tag, or with another suffix to a part of
+        the exported files that only holds the CIDRs of the tag
+
+        Args:
+            tag (str): Tag of the section
+            suffix (str, optional): File suffix of the section. Defaults to 'npz'.
+
+        Returns:
+            str: Path in the sections directory
+        """
+        return f"{self.sections_dir}/{tag}.{suffix}"
+
+    def has_sections(self, tag: str, suffixes: list[str]):
+        """Checks whether all given sections of a tag exist"""
+        return all(exists(self.section_path(tag, suffix)) for suffix in suffixes)
+
+    def is_fresh(self, tag: str, fingerprint: str):
+        """
+        Checks whether the last cleaned CIDRs of a tag were built from the same inputs
+
+        Args:
+            tag (str): Tag to check
+            fingerprint (str): Current fingerprint of the inputs of the tag
+
+        Returns:
+            bool: Whether the tag can be reused without reprocessing it
+        """
+        return (
+            tag in self.tags
+            and self.tags[tag]["fingerprint"] == fingerprint
+            and exists(self.section_path(tag))
+        )
+
+    def update(self, tag: str, fingerprint: str, stats: dict):
+        self.tags[tag] = {"fingerprint": fingerprint, "stats": stats}
+
+    def retain(self, tags: list[str]):
+        """Forgets every tag that is not part of the build anymore"""
+        self.tags = {tag: entry for tag, entry in self.tags.items() if tag in tags}
+
+    def stats(self):
+        return [self.tags[tag]["stats"] for tag in sorted(self.tags)]
+
+    def save(self):
+        makedirs(dirname(self.manifest_path), exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"tags": self.tags}, f, indent=2, sort_keys=True)
+        replace(tmp_path, self.manifest_path)
@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+
+from lib.intervals import format_networks, last_addresses, ordinals, parse_networks
+
+
+def _no_networks(ipv6=False):
+    if ipv6:
+        return np.empty((0, 2), dtype=np.uint64), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64)
+    return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64)
+
+
+class TaggedNetworks:
+    """
+    CIDRs of many tags held as arrays of network addresses, prefix lengths and
+    tag codes instead of strings. Both IP versions are sorted by tag and address,
+    so the CIDRs of every tag are a slice that can be formatted on its own and
+    no more than one tag ever has to be held as strings.
+    """
+
+    def __init__(self, tags: list[str], versions: dict):
+        self.tags = list(tags)
+        self.versions = versions
+        self._bounds = {
+            ipv6: np.searchsorted(tag_codes, np.arange(len(self.tags) + 1))
+            for ipv6, (_, _, tag_codes) in versions.items()
+        }
+
+    @classmethod
+    def from_arrays(cls, tags: list[str], versions: dict):
+        """
+        Sorts networks by tag and address, tags without networks are dropped
+
+        Args:
+            tags (list[str]): Tags the tag codes refer to
+            versions (dict): Network addresses, prefix lengths and tag codes of
+            the IPv4 networks under False and of the IPv6 networks under True
+
+        Returns:
+            TaggedNetworks: Sorted networks
+        """
+        used = np.unique(np.concatenate([tag_codes for _, _, tag_codes in versions.values()]))
+        kept_tags = sorted(tags[code] for code in used)
+        # Tags are renumbered in alphabetical order so that sorting by code sorts by tag
+        new_codes = np.full(len(tags), -1, dtype=np.int64)
+        new_codes[used] = [kept_tags.index(tags[code]) for code in used]
+
+        sorted_versions = {}
+        for ipv6, (start, prefix, tag_codes) in versions.items():
+            tag_codes = new_codes[tag_codes]
+            (start_keys,) = ordinals(start)
+            order = np.lexsort((prefix, start_keys, tag_codes))
+            sorted_versions[ipv6] = (start[order], prefix[order], tag_codes[order])
+        return cls(kept_tags, sorted_versions)
+
+    @classmethod
+    def from_frames(cls, frames):
+        """
+        Parses CIDR DataFrames one by one, e.g. the sections of every tag
+
+        Args:
+            frames (Iterable[pd.DataFrame]): CIDR DataFrames of both IP versions
+
+        Returns:
+            TaggedNetworks: Networks of all frames
+        """
+        tags = {}
+        parts = {False: [_no_networks()], True: [_no_networks(ipv6=True)]}
+        for df in frames:
+            if df.empty:
+                continue
+            networks = df["Network"].astype(str)
+            is_ipv6 = networks.str.contains(":", regex=False).to_numpy(dtype=bool)
+            frame_codes, frame_tags = pd.factorize(df["Tag"])
+            tag_codes = np.array(
+                [tags.setdefault(tag, len(tags)) for tag in frame_tags], dtype=np.int64
+            )[frame_codes]
+            for ipv6 in (False, True):
+                mask = is_ipv6 == ipv6
+                start, _, prefix = parse_networks(networks[mask], ipv6=ipv6)
+                parts[ipv6].append((start, prefix, tag_codes[mask]))
+
+        versions = {
+            ipv6: tuple(np.concatenate([part[i] for part in version_parts]) for i in range(3))
+            for ipv6, version_parts in parts.items()
+        }
+        return cls.from_arrays(list(tags), versions)
+
+    @classmethod
+    def load(cls, paths: dict[str, str]):
+        """
+        Loads networks saved one tag at a time by save
+
+        Args:
+            paths (dict[str, str]): Paths to the .npz files by tag
+
+        Returns:
+            TaggedNetworks: Networks of all tags
+        """
+        tags = list(paths)
+        parts = {False: [_no_networks()], True: [_no_networks(ipv6=True)]}
+        for code, tag in enumerate(tags):
+            with np.load(paths[tag]) as saved:
+                for ipv6 in (False, True):
+                    version = f"ipv{6 if ipv6 else 4}"
+                    prefix = saved[f"{version}_prefix"]
+                    tag_codes = np.full(len(prefix), code, dtype=np.int64)
+                    parts[ipv6].append((saved[f"{version}_start"], prefix, tag_codes))
+
+        versions = {
+            ipv6: tuple(np.concatenate([part[i] for part in version_parts]) for i in range(3))
+            for ipv6, version_parts in parts.items()
+        }
+        return cls.from_arrays(tags, versions)
+
+    def save(self, path: str, tag: str):
+        """
+        Saves the networks of a tag as plain arrays to an .npz file
+
+        Args:
+            path (str): Path to the .npz file
+            tag (str): Tag of the networks
+        """
+        arrays = {}
+        for ipv6 in (False, True):
+            start, prefix = self.slice(tag, ipv6=ipv6)
+            arrays[f"ipv{6 if ipv6 else 4}_start"] = start
+            arrays[f"ipv{6 if ipv6 else 4}_prefix"] = prefix
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def __len__(self):
+        return sum(len(prefix) for _, prefix, _ in self.versions.values())
+
+    def span(self, tag: str, ipv6=False):
+        """
+        Looks up the positions of the networks of a tag
+
+        Args:
+            tag (str): Tag of the networks
+            ipv6 (bool, optional): Whether to look up IPv6 or IPv4 networks. Defaults to False.
+
+        Returns:
+            slice: Positions of the networks in the arrays of their IP version
+        """
+        code = self.tags.index(tag)
+        return slice(self._bounds[ipv6][code], self._bounds[ipv6][code + 1])
+
+    def slice(self, tag: str, ipv6=False):
+        """
+        Looks up the networks of a tag
+
+        Args:
+            tag (str): Tag of the networks
+            ipv6 (bool, optional): Whether to look up IPv6 or IPv4 networks. Defaults to False.
+
+        Returns:
+            tuple: Network addresses and prefix lengths sorted by address
+        """
+        start, prefix, _ = self.versions[ipv6]
+        span = self.span(tag, ipv6=ipv6)
+        return start[span], prefix[span]
+
+    def intervals(self, tag: str, ipv6=False):
+        """
+        Looks up the networks of a tag as intervals
+
+        Args:
+            tag (str): Tag of the networks
+            ipv6 (bool, optional): Whether to look up IPv6 or IPv4 networks. Defaults to False.
+
+        Returns:
+            tuple: Start and end addresses sorted by address
+        """
+        start, prefix = self.slice(tag, ipv6=ipv6)
+        return start, last_addresses(start, prefix, ipv6=ipv6)
+
+    def networks(self, tag: str):
+        """
+        Formats the networks of a tag
+
+        Args:
+            tag (str): Tag of the networks
+
+        Returns:
+            list[str]: CIDRs of the tag, the IPv4 ones first and each sorted by address
+        """
+        return [
+            network
+            for ipv6 in (False, True)
+            for network in format_networks(*self.slice(tag, ipv6=ipv6), ipv6=ipv6)
+        ]
+
+    def frame(self, tag=None):
+        """
+        Formats the networks of a tag or of all tags as a CIDR DataFrame
+
+        Args:
+            tag (str, optional): Tag of the networks. Defaults to all tags.
+
+        Returns:
+            pd.DataFrame: CIDR DataFrame sorted by tag, with the IPv4 CIDRs of
+            every tag ahead of its IPv6 ones
+        """
+        networks, tags = [], []
+        for frame_tag in self.tags if tag is None else [tag]:
+            tag_networks = self.networks(frame_tag)
+            networks += tag_networks
+            tags += [frame_tag] * len(tag_networks)
+        return pd.DataFrame({"Network": pd.Series(networks, dtype=object), "Tag": pd.Series(tags, dtype=object)})
+
+    def prefix_histogram(self):
+        """
+        Counts the networks of every tag per IP version and prefix length
+
+        Returns:
+            pd.DataFrame: 'Tag', 'IPv6', 'Prefix' and 'Networks' columns like prefix_histogram
+        """
+        counts = []
+        for ipv6 in (False, True):
+            _, prefix, tag_codes = self.versions[ipv6]
+            # Prefix lengths fit a byte, so every tag and prefix pair is a single integer
+            pairs, networks = np.unique(tag_codes << 8 | prefix, return_counts=True)
+            counts.append(
+                pd.DataFrame(
+                    {
+                        "Tag": np.asarray(self.tags, dtype=object)[pairs >> 8],
+                        "IPv6": ipv6,
+                        "Prefix": pairs & 0xFF,
+                        "Networks": networks,
+                    }
+                )
+            )
+        return (
+            pd.concat(counts, ignore_index=True)
+            .sort_values(["Tag", "IPv6", "Prefix"], kind="stable")
+            .reset_index(drop=True)
+        )
@@ -0,0 +1,161 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from os import makedirs
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def _cpu_seconds():
+    # CPU time of this process and of the worker processes that have been reaped
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def _peak_rss_marks():
+    return _peak_rss_mb(), _peak_rss_mb(children=True)
+
+
+class StageTimer:
+    """
+    Records the wall time, CPU time, peak RSS growth and rows in and out of
+    every stage of a build, so that slow builds can be traced to a stage and
+    compared across releases. Stages that run several times, e.g. once per
+    tag, are accumulated. Optionally every stage is profiled with cProfile.
+
+    The peak RSS of a process only ever grows, so a stage is charged with how
+    far it raised the peak above the one at its start. Stages that stay below
+    an earlier peak report 0 even if they allocate a lot.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self._profilers = {}
+        self._started = time.perf_counter()
+
+    def add(
+        self,
+        name: str,
+        wall_seconds: float,
+        cpu_seconds: float,
+        rows_in=None,
+        rows_out=None,
+        peak_rss_before=None,
+    ):
+        """
+        Adds a measurement to a stage
+
+        Args:
+            name (str): Name of the stage
+            wall_seconds (float): Elapsed wall time
+            cpu_seconds (float): Elapsed CPU time
+            rows_in (int, optional): Rows the stage consumed. Defaults to None.
+            rows_out (int, optional): Rows the stage produced. Defaults to None.
+            peak_rss_before (tuple, optional): Peak RSS of this process and of its
+            workers in MB at the start of the stage, as _peak_rss_marks returns.
+            Defaults to None for stages measured elsewhere, e.g. in a worker.
+        """
+        entry = self.stages.setdefault(
+            name,
+            {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": None, "rows_out": None},
+        )
+        entry["calls"] += 1
+        entry["wall_seconds"] += wall_seconds
+        entry["cpu_seconds"] += cpu_seconds
+        for key, rows in (("rows_in", rows_in), ("rows_out", rows_out)):
+            if rows is not None:
+                entry[key] = (entry[key] or 0) + int(rows)
+        keys = ("peak_rss_growth_mb", "peak_worker_rss_growth_mb")
+        for key, before, after in zip(keys, peak_rss_before or (None, None), _peak_rss_marks()):
+            growth = entry.get(key)
+            if before is not None and after is not None:
+                growth = round((growth or 0.0) + after - before, 1)
+            entry[key] = growth
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        """
+        Measures the code run in the context as a stage, the yielded dict
+        takes the 'rows_in' and 'rows_out' of the stage
+
+        Args:
+            name (str): Name of the stage
+            rows_in (int, optional): Rows the stage consumes. Defaults to None.
+        """
+        rows = {"rows_in": rows_in, "rows_out": None}
+        profiler = None
+        if self.profile_dir:
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+        wall, cpu, peak_rss = time.perf_counter(), _cpu_seconds(), _peak_rss_marks()
+        if profiler:
+            profiler.enable()
+        try:
+            yield rows
+        finally:
+            if profiler:
+                profiler.disable()
+            self.add(
+                name,
+                time.perf_counter() - wall,
+                _cpu_seconds() - cpu,
+                rows_in=rows["rows_in"],
+                rows_out=rows["rows_out"],
+                peak_rss_before=peak_rss,
+            )
+
+    def save(self, report_path: str):
+        """
+        Writes the JSON report of all stages and the cProfile dumps if enabled
+
+        Args:
+            report_path (str): Path to write the report to
+        """
+        report = {
+            "python": sys.version.split()[0],
+            "argv": sys.argv[1:],
+            "wall_seconds": round(time.perf_counter() - self._started, 3),
+            "stages": [
+                {
+                    "name": name,
+                    **{
+                        key: round(value, 3) if isinstance(value, float) else value
+                        for key, value in entry.items()
+                    },
+                }
+                for name, entry in self.stages.items()
+            ],
+        }
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        if self.profile_dir:
+            makedirs(self.profile_dir, exist_ok=True)
+            for name, profiler in self._profilers.items():
+                file_name = re.sub(r"[^A-Za-z0-9]+", "_", name)
+                profiler.dump_stats(f"{self.profile_dir}/{file_name}.prof")
+
+    def print_summary(self):
+        print(f"{'Stage':<20} {'Wall':>9} {'CPU':>9} {'Rows out':>12}")
+        for name, entry in self.stages.items():
+            rows_out = "-" if entry["rows_out"] is None else "{:,}".format(entry["rows_out"])
+            print(
+                f"{name:<20} {entry['wall_seconds']:>8.2f}s {entry['cpu_seconds']:>8.2f}s {rows_out:>12}"
+            )
+        print()
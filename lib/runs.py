@@ -0,0 +1,65 @@
+import shutil
+from os import makedirs
+from os.path import exists
+
+import pandas as pd
+
+from lib.cidr_utils import CidrCollector
+
+
+class TagRuns(CidrCollector):
+    """
+    Spills CIDR rows to one run file per tag and IP version, so that the
+    aggregated dataset never has to be held in memory as a whole and can
+    be cleaned up one tag at a time.
+    """
+
+    def __init__(self, runs_dir: str):
+        super().__init__()
+        self.runs_dir = runs_dir
+        self._runs = set()
+        if exists(runs_dir):
+            shutil.rmtree(runs_dir)
+        makedirs(runs_dir)
+
+    def _run_path(self, tag: str, ipv6: bool):
+        return f"{self.runs_dir}/{tag}_ipv{6 if ipv6 else 4}.csv"
+
+    def _store(self, df: pd.DataFrame, ipv6=False):
+        for tag, tagged_df in df.groupby("Tag"):
+            tagged_df["Network"].to_csv(
+                self._run_path(tag, ipv6), mode="a", index=False, header=False
+            )
+            self._runs.add((tag, ipv6))
+
+    def tags(self):
+        return sorted({tag for tag, _ in self._runs})
+
+    def read(self, tag: str, ipv6=False):
+        """
+        Loads the run of a tag
+
+        Args:
+            tag (str): Tag of the run
+            ipv6 (bool, optional): Whether to load the IPv6 or IPv4 run. Defaults to False.
+
+        Returns:
+            pd.DataFrame: CIDR DataFrame of the run
+        """
+        if (tag, ipv6) not in self._runs:
+            return pd.DataFrame(columns=["Network", "Tag"])
+
+        run_df = pd.read_csv(
+            self._run_path(tag, ipv6), names=["Network"], dtype={"Network": str}
+        )
+        run_df["Tag"] = tag
+        return run_df
+
+    def aggregate(self, ipv6=False):
+        run_dfs = [self.read(tag, ipv6=ipv6) for tag in self.tags()]
+        if not run_dfs:
+            return pd.DataFrame(columns=["Network", "Tag"])
+        return pd.concat(run_dfs, ignore_index=True)
+
+    def cleanup(self):
+        shutil.rmtree(self.runs_dir, ignore_errors=True)
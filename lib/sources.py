@@ -0,0 +1,589 @@
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from graphlib import TopologicalSorter
+from itertools import count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pandas as pd
+
+from lib.adapters import convert_xls_to_df
+from lib.cache import read_cidr_part, write_cidr_part
+from lib.dbip import dbip_partitions, iter_dbip_partition
+from lib.geolite2 import (
+    GEOLITE2_ASN_CSV_FILES,
+    GEOLITE2_CSV_FILES,
+    iter_geolite2_cidrs,
+    load_asn_cidrs,
+)
+
+try:
+    import tomllib  # Python ^3.11
+except ModuleNotFoundError:
+    import tomli as tomllib
+
+# Options every type of source requires besides its name
+SOURCE_OPTIONS = {
+    "remote": ["tag"],
+    "dbip": ["tags", "path"],
+    "geolite2": ["countries", "path"],
+    "ito": ["tag", "path"],
+    "community": ["path"],
+    "asn": ["tag", "asns", "path"],
+}
+
+
+def _source_tags(source: dict):
+    if source["type"] == "geolite2":
+        return list(source["countries"].values())
+    if "tag" in source:
+        return [source["tag"]]
+    return list(source.get("tags", []))
+
+
+def read_registry(registry_path: str):
+    """
+    Parses the TOML registry once, the load_* functions below read their
+    tables from the result
+
+    Args:
+        registry_path (str): Path to the TOML registry
+
+    Returns:
+        dict: Tables of the registry
+    """
+    with open(registry_path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_source_registry(registry: dict):
+    """
+    Reads the registry of sources and checks every entry of it
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Raises:
+        ValueError: If a source has an unknown type, misses an option or its name is not unique
+
+    Returns:
+        list[dict]: Sources in registry order, each with its resolved 'tags'
+    """
+    sources = registry.get("sources", [])
+
+    names = set()
+    for source in sources:
+        name = source.get("name")
+        if not name or name in names:
+            raise ValueError(f"Source names must be given and unique, got '{name}'")
+        names.add(name)
+        if source.get("type") not in SOURCE_OPTIONS:
+            raise ValueError(f"Source '{name}' has an unknown type '{source.get('type')}'")
+        missing = [option for option in SOURCE_OPTIONS[source["type"]] if option not in source]
+        if source["type"] == "remote" and not ("ipv4_url" in source or "ipv6_url" in source):
+            missing.append("ipv4_url/ipv6_url")
+        if missing:
+            raise ValueError(f"Source '{name}' is missing {', '.join(missing)}")
+        source["tags"] = _source_tags(source)
+
+    # Community CIDRs are looked up for every tag unless told otherwise
+    all_tags = sorted({tag for source in sources for tag in source["tags"]})
+    for source in sources:
+        if source["type"] == "community" and not source["tags"]:
+            source["tags"] = all_tags
+
+    # Fail early on dependency cycles
+    TopologicalSorter(build_source_graph(sources)).prepare()
+    return sources
+
+
+def load_widen_prefixes(registry: dict):
+    """
+    Reads the prefix lengths that narrower CIDRs of each IP version are widened
+    to from the [widen.ipv4] and [widen.ipv6] tables of the registry. Each table
+    holds a 'default' and optional per-tag entries; IPv4 defaults to /24 and
+    IPv6 is not widened unless configured.
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Raises:
+        ValueError: If a prefix length is out of range for its IP version
+
+    Returns:
+        dict: 'ipv4' and 'ipv6' mappings of tags and 'default' to prefix lengths
+    """
+    widen = registry.get("widen", {})
+
+    prefixes = {"ipv4": {"default": 24}, "ipv6": {}}
+    for version, width in (("ipv4", 32), ("ipv6", 128)):
+        prefixes[version].update(widen.get(version, {}))
+        for tag, prefix in prefixes[version].items():
+            if not isinstance(prefix, int) or not 0 <= prefix <= width:
+                raise ValueError(f"Invalid {version} widening prefix for '{tag}': {prefix}")
+    return prefixes
+
+
+def load_asn_directory(registry: dict):
+    """
+    Reads the directory of the GeoLite2 ASN CSV files that the built CIDRs are
+    annotated from, given as the 'path' of the [asn] table of the registry
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Returns:
+        str: Path relative to the data directory, None if no annotation is wanted
+    """
+    return registry.get("asn", {}).get("path")
+
+
+def load_geosite_directory(registry: dict):
+    """
+    Reads the directory of the community geosite lists that are compiled into
+    the build directory, given as the 'path' of the [geosite] table of the registry
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Returns:
+        str: Path relative to the data directory, None if no lists are compiled
+    """
+    return registry.get("geosite", {}).get("path")
+
+
+def load_geoip_dat_names(registry: dict):
+    """
+    Reads the country codes that tags are written under in geoip.dat from
+    the 'names' table of the [geoip_dat] table of the registry
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Raises:
+        ValueError: If the names are not strings
+
+    Returns:
+        dict[str, str]: Country code by tag, tags not listed keep their own name
+    """
+    names = registry.get("geoip_dat", {}).get("names", {})
+
+    if not isinstance(names, dict) or not all(
+        isinstance(name, str) and name for name in names.values()
+    ):
+        raise ValueError(f"The geoip.dat names must map tags to country codes, got {names}")
+    return names
+
+
+def load_tag_priority(registry: dict):
+    """
+    Reads the priority of tags in overlapping address space from the 'priority'
+    list of the [conflicts] table of the registry
+
+    Args:
+        registry (dict): Parsed TOML registry, see read_registry
+
+    Raises:
+        ValueError: If the priority is not a list of unique tags
+
+    Returns:
+        list[str]: Tags from the highest to the lowest priority, None if overlaps
+        are only to be reported
+    """
+    priority = registry.get("conflicts", {}).get("priority")
+
+    if priority is not None and (
+        not isinstance(priority, list)
+        or not all(isinstance(tag, str) for tag in priority)
+        or len(set(priority)) != len(priority)
+    ):
+        raise ValueError(f"The conflict priority must be a list of unique tags, got {priority}")
+    return priority
+
+
+def remote_ip_lists(sources: list[dict]):
+    """
+    Lists the URLs of all remote sources in the form fetch_remote_ip_lists takes them
+
+    Args:
+        sources (list[dict]): Sources of the registry
+
+    Returns:
+        list[dict]: Remote lists with their 'source' name and whether they are 'ipv6'
+    """
+    lists = []
+    for source in sources:
+        if source["type"] != "remote":
+            continue
+        for version, ipv6 in (("ipv4", False), ("ipv6", True)):
+            if f"{version}_url" not in source:
+                continue
+            remote_list = {
+                "source": source["name"],
+                "url": source[f"{version}_url"],
+                "tag": source["tag"],
+                "ipv6": ipv6,
+            }
+            if "proxy" in source:
+                remote_list["proxies"] = {"http": source["proxy"], "https": source["proxy"]}
+            if "timeout" in source:
+                remote_list["timeout"] = source["timeout"]
+            lists.append(remote_list)
+    return lists
+
+
+def source_input_paths(source: dict, data_dir: str, tag: str):
+    """
+    Lists the files a source loads the CIDRs of a tag from
+
+    Args:
+        source (dict): Source of the registry
+        data_dir (str): Path to the data directory
+        tag (str): Tag to list the files of
+
+    Returns:
+        list[str]: Sorted paths of the existing input files
+    """
+    if source["type"] == "remote" or tag not in source["tags"]:
+        return []
+    if source["type"] == "geolite2":
+        paths = [f"{data_dir}/{source['path']}/{csv_file}" for csv_file in GEOLITE2_CSV_FILES]
+    elif source["type"] == "asn":
+        paths = [f"{data_dir}/{source['path']}/{csv_file}" for csv_file in GEOLITE2_ASN_CSV_FILES]
+    elif source["type"] == "community":
+        paths = glob.glob(f"{data_dir}/{source['path']}/ipv[46]_{tag}.csv")
+    else:
+        paths = glob.glob(f"{data_dir}/{source['path']}")
+    return sorted(path for path in paths if Path(path).is_file())
+
+
+def _concat_versions(results: list[tuple]):
+    if not results:
+        return pd.DataFrame(columns=["Network", "Tag"]), pd.DataFrame(columns=["Network", "Tag"])
+    return tuple(
+        pd.concat([result[version] for result in results], ignore_index=True)
+        for version in (0, 1)
+    )
+
+
+def _read_community_csvs(community_dir: str, tags: list[str]):
+    results = []
+    for tag in tags:
+        csv_files = [f"{community_dir}/ipv{version}_{tag}.csv" for version in (4, 6)]
+        results.append(
+            tuple(
+                pd.read_csv(csv_file)
+                if Path(csv_file).is_file()
+                else pd.DataFrame(columns=["Network", "Tag"])
+                for csv_file in csv_files
+            )
+        )
+    return _concat_versions(results)
+
+
+def _dbip_units(source: dict, data_dir: str, tags: list[str], chunksize, workers: int):
+    # All tags are extracted, so that builds of only some of them share the cache entry
+    tags = source["tags"]
+    return [
+        {
+            "paths": [csv_file],
+            "params": (tags,),
+            "tasks": [
+                (iter_dbip_partition, (csv_file, start, end, tags, chunksize))
+                for start, end in dbip_partitions(csv_file, workers)
+            ],
+        }
+        for csv_file in sorted(glob.glob(f"{data_dir}/{source['path']}"))
+    ]
+
+
+def _geolite2_units(source: dict, data_dir: str, tags: list[str], chunksize, workers: int):
+    geolite2_db_dir = f"{data_dir}/{source['path']}"
+    # All countries are extracted, so that builds of only some of them share the cache entry
+    countries = source["countries"]
+    return [
+        {
+            "paths": [f"{geolite2_db_dir}/{csv_file}" for csv_file in GEOLITE2_CSV_FILES],
+            "params": (countries,),
+            "tasks": [
+                (iter_geolite2_cidrs, (geolite2_db_dir, countries, chunksize, (version,)))
+                for version in (4, 6)
+            ],
+        }
+    ]
+
+
+def _asn_units(source: dict, data_dir: str, tags: list[str], chunksize, workers: int):
+    geolite2_db_dir = f"{data_dir}/{source['path']}"
+    asns = sorted(source["asns"])
+    return [
+        {
+            "paths": [f"{geolite2_db_dir}/{csv_file}" for csv_file in GEOLITE2_ASN_CSV_FILES],
+            "params": (asns, source["tag"]),
+            "tasks": [
+                (load_asn_cidrs, (geolite2_db_dir, asns, source["tag"], (version,)))
+                for version in (4, 6)
+            ],
+        }
+    ]
+
+
+def _ito_units(source: dict, data_dir: str, tags: list[str], chunksize, workers: int):
+    return [
+        {"paths": [xls_file], "params": (), "tasks": [(convert_xls_to_df, (xls_file,))]}
+        for xls_file in sorted(glob.glob(f"{data_dir}/{source['path']}"))
+    ]
+
+
+def _community_units(source: dict, data_dir: str, tags: list[str], chunksize, workers: int):
+    return [
+        {
+            "paths": None,
+            "params": (),
+            "tasks": [(_read_community_csvs, (f"{data_dir}/{source['path']}", tags))],
+        }
+    ]
+
+
+# Every source is loaded as units of work, a unit is cached as a whole and
+# consists of tasks that can run in parallel, e.g. the partitions of a file
+SOURCE_UNITS = {
+    "dbip": _dbip_units,
+    "geolite2": _geolite2_units,
+    "ito": _ito_units,
+    "community": _community_units,
+    "asn": _asn_units,
+}
+
+
+def source_units(source: dict, data_dir: str, tags: list[str], chunksize=None, workers=1):
+    """
+    Splits the loading of the given tags from a file-based source into units of work
+
+    Args:
+        source (dict): Source of the registry
+        data_dir (str): Path to the data directory
+        tags (list[str]): Tags to load, only the ones the source provides are loaded
+        chunksize (int, optional): Number of rows to read at once. Defaults to None.
+        workers (int, optional): Number of workers to split large files for. Defaults to 1.
+
+    Returns:
+        list[dict]: Units with the 'paths' and 'params' to cache them by, None paths
+        if they are not cached, and their 'tasks' as (function, arguments) tuples
+        each returning IPv4 and IPv6 CIDR DataFrames or yielding them in parts
+    """
+    tags = [tag for tag in source["tags"] if tag in tags]
+    if not tags:
+        return []
+    return SOURCE_UNITS[source["type"]](source, data_dir, tags, chunksize, workers)
+
+
+def _select_tags(dfs: tuple, tags: list[str]):
+    """Keeps the CIDRs of the given tags of the IPv4 and IPv6 DataFrames of a part"""
+    selected = []
+    for df in dfs:
+        is_selected = df["Tag"].isin(tags)
+        selected.append(df if is_selected.all() else df[is_selected].reset_index(drop=True))
+    return tuple(selected)
+
+
+def _run_task(function, args, spool_path: str):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = function(*args)
+    # Tasks either return the IPv4 and IPv6 DataFrames or yield them in parts. Every
+    # part is spooled to disk as plain arrays, so no process holds more than a part.
+    parts = [result] if isinstance(result, tuple) else result
+    paths, rows = [], 0
+    for i, (ipv4_df, ipv6_df) in enumerate(parts):
+        paths.append(f"{spool_path}.{i:06d}.npz")
+        write_cidr_part(paths[-1], ipv4_df, ipv6_df)
+        rows += len(ipv4_df) + len(ipv6_df)
+    return paths, rows, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def build_source_graph(sources: list[dict]):
+    """
+    Builds the dependency graph of the file-based sources from their 'after' option
+
+    Args:
+        sources (list[dict]): Sources of the registry
+
+    Raises:
+        ValueError: If a source is to be loaded after a source that does not exist
+
+    Returns:
+        dict[str, set[str]]: Names of the sources every source has to wait for
+    """
+    names = {source["name"] for source in sources}
+    graph = {}
+    for source in sources:
+        unknown = set(source.get("after", [])) - names
+        if unknown:
+            raise ValueError(f"Source '{source['name']}' is after unknown {', '.join(sorted(unknown))}")
+        graph[source["name"]] = set(source.get("after", []))
+    return graph
+
+
+def iter_sources(
+    sources: list[dict],
+    data_dir: str,
+    tags: list[str],
+    cache=None,
+    chunksize=None,
+    workers=None,
+    timer=None,
+    spool_dir=None,
+):
+    """
+    Loads the given tags from the file-based sources in a process pool and
+    yields their CIDRs part by part as the workers finish them. Every source
+    starts as soon as the sources it depends on are done, the tasks of
+    independent sources and the partitions of large files run in parallel.
+
+    With a chunksize, a part is a chunk of rows of a file, otherwise the result
+    of a whole task. Parts are passed through files in the spool directory and
+    cached one by one, so neither the workers nor the caller ever need to hold
+    a whole source. Sources of many tags are cached with all of them and the
+    other tags are dropped from the parts, so every build shares the entry.
+
+    Args:
+        sources (list[dict]): Sources to load
+        data_dir (str): Path to the data directory
+        tags (list[str]): Tags to load
+        cache (SourceCache, optional): Source cache. Defaults to None.
+        chunksize (int, optional): Number of rows to read at once. Defaults to None.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        timer (StageTimer, optional): Timer to record the time the workers spent
+        on every source in, as 'load <name>' stages. Defaults to None.
+        spool_dir (str, optional): Directory to create the temporary directory of
+        the parts in. Defaults to the system's temporary directory.
+
+    Raises:
+        RuntimeError: If sources are left that can never be loaded
+
+    Yields:
+        tuple: Name of a source and the IPv4 and IPv6 CIDR DataFrames of a part of
+        it, or None instead of the DataFrames once all parts of the source were yielded
+    """
+    workers = workers or os.cpu_count() or 1
+    sources_by_name = {source["name"]: source for source in sources}
+    # Dependencies on sources that are not loaded this time are already satisfied
+    sorter = TopologicalSorter(
+        {
+            name: set(source.get("after", [])) & sources_by_name.keys()
+            for name, source in sources_by_name.items()
+        }
+    )
+    sorter.prepare()
+
+    remaining_units = {}
+    units = {}
+    pending = {}
+    spool_ids = count()
+    with TemporaryDirectory(dir=spool_dir) as spool, ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        while sorter.is_active():
+            ready = sorter.get_ready()
+            # Units that need no worker, as they are cached or have nothing to read
+            finished_units = []
+            for name in ready:
+                source_unit_list = source_units(
+                    sources_by_name[name], data_dir, tags, chunksize, workers
+                )
+                remaining_units[name] = len(source_unit_list)
+                for i, unit in enumerate(source_unit_list):
+                    key = None
+                    if cache is not None and unit["paths"] is not None:
+                        key = cache.key(unit["paths"], *unit["params"])
+                        part_paths = cache.load(key)
+                        if part_paths is not None:
+                            print(f"-> Loaded {name} from cache")
+                            finished_units.append((name, part_paths))
+                            continue
+                    if not unit["tasks"]:
+                        # E.g. an empty file, the unit is done right away
+                        if key is not None:
+                            cache.store(key, [])
+                        finished_units.append((name, []))
+                        continue
+                    units[(name, i)] = {"key": key, "parts": [None] * len(unit["tasks"])}
+                    for j, (function, args) in enumerate(unit["tasks"]):
+                        spool_path = f"{spool}/{next(spool_ids)}"
+                        future = executor.submit(_run_task, function, args, spool_path)
+                        pending[future] = (name, i, j)
+
+            # The workers are busy by now, so the cached parts are read in the meantime
+            for name, part_paths in finished_units:
+                for path in part_paths:
+                    yield name, _select_tags(read_cidr_part(path), tags)
+                remaining_units[name] -= 1
+            for name in ready:
+                if remaining_units[name] == 0:
+                    sorter.done(name)
+                    yield name, None
+
+            if not pending:
+                if not ready:
+                    unfinished = [name for name in sources_by_name if name not in remaining_units]
+                    raise RuntimeError(f"Loading stalled before {', '.join(unfinished)}")
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, i, j = pending.pop(future)
+                part_paths, rows, wall_seconds, cpu_seconds = future.result()
+                if timer is not None:
+                    timer.add(f"load {name}", wall_seconds, cpu_seconds, rows_out=rows)
+                unit = units[(name, i)]
+                unit["parts"][j] = part_paths
+                for path in part_paths:
+                    yield name, _select_tags(read_cidr_part(path), tags)
+                    if unit["key"] is None:
+                        os.remove(path)
+                if any(parts is None for parts in unit["parts"]):
+                    continue
+
+                del units[(name, i)]
+                if unit["key"] is not None:
+                    cache.store(unit["key"], [path for parts in unit["parts"] for path in parts])
+                remaining_units[name] -= 1
+                if remaining_units[name] == 0:
+                    sorter.done(name)
+                    yield name, None
+
+
+def run_sources(
+    sources: list[dict],
+    data_dir: str,
+    tags: list[str],
+    cache=None,
+    chunksize=None,
+    workers=None,
+    timer=None,
+):
+    """
+    Loads the given tags from the file-based sources into memory, see iter_sources
+
+    Args:
+        sources (list[dict]): Sources to load
+        data_dir (str): Path to the data directory
+        tags (list[str]): Tags to load
+        cache (SourceCache, optional): Source cache. Defaults to None.
+        chunksize (int, optional): Number of rows to read at once. Defaults to None.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        timer (StageTimer, optional): Timer to record the time the workers spent
+        on every source in. Defaults to None.
+
+    Returns:
+        dict: IPv4 and IPv6 CIDR DataFrames by source name, in the order of the sources
+    """
+    results = {source["name"]: [] for source in sources}
+    for name, dfs in iter_sources(
+        sources, data_dir, tags, cache=cache, chunksize=chunksize, workers=workers, timer=timer
+    ):
+        if dfs is not None:
+            results[name].append(dfs)
+    return {name: _concat_versions(parts) for name, parts in results.items()}
@@ -0,0 +1,137 @@
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from lib.intervals import boundaries, merge_intervals, parse_networks
+
+
+def _segment_lengths(bounds: np.ndarray, ipv6=False):
+    """Number of addresses between consecutive boundaries, exact for IPv4 and approximate for IPv6"""
+    if not ipv6:
+        return np.diff(bounds)
+    hi, lo = bounds[:, 0], bounds[:, 1]
+    borrow = (lo[1:] < lo[:-1]).astype(np.uint64)
+    lengths = (hi[1:] - hi[:-1] - borrow).astype(np.float64) * 2.0**64 + (
+        lo[1:] - lo[:-1]
+    ).astype(np.float64)
+    # Boundaries are distinct, so only ::/0 wraps around to a length of 0
+    return np.where(lengths == 0, 2.0**128, lengths)
+
+
+def _total(lengths: np.ndarray, ipv6=False):
+    return float(lengths.sum()) if ipv6 else int(lengths.sum())
+
+
+def source_overlap(intervals: dict[str, tuple], ipv6=False):
+    """
+    Measures how many addresses every source covers, how many of them no
+    other source covers and how many addresses each pair of sources shares.
+    The boundaries of all sources split the address space into segments that
+    are either fully covered by a source or not at all, so everything follows
+    from the segment lengths and a coverage mask per source.
+
+    Args:
+        intervals (dict[str, tuple]): Start and end addresses of the disjoint,
+        sorted intervals of every source
+        ipv6 (bool, optional): Whether the intervals are IPv6 or IPv4. Defaults to False.
+
+    Returns:
+        dict: 'sources' with the 'addresses' and 'unique_addresses' of every
+        source and 'overlaps' with the shared addresses of every pair of sources
+    """
+    names = list(intervals)
+    bound_arrays, keys = boundaries(*intervals.values(), ipv6=ipv6)
+
+    all_keys = np.concatenate(keys)
+    segment_keys, first = np.unique(all_keys, return_index=True)
+    lengths = _segment_lengths(np.concatenate(bound_arrays)[first], ipv6=ipv6)
+    segment_starts = segment_keys[:-1]
+
+    covered = np.zeros((len(names), len(segment_starts)), dtype=bool)
+    for i in range(len(names)):
+        start_keys, next_keys = keys[2 * i], keys[2 * i + 1]
+        containing = np.searchsorted(start_keys, segment_starts, side="right") - 1
+        covered[i] = (containing >= 0) & (next_keys[np.maximum(containing, 0)] > segment_starts)
+    is_unique = covered.sum(axis=0) == 1
+
+    return {
+        "sources": {
+            name: {
+                "addresses": _total(lengths[covered[i]], ipv6),
+                "unique_addresses": _total(lengths[covered[i] & is_unique], ipv6),
+            }
+            for i, name in enumerate(names)
+        },
+        "overlaps": {
+            f"{names[i]} & {names[j]}": _total(lengths[covered[i] & covered[j]], ipv6)
+            for i, j in combinations(range(len(names)), 2)
+        },
+    }
+
+
+# Number of chunks of a source that SourceCoverage keeps before merging them
+COVERAGE_MERGE_PARTS = 32
+
+
+class SourceCoverage:
+    """
+    Keeps the union of the address ranges every source contributed to each
+    tag, so that a build can report the contribution of every source and the
+    overlap between sources next to its totals.
+    """
+
+    def __init__(self):
+        self._intervals = defaultdict(list)
+
+    def add(self, df: pd.DataFrame, source: str, ipv6=False):
+        """
+        Adds the CIDRs of a source
+
+        Args:
+            df (pd.DataFrame): CIDR DataFrame of a single IP version
+            source (str): Name of the source the CIDRs were loaded from
+            ipv6 (bool, optional): Whether the CIDRs are IPv6 or IPv4. Defaults to False.
+        """
+        if df.empty:
+            return
+        start, end, _ = parse_networks(df["Network"].astype(str), ipv6=ipv6)
+        tag_codes, tags = pd.factorize(df["Tag"])
+        start_indices, end_indices = merge_intervals(start, end, groups=tag_codes)
+        merged_tags = tag_codes[start_indices]
+        for code, tag in enumerate(tags):
+            in_tag = merged_tags == code
+            parts = self._intervals[(tag, ipv6, source)]
+            parts.append((start[start_indices[in_tag]], end[end_indices[in_tag]]))
+            # Sources added in many chunks are merged along the way to keep only their union
+            if len(parts) >= COVERAGE_MERGE_PARTS:
+                parts[:] = [self._union(parts)]
+
+    @staticmethod
+    def _union(parts: list[tuple]):
+        start = np.concatenate([part[0] for part in parts])
+        end = np.concatenate([part[1] for part in parts])
+        start_indices, end_indices = merge_intervals(start, end)
+        return start[start_indices], end[end_indices]
+
+    def report(self, tag: str):
+        """
+        Reports the contribution and the overlap of the sources of a tag
+
+        Args:
+            tag (str): Tag to report on
+
+        Returns:
+            dict: Result of source_overlap for every IP version the tag has CIDRs of
+        """
+        report = {}
+        for ipv6 in (False, True):
+            intervals = {}
+            for (interval_tag, interval_ipv6, source), parts in sorted(self._intervals.items()):
+                if interval_tag != tag or interval_ipv6 != ipv6:
+                    continue
+                intervals[source] = self._union(parts)
+            if intervals:
+                report[f"ipv{6 if ipv6 else 4}"] = source_overlap(intervals, ipv6=ipv6)
+        return report
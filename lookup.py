@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import argparse
+import sys
+from itertools import islice
+
+from lib.cidrdb import open_cidr_db
+from lib.lookup import CidrIndex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Reads IP addresses from stdin, one per line, and prints the tag each one belongs to"
+    )
+    parser.add_argument(
+        "--db",
+        default="build/agg_cidrs.csv",
+        help="aggregated CSV or binary database to look addresses up in (default: build/agg_cidrs.csv)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100_000,
+        help="number of lines to look up at once",
+    )
+    return parser.parse_args()
+
+
+def main(db_path: str, batch_size: int):
+    if db_path.endswith(".bin"):
+        index = open_cidr_db(db_path)
+    else:
+        index = CidrIndex.from_csv(db_path)
+    while batch := [line.strip() for line in islice(sys.stdin, batch_size)]:
+        tags = index.lookup_many(batch)
+        sys.stdout.write(
+            "".join(f"{address},{tag or ''}\n" for address, tag in zip(batch, tags))
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.db, args.batch_size)
@@ -1,189 +1,401 @@
 #!/usr/bin/env python
-import glob
+import argparse
+import hashlib
+import json
 from os import getcwd, makedirs
 from os.path import exists
-from pathlib import Path
 
 import pandas as pd
-from lib.adapters import convert_xls_to_df
+from lib.cache import SourceCache, code_version, file_digest
+from lib.cidrdb import write_cidr_db
 from lib.cidr_utils import (
-    calculate_ip_stats,
+    CidrCollector,
     cleanup_cidrs,
-    concat_df,
-    convert_iprange_to_cidr,
-    expand_cidr_range,
+    histogram_stats,
+    pretty_print_source_counts,
+    pretty_print_source_coverage,
     pretty_print_stats,
 )
-from lib.dbip import extract_dbip_ip_versions
-from lib.fetchers import fetch_remote_ip_list
-from lib.geolite2 import extract_geolite2_cidrs, get_geolite2_id
+from lib.conflicts import Overlaps, pretty_print_overlaps, resolve_networks
+from lib.exporters import (
+    check_compressions,
+    COMPRESSIONS,
+    export_networks,
+    read_sections,
+    write_asn_csv,
+    write_checksums,
+    write_geoip_dat,
+    write_geosite_lists,
+    write_overlap_report,
+    write_sections,
+)
+from lib.fetchers import fetch_remote_ip_lists
+from lib.geolite2 import annotate_asns, GEOLITE2_ASN_CSV_FILES
+from lib.geosite import compile_geosite_lists, pretty_print_geosite_report
+from lib.lookup import CidrIndex
+from lib.manifest import BuildManifest
+from lib.networks import TaggedNetworks
+from lib.profiling import StageTimer
+from lib.runs import TagRuns
+from lib.sources import (
+    load_asn_directory,
+    load_geoip_dat_names,
+    load_geosite_directory,
+    load_source_registry,
+    load_tag_priority,
+    load_widen_prefixes,
+    iter_sources,
+    read_registry,
+    remote_ip_lists,
+    source_input_paths,
+)
 
 # This product includes geolite2 Data created by MaxMind, available from https://www.maxmind.com/
 # Usage is subject to EULA available from https://www.maxmind.com/en/geolite2/eula
 
+STATS_REPORT_NOTES = (
+    "The IPv6 'addresses', 'unique_addresses' and 'overlaps' of the sources are "
+    "approximate floating-point counts, all IPv4 counts and 'total_ipv6s' are exact"
+)
 
-def main():
-    data_dir_path = f"{getcwd()}/data"
-    build_dir_path = f"{getcwd()}/build"
-    community_db_dir = f"{data_dir_path}/community"
-    geolite2_db_dir = f"{data_dir_path}/geolite2"
-    ito_db_dir = f"{data_dir_path}/ito"
-    dbip_db_dir = f"{data_dir_path}/dbip"
 
-    makedirs(build_dir_path, exist_ok=True)
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Aggregates GeoIP CIDRs from multiple sources into the build directory"
+    )
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help="merge overlapping and adjacent CIDRs of each tag into their minimal CIDR cover",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the source databases in chunks of this many rows and spill them to disk per tag",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always re-parse the source databases instead of using the cache in build/.cache",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only reprocess the tags whose inputs changed since the last build",
+    )
+    parser.add_argument(
+        "--sources",
+        default=None,
+        help="path to the TOML registry of sources, defaults to sources.toml in the working directory",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--compress",
+        nargs="+",
+        choices=list(COMPRESSIONS),
+        default=[],
+        help="also write compressed copies of the exported files, zstd needs the zstandard package",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="dump a cProfile of every stage of the build to build/profile",
+    )
+    return parser.parse_args()
 
-    aggregated_ipv4_df = pd.DataFrame(columns=["Network", "Tag"])
-    aggregated_ipv6_df = pd.DataFrame(columns=["Network", "Tag"])
-    geo_networks = [
-        {"name": "China", "tag": "CN"},
-        {"name": "Russia", "tag": "RU"},
-        {"name": "Iran", "tag": "IR"},
-    ]
 
-    # First off append the Cloudflare network IPs
-    cf_ipv4_df = fetch_remote_ip_list("https://www.cloudflare.com/ips-v4", "CF")
-    if not cf_ipv4_df.empty:
-        aggregated_ipv4_df = concat_df(aggregated_ipv4_df, cf_ipv4_df)
+def write_stats_report(build_dir_path: str, manifest):
+    """
+    Writes the stats of all tags, including their prefix length histograms and
+    the contribution and overlap of their sources, to build/stats.json. Keys are
+    sorted so that the report of an incremental build matches a full build.
+
+    Args:
+        build_dir_path (str): Path to the build directory
+        manifest (BuildManifest): Manifest holding the stats
+    """
+    report = {
+        "notes": STATS_REPORT_NOTES,
+        "tags": manifest.stats(),
+    }
+    with open(f"{build_dir_path}/stats.json", "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
 
-    cf_ipv6_df = fetch_remote_ip_list("https://www.cloudflare.com/ips-v6", "CF")
-    if not cf_ipv6_df.empty:
-        aggregated_ipv6_df = concat_df(aggregated_ipv6_df, cf_ipv6_df)
+def frame_digest(df: pd.DataFrame):
+    networks = df["Network"].astype(str) if "Network" in df else []
+    return hashlib.sha256("\n".join(networks).encode()).hexdigest()
 
-    # Append ArvanCloud network as IR
-    ac_ipv4_df = fetch_remote_ip_list(
-        "https://www.arvancloud.ir/fa/ips.txt", "IR", proxies=None
+
+def main(
+    aggregate=False,
+    chunksize=None,
+    no_cache=False,
+    incremental=False,
+    sources_path=None,
+    workers=None,
+    profile=False,
+    compressions=(),
+):
+    data_dir_path = f"{getcwd()}/data"
+    build_dir_path = f"{getcwd()}/build"
+    sources_path = sources_path or f"{getcwd()}/sources.toml"
+
+    check_compressions(compressions)
+    makedirs(build_dir_path, exist_ok=True)
+
+    cache = None if no_cache else SourceCache(f"{build_dir_path}/.cache")
+    manifest = BuildManifest(
+        f"{build_dir_path}/.cache/manifest.json", f"{build_dir_path}/.cache/sections"
     )
-    if not ac_ipv4_df.empty:
-        aggregated_ipv4_df = concat_df(aggregated_ipv4_df, ac_ipv4_df)
 
-    if exists(data_dir_path):
-        for tag in geo_networks:
-            print(f"\n\n*** Aggregating data for {tag['name']} ***")
-
-            # Load DBIP database
-            dbip_csvs = glob.glob(f"{dbip_db_dir}/*.csv")
-            for csv_file in dbip_csvs:
-                print("\nLoading DBIP database")
-                dbip_df = pd.read_csv(
-                    csv_file, names=["Range_Start", "Range_End", "Tag"]
-                )
-                dbip_ipv4, dbip_ipv6 = extract_dbip_ip_versions(
-                    dbip_df,
-                    tag=tag["tag"],
-                )
-                # Convert IP ranges to CIDR
-                dbip_ipv4 = convert_iprange_to_cidr(dbip_ipv4, ipv6=False)
-                dbip_ipv6 = convert_iprange_to_cidr(dbip_ipv6, ipv6=True)
+    timer = StageTimer(f"{build_dir_path}/profile" if profile else None)
 
-                print(f"IPv4 entries found: {len(dbip_ipv4)}")
-                print(f"IPv6 entries found: {len(dbip_ipv6)}")
+    # In streaming mode every source is spilled to per-tag runs on disk right away
+    collector = TagRuns(f"{build_dir_path}/.runs") if chunksize else CidrCollector()
 
-                # Add to aggregated DataFrame
-                aggregated_ipv4_df = concat_df(aggregated_ipv4_df, dbip_ipv4)
-                aggregated_ipv6_df = concat_df(aggregated_ipv6_df, dbip_ipv6)
+    registry = read_registry(sources_path)
+    sources = load_source_registry(registry)
+    widen_prefixes = load_widen_prefixes(registry)
+    asn_dir = load_asn_directory(registry)
+    geosite_dir = load_geosite_directory(registry)
+    geoip_dat_names = load_geoip_dat_names(registry)
+    priority = load_tag_priority(registry)
+    file_sources = [source for source in sources if source["type"] != "remote"]
 
-            # Load MaxMind geolite2 database
-            print("\nLoading MaxMind GeoLite2 database")
-            geolite2_countries_df = pd.read_csv(
-                f"{geolite2_db_dir}/GeoLite2-Country-Locations-en.csv"
-            )
-            geolite2_ipv4_df = pd.read_csv(
-                f"{geolite2_db_dir}/GeoLite2-Country-Blocks-IPv4.csv"
-            )
-            geolite2_ipv6_df = pd.read_csv(
-                f"{geolite2_db_dir}/GeoLite2-Country-Blocks-IPv6.csv"
-            )
-            geo_id = get_geolite2_id(
-                geolite2_countries_df,
-                country=tag["name"],
-            )
-            geolite2_ipv4_df_filtered = extract_geolite2_cidrs(
-                geolite2_ipv4_df, geo_id, tag["tag"]
-            )
-            geolite2_ipv6_df_filtered = extract_geolite2_cidrs(
-                geolite2_ipv6_df, geo_id, tag["tag"]
-            )
+    remote_sources = remote_ip_lists(sources)
+    print("\nFetching remote IP lists")
+    with timer.stage("fetch") as rows:
+        remote_dfs = fetch_remote_ip_lists(
+            remote_sources, cache_dir=f"{build_dir_path}/.cache/remote"
+        )
+        rows["rows_out"] = sum(len(df) for df in remote_dfs)
+    # Remote lists as (source, tag, CIDRs, whether they are IPv6)
+    remote_lists = [
+        (remote_source["source"], remote_source["tag"], remote_df, remote_source["ipv6"])
+        for remote_source, remote_df in zip(remote_sources, remote_dfs)
+    ]
 
-            print(f"IPv4 entries found: {len(geolite2_ipv4_df_filtered)}")
-            print(f"IPv6 entries found: {len(geolite2_ipv6_df_filtered)}")
+    if exists(data_dir_path):
+        asn_db_dir = f"{data_dir_path}/{asn_dir}" if asn_dir else None
+        asn_csv_paths = [
+            f"{asn_db_dir}/{csv_file}"
+            for csv_file in GEOLITE2_ASN_CSV_FILES
+            if asn_db_dir and exists(f"{asn_db_dir}/{csv_file}")
+        ]
 
-            # Add to aggregated DataFrame
-            aggregated_ipv4_df = concat_df(
-                aggregated_ipv4_df, geolite2_ipv4_df_filtered
-            )
-            aggregated_ipv6_df = concat_df(
-                aggregated_ipv6_df, geolite2_ipv6_df_filtered
+        # Fingerprint the inputs of every tag to find out which ones have to be rebuilt,
+        # the ASN files annotate every tag
+        build_version = ":".join(
+            [
+                code_version(),
+                file_digest(__file__),
+                file_digest(sources_path),
+                str(aggregate),
+                ",".join(sorted(compressions)),
+                *[file_digest(path) for path in asn_csv_paths],
+            ]
+        )
+        fingerprints = {}
+        for tag in sorted({tag for source in sources for tag in source["tags"]}):
+            input_paths = [
+                path
+                for source in file_sources
+                for path in source_input_paths(source, data_dir_path, tag)
+            ]
+            fingerprints[tag] = manifest.fingerprint(
+                build_version,
+                *[frame_digest(df) for _, list_tag, df, _ in remote_lists if list_tag == tag],
+                *[file_digest(path) for path in sorted(input_paths)],
             )
 
-            # Load community-contributed CIDRs if available
-            print("\nLoading community-contributed CIDR database")
-            if Path(f"{community_db_dir}/ipv4_{tag['tag']}.csv").is_file():
-                manual_ipv4_df = pd.read_csv(
-                    f"{community_db_dir}/ipv4_{tag['tag']}.csv"
-                )
-                print(f"IPv4 entries found: {len(manual_ipv4_df)}")
-                aggregated_ipv4_df = concat_df(aggregated_ipv4_df, manual_ipv4_df)
+        stale_tags = [
+            tag
+            for tag, fingerprint in fingerprints.items()
+            if not (incremental and manifest.is_fresh(tag, fingerprint))
+        ]
+        fresh_tags = sorted(set(fingerprints) - set(stale_tags))
+        if incremental:
+            print(f"\n-> Reusing unchanged tags: {', '.join(fresh_tags) or '-'}")
+        # Without a priority no tag changes the CIDRs of another, so the exported
+        # files and sections of the unchanged tags are kept as they are
+        section_suffixes = ["csv", "dat"] + (["asn.csv"] if asn_csv_paths else [])
+        reused_tags = [
+            tag
+            for tag in fresh_tags
+            if not priority
+            and manifest.has_sections(tag, section_suffixes)
+            and exists(f"{build_dir_path}/geoip_{tag.lower()}.txt")
+        ]
 
-            if Path(f"{community_db_dir}/ipv6_{tag['tag']}.csv").is_file():
-                manual_ipv6_df = pd.read_csv(
-                    f"{community_db_dir}/ipv6_{tag['tag']}.csv"
-                )
-                print(f"IPv6 entries found: {len(manual_ipv6_df)}")
-                aggregated_ipv6_df = concat_df(aggregated_ipv6_df, manual_ipv6_df)
-
-            # Load ito database
-            if tag["tag"] == "IR":
-                dbip_csvs = glob.glob(f"{ito_db_dir}/*.xls")
-                for csv_file in dbip_csvs:
-                    print(f"\nLoading ITO database {csv_file}")
-                    ito_ipv4_df, ito_ipv6_df = convert_xls_to_df(csv_file)
-
-                    print(f"IPv4 entries found: {len(ito_ipv4_df)}")
-                    aggregated_ipv4_df = pd.concat(
-                        [aggregated_ipv4_df, ito_ipv4_df], ignore_index=True
-                    )
-                    print(f"IPv6 entries found: {len(ito_ipv6_df)}")
-                    aggregated_ipv6_df = pd.concat(
-                        [aggregated_ipv6_df, ito_ipv6_df], ignore_index=True
-                    )
+        with timer.stage("collect") as rows:
+            for source, tag, remote_df, ipv6 in remote_lists:
+                if tag in stale_tags:
+                    collector.add(remote_df, source, ipv6=ipv6)
+
+        # Load the file-based sources providing stale tags in a process pool
+        stale_sources = [
+            source
+            for source in file_sources
+            if set(source["tags"]) & set(stale_tags)
+        ]
+        if stale_sources:
+            print(f"\n\n*** Aggregating data for {', '.join(stale_tags)} ***")
+            print(f"\nLoading {', '.join(source['name'] for source in stale_sources)}")
+        # Every part is collected as soon as it is loaded, so that in streaming mode
+        # only a chunk of every source is held in memory at a time
+        with timer.stage("load") as rows:
+            rows["rows_out"] = 0
+            for name, dfs in iter_sources(
+                stale_sources,
+                data_dir_path,
+                stale_tags,
+                cache=cache,
+                chunksize=chunksize,
+                workers=workers,
+                timer=timer,
+                spool_dir=build_dir_path,
+            ):
+                if dfs is None:
+                    print(f"\nLoaded {name}")
+                    collector.print_source_counts(name)
+                    continue
+                ipv4_df, ipv6_df = dfs
+                collector.add(ipv4_df, name)
+                collector.add(ipv6_df, name, ipv6=True)
+                rows["rows_out"] += len(ipv4_df) + len(ipv6_df)
 
         # Remove duplicates
         print("\n====================================")
         print("||     Cleaning up duplicates     ||")
         print("====================================")
-        print("\n-> Dropping duplicates")
-        aggregated_ipv4_df = aggregated_ipv4_df.drop_duplicates()
-        aggregated_ipv6_df = aggregated_ipv6_df.drop_duplicates()
-        aggregated_ipv4_df = expand_cidr_range(aggregated_ipv4_df)
-        aggregated_ipv4_df = cleanup_cidrs(aggregated_ipv4_df)
-        aggregated_ipv6_df = cleanup_cidrs(aggregated_ipv6_df)
-
-        # Merge IPv4 and IPv6 into one DataFrame for easier processing
-        aggregated_df = pd.concat(
-            [aggregated_ipv4_df, aggregated_ipv6_df], ignore_index=True
+        cleaned_tags = set()
+        if chunksize:
+            # Clean up one tag at a time to keep memory bounded
+            cleaned_dfs = (
+                (tag, [collector.read(tag), collector.read(tag, ipv6=True)])
+                for tag in collector.tags()
+            )
+        else:
+            cleaned_dfs = [(None, [collector.aggregate(), collector.aggregate(ipv6=True)])]
+        for tag, tagged_dfs in cleaned_dfs:
+            print(f"\n-> Dropping duplicates{f' of {tag}' if tag else ''}")
+            # Merge IPv4 and IPv6 into one DataFrame for easier processing
+            tagged_df = pd.concat([df.drop_duplicates() for df in tagged_dfs], ignore_index=True)
+            with timer.stage("cleanup", rows_in=len(tagged_df)) as rows:
+                tagged_df = cleanup_cidrs(
+                    tagged_df,
+                    aggregate=aggregate,
+                    workers=workers,
+                    widen_prefixes=widen_prefixes,
+                )
+                rows["rows_out"] = len(tagged_df)
+            with timer.stage("export", rows_in=len(tagged_df)):
+                write_sections(TaggedNetworks.from_frames([tagged_df]), manifest)
+            cleaned_tags.update(tagged_df["Tag"].unique())
+        if chunksize:
+            collector.cleanup()
+        manifest.retain(
+            [tag for tag in fingerprints if tag in cleaned_tags or tag not in stale_tags]
         )
 
-        # Export to specific files to build binary .dat files for clients
-        for tag in aggregated_df["Tag"].unique().tolist():
-            aggregated_df[aggregated_df["Tag"] == tag]["Network"].to_csv(
-                f"{build_dir_path}/geoip_{tag.lower()}.txt",
-                index=False,
-                header=False,
+        # Resolve overlaps between the cleaned CIDRs of all tags, the reused ones included.
+        # Only the overlaps that changed since the last build are formatted.
+        checksums = {}
+        overlaps_path = f"{build_dir_path}/.cache/overlaps.npz"
+        with timer.stage("conflicts") as rows:
+            cleaned = read_sections(manifest, set(manifest.tags) | cleaned_tags)
+            rows["rows_in"] = len(cleaned)
+            resolved, overlaps = resolve_networks(cleaned, priority)
+            del cleaned
+            previous_overlaps = (
+                Overlaps.load(overlaps_path) if fresh_tags and exists(overlaps_path) else None
+            )
+            checksums.update(write_overlap_report(build_dir_path, overlaps, previous_overlaps))
+            overlaps.save(overlaps_path)
+            rows["rows_out"] = len(resolved)
+
+        with timer.stage("stats", rows_in=len(resolved)):
+            for stats in histogram_stats(resolved.prefix_histogram(), resolved.tags):
+                tag = stats["tag"]
+                if tag in stale_tags:
+                    stats["sources"] = collector.coverage.report(tag)
+                else:
+                    stats["sources"] = manifest.tags[tag]["stats"].get("sources", {})
+                manifest.update(tag, fingerprints[tag], stats)
+            manifest.save()
+            write_stats_report(build_dir_path, manifest)
+
+        # Save the files of every tag, the merged CSV, its memory-mappable binary counterpart
+        # and geoip-custom.dat for v2ray/xray, the sections of the reused tags are copied
+        with timer.stage("export", rows_in=len(resolved)):
+            checksums.update(
+                export_networks(build_dir_path, resolved, compressions, manifest, reused_tags)
+            )
+            write_cidr_db(CidrIndex.from_tagged(resolved), f"{build_dir_path}/agg_cidrs.bin")
+            checksums["agg_cidrs.bin"] = file_digest(f"{build_dir_path}/agg_cidrs.bin")
+            checksums.update(
+                write_geoip_dat(
+                    build_dir_path, resolved, geoip_dat_names, compressions, manifest, reused_tags
+                )
             )
 
+        # Annotate the merged CIDRs with the autonomous systems they belong to
+        if asn_csv_paths:
+            print("\n-> Annotating CIDRs with their ASNs")
+            with timer.stage("asn", rows_in=len(resolved)) as rows:
+                annotated_dfs = annotate_asns(resolved, asn_db_dir, reused_tags)
+                checksums.update(
+                    write_asn_csv(build_dir_path, annotated_dfs, compressions, manifest)
+                )
+                rows["rows_out"] = len(resolved)
+
+        # Compile the community geosite lists without their redundant rules
+        geosite_report = None
+        geosite_dir_path = f"{data_dir_path}/{geosite_dir}" if geosite_dir else None
+        if geosite_dir_path and exists(geosite_dir_path):
+            with timer.stage("geosite") as rows:
+                compiled, *geosite_report = compile_geosite_lists(geosite_dir_path)
+                checksums.update(write_geosite_lists(build_dir_path, compiled, compressions))
+                rows["rows_out"] = sum(len(rules) for rules in compiled.values())
+
+        with timer.stage("export"):
+            write_checksums(build_dir_path, checksums)
+
         print("\n====================================")
         print("||           Results              ||")
         print("====================================")
-        stats = calculate_ip_stats(aggregated_df)
-        pretty_print_stats(stats)
-
-        # Save merged CSV
-        print(f"\nSaving CSV to {build_dir_path}/agg_cidrs.csv")
-        aggregated_df.to_csv(f"{build_dir_path}/agg_cidrs.csv", index=False)
+        pretty_print_source_counts(collector.source_counts)
+        pretty_print_source_coverage(manifest.stats())
+        pretty_print_overlaps(overlaps)
+        if geosite_report:
+            pretty_print_geosite_report(*geosite_report)
+        pretty_print_stats(manifest.stats())
+        timer.print_summary()
+        timer.save(f"{build_dir_path}/profile.json")
+        if cache and not incremental:
+            cache.prune()
+        print(f"\nSaved CSV to {build_dir_path}/agg_cidrs.csv")
     else:
         print(f"Database directory '{data_dir_path}' was not found!")
         exit(0)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(
+        aggregate=args.aggregate,
+        chunksize=args.chunksize,
+        no_cache=args.no_cache,
+        incremental=args.incremental,
+        sources_path=args.sources,
+        workers=args.workers,
+        profile=args.profile,
+        compressions=args.compress,
+    )
@@ -0,0 +1,5 @@
+import sys
+from os.path import dirname
+
+# The tests import lib and main from the repository root like main.py does
+sys.path.insert(0, dirname(dirname(__file__)))
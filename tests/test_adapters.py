@@ -0,0 +1,45 @@
+import pytest
+
+from lib.adapters import convert_xls_to_df
+
+# ito exports are HTML tables saved as .xls, the messengers' DB names its column IPv4
+WEBSITES_XLS = """<html><head><meta charset="utf-8"></head><body><table>
+<tr><th>ردیف</th><th>IP</th><th>نام</th></tr>
+<tr><td>1</td><td>5.160.0.0/16</td><td>سامانه ۱</td></tr>
+<tr><td>2</td><td> 2a01:5ec0::/29 </td><td>سامانه ۲</td></tr>
+<tr><td>3</td><td></td><td>بدون آدرس</td></tr>
+<tr><td>4</td><td>185.143.232.0/22</td></tr>
+<tr><td>5</td><td>2a03:ef42::/32</td><td>سامانه ۵</td></tr>
+<tr><td>6</td><td>نامعتبر</td><td>سامانه ۶</td></tr>
+</table></body></html>
+"""
+MESSENGERS_XLS = """<html><body><table>
+<tr><td>نام</td><td>IPv4</td></tr>
+<tr><td>پیام‌رسان</td><td>94.182.0.0/16</td></tr>
+</table></body></html>
+"""
+
+
+def _write(tmp_path, content):
+    xls_path = tmp_path / "export.xls"
+    xls_path.write_text(content, encoding="utf-8")
+    return str(xls_path)
+
+
+def test_networks_are_split_by_ip_version(tmp_path):
+    ipv4, ipv6 = convert_xls_to_df(_write(tmp_path, WEBSITES_XLS))
+
+    assert ipv4.values.tolist() == [["5.160.0.0/16", "IR"], ["185.143.232.0/22", "IR"]]
+    assert ipv6.values.tolist() == [["2a01:5ec0::/29", "IR"], ["2a03:ef42::/32", "IR"]]
+
+
+def test_the_ipv4_column_of_the_messengers_db_is_read(tmp_path):
+    ipv4, ipv6 = convert_xls_to_df(_write(tmp_path, MESSENGERS_XLS))
+
+    assert ipv4.values.tolist() == [["94.182.0.0/16", "IR"]]
+    assert ipv6.empty
+
+
+def test_sheets_without_an_ip_column_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="No IP/IPv4 column"):
+        convert_xls_to_df(_write(tmp_path, "<table><tr><th>نام</th></tr></table>"))
@@ -0,0 +1,15 @@
+import hashlib
+
+from lib.cache import file_digest
+
+
+def test_file_digests_are_remembered_until_the_file_changes(tmp_path):
+    path = tmp_path / "dbip.csv"
+    path.write_text("1.0.0.0,1.0.0.255,IR\n")
+    first = file_digest(str(path))
+
+    assert file_digest(str(path)) == first == hashlib.sha256(path.read_bytes()).hexdigest()
+
+    path.write_text("1.0.0.0,1.0.0.255,IR\n2.0.0.0,2.0.0.255,CN\n")
+
+    assert file_digest(str(path)) == hashlib.sha256(path.read_bytes()).hexdigest() != first
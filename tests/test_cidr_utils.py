@@ -0,0 +1,192 @@
+import ipaddress
+import random
+
+import pandas as pd
+import pytest
+
+from benchmarks import baseline
+from lib import cidr_utils
+from lib.cidr_utils import cleanup_cidrs, convert_iprange_to_cidr, expand_cidr_range
+
+
+def _ranges(ipv6, count=500, seed=0):
+    rng = random.Random(seed)
+    bits = 128 if ipv6 else 32
+    address_type = ipaddress.IPv6Address if ipv6 else ipaddress.IPv4Address
+    # The whole space, its first and last address and IPv4-mapped IPv6 addresses
+    ranges = [(0, (1 << bits) - 1), (0, 0), ((1 << bits) - 1, (1 << bits) - 1)]
+    if ipv6:
+        ranges.append((0xFFFF_0000_0000, 0xFFFF_FFFF_FFFF))
+        ranges.append((0xFFFF_0A01_0203, 0xFFFF_0A01_02FF))
+    for _ in range(count):
+        # Ranges of every order of magnitude, most of them not aligned to a CIDR
+        start = rng.randrange(1 << bits)
+        end = min(start + rng.randrange(1 << rng.randrange(1, bits)), (1 << bits) - 1)
+        ranges.append((start, end))
+    return pd.DataFrame(
+        {
+            "Range_Start": [str(address_type(start)) for start, _ in ranges],
+            "Range_End": [str(address_type(end)) for _, end in ranges],
+            "Tag": [rng.choice(["IR", "CN", "RU"]) for _ in ranges],
+        }
+    )
+
+
+@pytest.mark.parametrize("ipv6", [False, True])
+def test_ranges_convert_like_the_old_converter(ipv6):
+    df = _ranges(ipv6)
+
+    pd.testing.assert_frame_equal(
+        convert_iprange_to_cidr(df, ipv6=ipv6),
+        baseline.convert_iprange_to_cidr(df, ipv6=ipv6),
+    )
+
+
+def _networks(count=400, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        network_type = rng.choice([ipaddress.IPv4Network, ipaddress.IPv6Network])
+        bits = 128 if network_type is ipaddress.IPv6Network else 32
+        # A few parent networks in a small corner of the space, so that most CIDRs meet
+        parent = network_type((rng.randrange(4) << (bits - 8), 8))
+        network = next(parent.subnets(new_prefix=rng.randrange(8, min(bits, 40) + 1)))
+        network = network_type(
+            (int(network.network_address) + rng.randrange(256) * network.num_addresses,
+             network.prefixlen)
+        )
+        tag = rng.choice(["IR", "CN"])
+        rows.append((network, tag))
+        if rng.random() < 0.2:
+            # The same network in another tag
+            rows.append((network, "RU"))
+        if rng.random() < 0.2 and network.prefixlen < bits:
+            # Nested networks, the two halves of the network
+            low, high = network.subnets()
+            rows += [(low, tag), (high, tag)]
+        if rng.random() < 0.3 and network.prefixlen > 8:
+            # An adjacent network, which aggregates with it into their supernet
+            supernet = network.supernet()
+            sibling = next(subnet for subnet in supernet.subnets() if subnet != network)
+            rows.append((sibling, tag))
+    # The whole space and its first and last addresses
+    rows += [
+        (ipaddress.ip_network("0.0.0.0/0"), "RU"),
+        (ipaddress.ip_network("255.255.255.255/32"), "RU"),
+        (ipaddress.ip_network("::/128"), "CN"),
+        (ipaddress.ip_network("ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128"), "CN"),
+    ]
+    rng.shuffle(rows)
+    return rows
+
+
+def _expected_networks(networks, aggregate):
+    if aggregate:
+        return list(ipaddress.collapse_addresses(networks))
+    # Duplicates and networks inside another network are dropped
+    unique = set(networks)
+    return sorted(
+        network
+        for network in unique
+        if not any(other != network and network.subnet_of(other) for other in unique)
+    )
+
+
+@pytest.mark.parametrize("aggregate", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cleanup_keeps_the_networks_that_are_not_covered(monkeypatch, aggregate, workers):
+    # Small inputs are only split among workers below this threshold
+    monkeypatch.setattr(cidr_utils, "PARALLEL_CLEANUP_MIN_ROWS", 16)
+    rows = _networks()
+    df = pd.DataFrame(
+        {"Network": [str(network) for network, _ in rows], "Tag": [tag for _, tag in rows]}
+    )
+
+    cleaned = cleanup_cidrs(df, aggregate=aggregate, workers=workers)
+
+    assert cleaned["Tag"].tolist() == sorted(cleaned["Tag"])
+    for tag in ("CN", "IR", "RU"):
+        expected = [
+            str(network)
+            for version in (4, 6)
+            for network in _expected_networks(
+                [network for network, row_tag in rows if row_tag == tag and network.version == version],
+                aggregate,
+            )
+        ]
+        assert cleaned.loc[cleaned["Tag"] == tag, "Network"].tolist() == expected
+
+
+def test_narrow_networks_are_widened_to_the_same_prefix_for_all_tags():
+    df = pd.DataFrame(
+        {
+            "Network": [
+                "10.0.0.1/32",
+                "10.0.0.128/25",
+                "10.0.1.0/24",
+                "10.0.0.0/16",
+                "8.8.8.8/32",
+            ],
+            "Tag": ["IR", "IR", "IR", "IR", "CN"],
+        }
+    )
+
+    expanded = expand_cidr_range(df, widen_to=24)
+
+    # The /16 starts at the same address as the widened /24 and replaces it
+    assert expanded.values.tolist() == [
+        ["8.8.8.0/24", "CN"],
+        ["10.0.0.0/16", "IR"],
+        ["10.0.1.0/24", "IR"],
+    ]
+
+
+def test_narrow_networks_are_widened_to_the_prefix_of_their_tag():
+    df = pd.DataFrame(
+        {
+            "Network": ["10.0.3.1/32", "10.0.3.0/24", "8.8.8.8/32", "1.1.1.1/32"],
+            "Tag": ["IR", "IR", "CN", "RU"],
+        }
+    )
+
+    expanded = expand_cidr_range(df, widen_to={"default": 24, "IR": 22, "RU": 32})
+
+    assert expanded.values.tolist() == [
+        ["8.8.8.0/24", "CN"],
+        ["10.0.0.0/22", "IR"],
+        ["1.1.1.1/32", "RU"],
+    ]
+
+
+def test_ipv6_networks_are_widened_to_their_own_prefix():
+    df = pd.DataFrame(
+        {
+            "Network": ["2001:db8:1:2::1/128", "2001:db8:1::/48", "2a01::1/128"],
+            "Tag": ["IR", "IR", "CN"],
+        }
+    )
+
+    expanded = expand_cidr_range(df, widen_to={"default": 48, "CN": 32}, ipv6=True)
+
+    assert expanded.values.tolist() == [["2a01::/32", "CN"], ["2001:db8:1::/48", "IR"]]
+
+
+def test_cleanup_widens_each_ip_version_to_its_own_prefixes():
+    df = pd.DataFrame(
+        {
+            "Network": ["10.0.0.1/32", "10.0.5.1/32", "2001:db8::1/128", "2001:db8::/32"],
+            "Tag": ["IR", "CN", "IR", "CN"],
+        }
+    )
+
+    # IPv6 has no default, so only the IPv6 networks of IR are widened
+    cleaned = cleanup_cidrs(
+        df, workers=1, widen_prefixes={"ipv4": {"default": 24, "IR": 16}, "ipv6": {"IR": 64}}
+    )
+
+    assert cleaned.values.tolist() == [
+        ["10.0.5.0/24", "CN"],
+        ["2001:db8::/32", "CN"],
+        ["10.0.0.0/16", "IR"],
+        ["2001:db8::/64", "IR"],
+    ]
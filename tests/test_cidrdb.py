@@ -0,0 +1,65 @@
+import ipaddress
+import random
+
+import numpy as np
+
+from lib.cidrdb import open_cidr_db, write_cidr_db
+from lib.lookup import CidrIndex
+
+CSV = """Network,Tag
+10.0.0.0/8,IR
+10.1.0.0/16,CN
+10.1.2.0/24,IR
+192.168.0.0/24,CF
+255.255.255.255/32,CN
+2001:db8::/32,IR
+2001:db8:1::/48,CF
+ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128,CN
+"""
+
+
+def _longest_prefix_match(networks, address):
+    address = ipaddress.ip_address(address)
+    matches = [(network.prefixlen, tag) for network, tag in networks if address in network]
+    return max(matches)[1] if matches else None
+
+
+def _addresses(networks, seed=0):
+    rng = random.Random(seed)
+    addresses = ["0.0.0.0", "9.255.255.255", "11.0.0.0", "::", "::ffff:10.1.2.3"]
+    for network, _ in networks:
+        # Both ends of every network, the addresses right outside of it and some inside
+        first, last = int(network.network_address), int(network.broadcast_address)
+        candidates = [first - 1, first, last, last + 1] + [rng.randint(first, last) for _ in range(8)]
+        address_type = ipaddress.IPv6Address if network.version == 6 else ipaddress.IPv4Address
+        addresses += [
+            str(address_type(candidate))
+            for candidate in candidates
+            if 0 <= candidate < 1 << network.max_prefixlen
+        ]
+    return addresses
+
+
+def test_binary_database_round_trips_the_csv(tmp_path):
+    csv_path, db_path = tmp_path / "agg_cidrs.csv", tmp_path / "agg_cidrs.bin"
+    csv_path.write_text(CSV)
+    csv_index = CidrIndex.from_csv(str(csv_path))
+
+    write_cidr_db(csv_index, str(db_path))
+    db_index = open_cidr_db(str(db_path))
+
+    assert db_index.tag_names == csv_index.tag_names
+    for ipv6 in (False, True):
+        for field in ("starts", "ends", "tags"):
+            assert np.array_equal(
+                getattr(db_index.indexes[ipv6], field), getattr(csv_index.indexes[ipv6], field)
+            )
+
+    networks = [
+        (ipaddress.ip_network(line.split(",")[0]), line.split(",")[1])
+        for line in CSV.splitlines()[1:]
+    ]
+    addresses = _addresses(networks)
+    expected = [_longest_prefix_match(networks, address) for address in addresses]
+    assert csv_index.lookup_many(addresses).tolist() == expected
+    assert db_index.lookup_many(addresses).tolist() == expected
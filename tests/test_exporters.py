@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+
+import pandas as pd
+import pytest
+
+from lib.exporters import (
+    CHECKSUMS_FILE,
+    COMPRESSIONS,
+    export_networks,
+    write_checksums,
+    write_geoip_dat,
+)
+from lib.networks import TaggedNetworks
+
+NETWORKS = pd.DataFrame(
+    [
+        ("10.0.0.0/8", "IR"),
+        ("192.168.0.0/24", "IR"),
+        ("2001:db8::/32", "IR"),
+        ("1.1.1.0/24", "CN"),
+        ("ffff::/16", "CN"),
+    ],
+    columns=["Network", "Tag"],
+)
+
+
+def _decompress(compression, data):
+    if compression == "gzip":
+        return gzip.decompress(data)
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def _read_checksums(build_dir):
+    lines = (build_dir / CHECKSUMS_FILE).read_text().splitlines()
+    return {name: checksum for checksum, name in (line.split("  ", 1) for line in lines)}
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSIONS))
+def test_compressed_copies_and_checksums_match_the_files(tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    networks = TaggedNetworks.from_frames([NETWORKS])
+
+    checksums = export_networks(str(tmp_path), networks, [compression])
+    checksums.update(write_geoip_dat(str(tmp_path), networks, compressions=[compression]))
+    write_checksums(str(tmp_path), checksums)
+
+    plain_names = ["agg_cidrs.csv", "geoip_cn.txt", "geoip_ir.txt", "geoip-custom.dat"]
+    suffix = COMPRESSIONS[compression]
+    assert sorted(checksums) == sorted(plain_names + [name + suffix for name in plain_names])
+    assert (tmp_path / "geoip_ir.txt").read_text() == "10.0.0.0/8\n192.168.0.0/24\n2001:db8::/32\n"
+    for name in plain_names:
+        compressed = (tmp_path / f"{name}{suffix}").read_bytes()
+        assert _decompress(compression, compressed) == (tmp_path / name).read_bytes()
+
+    sums = _read_checksums(tmp_path)
+    assert sums == checksums
+    for name, checksum in sums.items():
+        assert hashlib.sha256((tmp_path / name).read_bytes()).hexdigest() == checksum
+
+
+def test_gzip_copies_are_reproducible(tmp_path):
+    networks = TaggedNetworks.from_frames([NETWORKS])
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+
+    assert export_networks(str(first), networks, ["gzip"]) == export_networks(
+        str(second), networks, ["gzip"]
+    )
+
+
+def test_checksums_of_files_not_rewritten_are_kept(tmp_path):
+    for name in ("kept.txt", "rewritten.txt", "removed.txt"):
+        (tmp_path / name).write_text(name)
+    write_checksums(str(tmp_path), {"kept.txt": "a", "rewritten.txt": "b", "removed.txt": "c"})
+    (tmp_path / "removed.txt").unlink()
+
+    write_checksums(str(tmp_path), {"rewritten.txt": "d"})
+
+    assert _read_checksums(tmp_path) == {"kept.txt": "a", "rewritten.txt": "d"}
@@ -0,0 +1,84 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lib.cidr_utils import CidrCollector
+from lib.fetchers import (
+    RemoteListCache,
+    create_session,
+    fetch_remote_ip_list,
+    fetch_remote_ip_lists,
+)
+from main import frame_digest
+
+# Path -> (status, body, ETag) served by the stand-in server
+ROUTES = {
+    "/ir.txt": (200, b"1.2.3.0/24\n5.6.0.0/16\n", '"v1"'),
+    "/empty.txt": (200, b"\n", None),
+    "/missing.txt": (404, b"", None),
+}
+
+
+class ListHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body, etag = ROUTES[self.path]
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ListHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetches_list(server):
+    df = fetch_remote_ip_list(f"{server}/ir.txt", "IR", session=create_session(retries=0))
+    assert df.to_dict("list") == {"Network": ["1.2.3.0/24", "5.6.0.0/16"], "Tag": ["IR", "IR"]}
+
+
+@pytest.mark.parametrize("path", ["/empty.txt", "/missing.txt"])
+def test_empty_and_failed_lists_keep_columns(server, path):
+    df = fetch_remote_ip_list(f"{server}{path}", "IR", session=create_session(retries=0))
+    assert df.empty
+    assert list(df.columns) == ["Network", "Tag"]
+
+    # Both are fingerprinted and collected like any other list
+    assert frame_digest(df) == frame_digest(df.iloc[0:0])
+    collector = CidrCollector()
+    collector.add(df, "remote")
+    assert collector.aggregate().empty
+
+
+def test_failed_fetch_falls_back_to_last_good_copy(server, tmp_path, monkeypatch):
+    lists = [{"url": f"{server}/ir.txt", "tag": "IR"}]
+    (fetched,) = fetch_remote_ip_lists(lists, cache_dir=str(tmp_path))
+
+    # Unchanged lists are revalidated with their ETag and read from the cache
+    (revalidated,) = fetch_remote_ip_lists(lists, cache_dir=str(tmp_path))
+    assert revalidated.equals(fetched)
+
+    monkeypatch.setitem(ROUTES, "/ir.txt", (503, b"", None))
+    df = fetch_remote_ip_list(
+        f"{server}/ir.txt",
+        "IR",
+        session=create_session(retries=0),
+        cache=RemoteListCache(str(tmp_path)),
+    )
+    assert df.equals(fetched)
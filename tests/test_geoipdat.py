@@ -0,0 +1,19 @@
+from pathlib import Path
+
+import pandas as pd
+
+from lib.exporters import GEOIP_DAT_FILE, write_geoip_dat
+from lib.networks import TaggedNetworks
+
+FIXTURES = Path(__file__).parent / "fixtures" / "geoip"
+NAMES = {"CF": "cloudflare", "ANY": "zz"}
+
+
+def test_geoip_dat_matches_protoc_encoding(tmp_path):
+    # geoip.dat was encoded by protoc from geoip.txtpb, see the header of that file
+    networks = TaggedNetworks.from_frames([pd.read_csv(FIXTURES / "networks.csv", dtype=str)])
+
+    checksums = write_geoip_dat(str(tmp_path), networks, NAMES)
+
+    assert (tmp_path / GEOIP_DAT_FILE).read_bytes() == (FIXTURES / "geoip.dat").read_bytes()
+    assert list(checksums) == [GEOIP_DAT_FILE]
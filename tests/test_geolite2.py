@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+from lib.geolite2 import GEOLITE2_ASN_DTYPES, join_asn_blocks
+
+
+def _blocks(rows):
+    blocks = pd.DataFrame(rows, columns=list(GEOLITE2_ASN_DTYPES))
+    return blocks.astype({"autonomous_system_number": "Int64"})
+
+
+def _asns(joined):
+    return [
+        None if pd.isna(asn) else (int(asn), organization)
+        for asn, organization in zip(joined["ASN"], joined["Organization"])
+    ]
+
+
+@pytest.mark.parametrize(
+    "ipv6, blocks, networks, expected",
+    [
+        (
+            False,
+            # Blocks in any order, with a gap between them
+            [
+                ("10.1.128.0/24", 58224, "TCI"),
+                ("10.0.0.0/16", 12880, "DCI"),
+                ("10.2.0.0/16", None, None),
+            ],
+            [
+                # Inside a block, equal to a block and at its last address
+                "10.0.3.0/24",
+                "10.0.0.0/16",
+                "10.0.255.255/32",
+                # Wider than the block holding its network address
+                "10.0.0.0/8",
+                # Its network address is in a gap, though a block lies inside it
+                "10.1.0.0/16",
+                "10.1.128.128/25",
+                # Right before and after a block
+                "9.255.255.255/32",
+                "10.1.129.0/24",
+                # A block without an ASN
+                "10.2.1.0/24",
+            ],
+            [
+                (12880, "DCI"),
+                (12880, "DCI"),
+                (12880, "DCI"),
+                (12880, "DCI"),
+                None,
+                (58224, "TCI"),
+                None,
+                None,
+                None,
+            ],
+        ),
+        (
+            True,
+            [
+                ("2001:db8::/32", 12880, "DCI"),
+                ("2a01:5ec0::/29", 58224, "TCI"),
+                ("ffff:ffff:ffff:ffff::/64", 64512, "Top"),
+            ],
+            [
+                "2001:db8:1::/48",
+                "2001::/16",
+                "2a01:5ec8::/32",
+                "2a01:5ec7:ffff::/48",
+                "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128",
+                "::/128",
+            ],
+            [
+                (12880, "DCI"),
+                None,
+                None,
+                (58224, "TCI"),
+                (64512, "Top"),
+                None,
+            ],
+        ),
+    ],
+)
+def test_networks_get_the_asn_of_the_block_holding_their_address(ipv6, blocks, networks, expected):
+    joined = join_asn_blocks(pd.Series(networks), _blocks(blocks), ipv6=ipv6)
+
+    assert str(joined["ASN"].dtype) == "Int64"
+    assert _asns(joined) == expected
+
+
+def test_networks_without_blocks_have_missing_asns():
+    joined = join_asn_blocks(pd.Series(["10.0.0.0/24", "10.0.1.0/24"]), _blocks([]))
+
+    assert _asns(joined) == [None, None]
+    assert list(joined.columns) == ["ASN", "Organization"]
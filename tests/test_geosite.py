@@ -0,0 +1,42 @@
+from lib.geosite import deduplicate_rules, parse_geosite_line
+
+
+def _dropped(lines):
+    _, dropped = deduplicate_rules([parse_geosite_line(line) for line in lines])
+    return {rule[1]: reason for rule, reason in dropped}
+
+
+def test_rules_covered_with_the_same_attributes_are_dropped():
+    assert _dropped(
+        [
+            "example.ir",
+            "a.example.ir",
+            "example.com @ads",
+            "full:www.example.com @ads",
+            "keyword:tracker",
+            "tracker.net",
+            "regexp:^cdn\\.",
+            "full:cdn.example.org",
+        ]
+    ) == {
+        "a.example.ir": "domain:example.ir",
+        "www.example.com": "domain:example.com",
+        "tracker.net": "keyword:tracker",
+        "cdn.example.org": "regexp:^cdn\\.",
+    }
+
+
+def test_rules_with_other_attributes_are_kept():
+    # 'include:name @ads' needs a.example.ir and 'include:name @-cn' needs b.example.com
+    assert _dropped(
+        [
+            "example.ir",
+            "a.example.ir @ads",
+            "example.com @ads @cn",
+            "b.example.com @ads",
+            "keyword:tracker @ads",
+            "tracker.net",
+            "regexp:^cdn\\.",
+            "full:cdn.example.org @ads",
+        ]
+    ) == {}
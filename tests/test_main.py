@@ -0,0 +1,73 @@
+import shutil
+
+import pytest
+
+import main as pipeline
+from benchmarks.fixtures import write_dataset
+
+# Timings differ between builds
+UNCOMPARED_FILES = {"profile.json"}
+
+
+def _build(monkeypatch, root, **kwargs):
+    monkeypatch.chdir(root)
+    pipeline.main(workers=1, **kwargs)
+    build_dir = root / "build"
+    return {
+        path.name: path.read_bytes()
+        for path in build_dir.iterdir()
+        if path.is_file() and path.name not in UNCOMPARED_FILES
+    }
+
+
+def _edit_community_file(root):
+    with open(root / "data" / "community" / "ipv4_IR.csv", "a") as f:
+        f.write("10.250.0.0/16,IR\n")
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    root = tmp_path_factory.mktemp("dataset")
+    write_dataset(str(root), 500, seed=1)
+    return root
+
+
+@pytest.fixture(scope="module")
+def expected(dataset, tmp_path_factory):
+    # A plain full build of the edited dataset
+    root = tmp_path_factory.mktemp("expected")
+    shutil.copytree(dataset, root, dirs_exist_ok=True)
+    _edit_community_file(root)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        return _build(monkeypatch, root, no_cache=True)
+
+
+@pytest.mark.parametrize("chunksize", [None, 100])
+def test_incremental_build_matches_a_full_build(
+    monkeypatch, capsys, tmp_path, dataset, expected, chunksize
+):
+    shutil.copytree(dataset, tmp_path, dirs_exist_ok=True)
+    _build(monkeypatch, tmp_path, chunksize=chunksize)
+    _edit_community_file(tmp_path)
+    capsys.readouterr()
+
+    outputs = _build(monkeypatch, tmp_path, chunksize=chunksize, incremental=True)
+
+    assert "Reusing unchanged tags: CN, RU" in capsys.readouterr().out
+    assert outputs.keys() == expected.keys()
+    assert [name for name in outputs if outputs[name] != expected[name]] == []
+
+
+def test_build_from_the_cache_matches_a_full_build(
+    monkeypatch, capsys, tmp_path, dataset, expected
+):
+    shutil.copytree(dataset, tmp_path, dirs_exist_ok=True)
+    _edit_community_file(tmp_path)
+    _build(monkeypatch, tmp_path)
+    capsys.readouterr()
+
+    outputs = _build(monkeypatch, tmp_path)
+
+    assert "Loaded DBIP from cache" in capsys.readouterr().out
+    assert outputs.keys() == expected.keys()
+    assert [name for name in outputs if outputs[name] != expected[name]] == []
@@ -0,0 +1,68 @@
+import pandas as pd
+
+from lib.conflicts import resolve_networks
+from lib.lookup import CidrIndex
+from lib.networks import TaggedNetworks
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["Network", "Tag"])
+
+
+def test_frames_are_sorted_by_tag_and_address():
+    networks = TaggedNetworks.from_frames(
+        [
+            _frame([("10.0.1.0/24", "IR"), ("2001:db8::/32", "IR"), ("10.0.0.0/24", "IR")]),
+            _frame([]),
+            _frame([("1.1.1.0/24", "CN")]),
+        ]
+    )
+
+    assert networks.tags == ["CN", "IR"]
+    assert len(networks) == 4
+    assert networks.networks("IR") == ["10.0.0.0/24", "10.0.1.0/24", "2001:db8::/32"]
+    assert networks.frame().values.tolist() == [
+        ["1.1.1.0/24", "CN"],
+        ["10.0.0.0/24", "IR"],
+        ["10.0.1.0/24", "IR"],
+        ["2001:db8::/32", "IR"],
+    ]
+    assert networks.prefix_histogram().values.tolist() == [
+        ["CN", False, 24, 1],
+        ["IR", False, 24, 2],
+        ["IR", True, 32, 1],
+    ]
+
+
+def test_resolved_networks_drop_tags_left_empty():
+    networks = TaggedNetworks.from_frames(
+        [_frame([("10.0.0.0/24", "CN"), ("10.0.0.0/16", "IR"), ("2001:db8::/32", "IR")])]
+    )
+
+    resolved, overlaps = resolve_networks(networks, priority=["IR"])
+
+    assert resolved.tags == ["IR"]
+    assert resolved.networks("IR") == ["10.0.0.0/16", "2001:db8::/32"]
+    assert overlaps.frame().values.tolist() == [["10.0.0.0/24", "CN & IR", "IR"]]
+    assert CidrIndex.from_tagged(resolved).lookup_many(["10.0.0.1", "10.1.0.1"]).tolist() == [
+        "IR",
+        None,
+    ]
+
+
+def test_overlaps_at_the_top_of_the_ipv6_space_are_resolved():
+    top = "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128"
+    networks = TaggedNetworks.from_frames([_frame([("ffff::/16", "CN"), ("ffff:ffff::/32", "IR")])])
+
+    resolved, overlaps = resolve_networks(networks, priority=["IR"])
+
+    assert overlaps.frame().values.tolist() == [["ffff:ffff::/32", "CN & IR", "IR"]]
+    assert resolved.networks("CN")[-1] == "ffff:fffe::/32"
+    assert resolved.networks("IR") == ["ffff:ffff::/32"]
+
+    resolved, overlaps = resolve_networks(
+        TaggedNetworks.from_frames([_frame([(top, "CN"), (top, "IR")])]), priority=["IR"]
+    )
+
+    assert overlaps.frame().values.tolist() == [[top, "CN & IR", "IR"]]
+    assert resolved.frame().values.tolist() == [[top, "IR"]]
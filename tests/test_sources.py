@@ -0,0 +1,71 @@
+from os.path import dirname
+
+import pytest
+
+from lib.cache import SourceCache
+from lib.sources import load_widen_prefixes, read_registry, run_sources
+
+DBIP_ROWS = "1.0.0.0,1.0.0.255,IR\n2.0.0.0,2.0.0.255,CN\n"
+
+
+def dbip_source(name, path, after=()):
+    return {"name": name, "type": "dbip", "tags": ["IR", "CN"], "path": path, "after": list(after)}
+
+
+def test_empty_file_does_not_stall_dependent_sources(tmp_path):
+    (tmp_path / "empty").mkdir()
+    (tmp_path / "empty" / "dbip.csv").write_text("")
+    (tmp_path / "full").mkdir()
+    (tmp_path / "full" / "dbip.csv").write_text(DBIP_ROWS)
+
+    loaded = run_sources(
+        [
+            dbip_source("Empty", "empty/*.csv"),
+            dbip_source("Full", "full/*.csv", after=["Empty"]),
+        ],
+        str(tmp_path),
+        ["IR", "CN"],
+        workers=1,
+    )
+
+    assert all(df.empty for df in loaded["Empty"])
+    assert sorted(loaded["Full"][0]["Network"]) == ["1.0.0.0/24", "2.0.0.0/24"]
+
+
+def test_cache_entries_are_shared_by_builds_of_fewer_tags(tmp_path, capsys):
+    (tmp_path / "dbip").mkdir()
+    (tmp_path / "dbip" / "dbip.csv").write_text(DBIP_ROWS)
+    cache = SourceCache(str(tmp_path / "cache"))
+    source = dbip_source("DBIP", "dbip/*.csv")
+
+    run_sources([source], str(tmp_path), ["IR", "CN"], cache=cache, workers=1)
+    capsys.readouterr()
+    loaded = run_sources([source], str(tmp_path), ["IR"], cache=cache, workers=1)
+
+    assert "Loaded DBIP from cache" in capsys.readouterr().out
+    assert loaded["DBIP"][0].values.tolist() == [["1.0.0.0/24", "IR"]]
+
+
+def test_widen_prefixes_default_to_ipv4_24_and_no_ipv6_widening():
+    assert load_widen_prefixes({}) == {"ipv4": {"default": 24}, "ipv6": {}}
+    # The shipped registry keeps the defaults
+    registry = read_registry(f"{dirname(dirname(__file__))}/sources.toml")
+    assert load_widen_prefixes(registry) == {"ipv4": {"default": 24}, "ipv6": {}}
+
+
+def test_widen_prefixes_are_read_per_tag_and_ip_version(tmp_path):
+    registry_path = tmp_path / "sources.toml"
+    registry_path.write_text("[widen.ipv4]\nIR = 22\n\n[widen.ipv6]\ndefault = 48\nCN = 32\n")
+
+    assert load_widen_prefixes(read_registry(str(registry_path))) == {
+        "ipv4": {"default": 24, "IR": 22},
+        "ipv6": {"default": 48, "CN": 32},
+    }
+
+
+@pytest.mark.parametrize(
+    "widen", [{"ipv4": {"IR": 33}}, {"ipv6": {"default": -1}}, {"ipv4": {"CN": "24"}}]
+)
+def test_out_of_range_widen_prefixes_are_rejected(widen):
+    with pytest.raises(ValueError, match="Invalid ipv"):
+        load_widen_prefixes({"widen": widen})
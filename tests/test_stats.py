@@ -0,0 +1,22 @@
+import pandas as pd
+
+from lib.intervals import parse_networks
+from lib.stats import source_overlap
+
+
+def _intervals(networks, ipv6=True):
+    start, end, _ = parse_networks(pd.Series(networks), ipv6=ipv6)
+    return start, end
+
+
+def test_overlap_reaches_the_top_of_the_ipv6_space():
+    top = "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128"
+
+    report = source_overlap(
+        {"DBIP": _intervals(["ffff::/16"]), "ITO": _intervals(["ffff:ffff::/32"]), "CF": _intervals([top])},
+        ipv6=True,
+    )
+
+    assert report["overlaps"] == {"DBIP & ITO": 2.0**96, "DBIP & CF": 1.0, "ITO & CF": 1.0}
+    assert report["sources"]["DBIP"] == {"addresses": 2.0**112, "unique_addresses": 2.0**112 - 2.0**96}
+    assert source_overlap({"All": _intervals(["::/0"])}, ipv6=True)["sources"]["All"]["addresses"] == 2.0**128